@@ -0,0 +1,151 @@
+"""
+Relatórios de estoque de todo o catálogo: valor em estoque, giro, dias de cobertura e produtos
+abaixo do ponto de reposição.
+
+Os dados de todos os produtos são lidos em uma única consulta (produtos, saldo materializado e
+entradas e saídas do período, agregadas no banco) e carregados em colunas (pandas/NumPy); as
+métricas são calculadas de forma vetorizada, sem uma consulta por produto. O relatório calculado
+fica em memória, indexado pelo período e pelas versões dos dados (tabela data_versions), de modo que
+paginar ou exportar não refaz a consulta enquanto não houver alterações.
+
+Métricas, sobre as movimentações dos últimos `period_days` dias (a partir da meia-noite):
+    stock_value     current_stock * price
+    turnover        saídas no período / estoque médio, com estoque médio = (saldo inicial + saldo atual) / 2
+    days_of_cover   current_stock / (saídas no período / period_days); vazio quando não há saídas
+"""
+import io
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import case, func, select
+
+from crud import get_data_versions, get_stock_totals
+from models import ProductModel, StockBalanceModel, StockMovementModel, StockMovementItemModel
+
+COLUMNS = ["product_id", "sku", "name", "price", "current_stock", "entries", "exits"]
+REPORT_CACHE_SIZE = 4
+
+_reports = OrderedDict()
+_reports_lock = threading.Lock()
+
+
+def load_inventory(db, period_days: int):
+    # Uma linha por produto, ordenada por product_id, com as colunas de COLUMNS
+    since = datetime.combine(date.today() - timedelta(days=period_days), time.min)
+    items = StockMovementItemModel.__table__
+    movements = StockMovementModel.__table__
+    period_totals = select(
+        items.c.product_id,
+        func.sum(case((movements.c.type == 'entrada', items.c.quantity), else_=0)).label("entries"),
+        func.sum(case((movements.c.type == 'saída', items.c.quantity), else_=0)).label("exits"),
+    ).select_from(items.join(movements)).where(movements.c.movement_date >= since).group_by(items.c.product_id).subquery()
+
+    products = ProductModel.__table__
+    balances = StockBalanceModel.__table__
+    query = select(
+        products.c.id, products.c.sku, products.c.name, products.c.price,
+        balances.c.quantity, period_totals.c.entries, period_totals.c.exits,
+    ).select_from(
+        products.outerjoin(balances, balances.c.product_id == products.c.id)
+        .outerjoin(period_totals, period_totals.c.product_id == products.c.id)
+    ).order_by(products.c.id)
+    frame = pd.DataFrame.from_records(db.execute(query).all(), columns=COLUMNS)
+
+    # Produtos anteriores à tabela de saldos: saldo pelo histórico, em uma única consulta
+    missing = frame["current_stock"].isna()
+    if missing.any():
+        totals = get_stock_totals(db, frame.loc[missing, "product_id"].tolist())
+        frame.loc[missing, "current_stock"] = [
+            entries - exits for entries, exits in (totals.get(product_id, (0, 0)) for product_id in frame.loc[missing, "product_id"])
+        ]
+
+    frame["current_stock"] = frame["current_stock"].astype("int64")
+    frame["entries"] = frame["entries"].fillna(0).astype("int64")
+    frame["exits"] = frame["exits"].fillna(0).astype("int64")
+    frame["price"] = frame["price"].astype("float64")
+    return frame
+
+
+def compute_metrics(frame, period_days: int):
+    # Acrescenta stock_value, turnover e days_of_cover ao frame de load_inventory
+    stock = frame["current_stock"].to_numpy(dtype="float64")
+    entries = frame["entries"].to_numpy(dtype="float64")
+    exits = frame["exits"].to_numpy(dtype="float64")
+
+    opening = stock - (entries - exits)
+    average = (opening + stock) / 2
+    daily_exits = exits / period_days
+    with np.errstate(divide="ignore", invalid="ignore"):
+        turnover = np.where(average > 0, exits / average, np.nan)
+        days_of_cover = np.where(daily_exits > 0, np.maximum(stock, 0) / daily_exits, np.nan)
+
+    frame["stock_value"] = stock * frame["price"].to_numpy(dtype="float64")
+    frame["turnover"] = turnover
+    frame["days_of_cover"] = days_of_cover
+    return frame
+
+
+def inventory_report(db, period_days: int):
+    """
+    Relatório completo (um DataFrame por produto, ordenado por product_id), reaproveitado enquanto
+    as versões dos dados e a data não mudarem. O DataFrame retornado é compartilhado: não o altere.
+    """
+    key = (period_days, date.today(), tuple(get_data_versions(db, ("products", "stock_movements"))))
+    with _reports_lock:
+        if key in _reports:
+            _reports.move_to_end(key)
+            return _reports[key]
+
+    report = compute_metrics(load_inventory(db, period_days), period_days)
+    with _reports_lock:
+        _reports[key] = report
+        while len(_reports) > REPORT_CACHE_SIZE:
+            _reports.popitem(last=False)
+    return report
+
+
+def low_stock(report, threshold: int, cover_days: float = None):
+    # Produtos com saldo abaixo de `threshold` ou, se informado, com menos de `cover_days` dias de cobertura
+    mask = report["current_stock"].to_numpy() < threshold
+    if cover_days is not None:
+        mask |= report["days_of_cover"].to_numpy() < cover_days
+    return report[mask]
+
+
+def summarize(report, period_days: int):
+    stock = report["current_stock"].to_numpy(dtype="float64")
+    net = (report["entries"] - report["exits"]).to_numpy(dtype="float64")
+    average = ((stock - net) + stock).sum() / 2
+    exits = int(report["exits"].sum())
+    return {
+        "period_days": period_days,
+        "products": len(report),
+        "total_stock": int(stock.sum()),
+        "total_value": float(report["stock_value"].sum()),
+        "entries": int(report["entries"].sum()),
+        "exits": exits,
+        "turnover": exits / average if average > 0 else None,
+    }
+
+
+def page(report, cursor: int = None, limit: int = 100):
+    # Linhas depois do product_id `cursor` (paginação por chave, como nas demais listagens), como dicionários
+    start = 0 if cursor is None else int(np.searchsorted(report["product_id"].to_numpy(), cursor, side="right"))
+    return records(report.iloc[start:start + limit])
+
+
+def records(report):
+    # Valores nativos do Python, com None no lugar de NaN
+    return report.astype(object).where(report.notna(), None).to_dict("records")
+
+
+def export(report, file_format: str):
+    # Conteúdo do arquivo exportado (CSV ou Parquet); o Parquet requer o pacote pyarrow
+    if file_format == "parquet":
+        buffer = io.BytesIO()
+        report.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    return report.to_csv(index=False).encode("utf-8")
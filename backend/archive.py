@@ -0,0 +1,57 @@
+"""
+Arquivos Parquet das movimentações arquivadas (storage "parquet" de crud.archive_stock_movements).
+
+Cada execução grava um arquivo por mês, stock_movements_AAAA_MM_<instante da gravação>.parquet, com
+uma linha por item (as mesmas colunas da tabela stock_movement_archive), comprimido com zstd. As
+consultas históricas anteriores ao limite do arquivamento leem apenas os arquivos dos meses
+necessários, e deles só as colunas e os produtos pedidos. Requer o pacote pyarrow.
+"""
+import os
+from datetime import datetime
+
+import pandas as pd
+
+COLUMNS = [
+    "movement_id", "line", "movement_date", "type", "product_id", "quantity",
+    "reverses_movement_id", "replaces_movement_id", "recorded_at",
+]
+# Colunas inteiras que podem ser nulas (movimentações sem itens e sem referências do livro)
+NULLABLE_INTEGERS = {"product_id": "Int64", "quantity": "Int64", "reverses_movement_id": "Int64", "replaces_movement_id": "Int64"}
+COMPRESSION = "zstd"
+
+
+def write_movements(rows, directory: str, month: datetime):
+    # Grava as linhas (na ordem de COLUMNS) de um mês e retorna o caminho absoluto do arquivo
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.abspath(os.path.join(
+        directory, f"stock_movements_{month:%Y_%m}_{datetime.now():%Y%m%dT%H%M%S%f}.parquet"
+    ))
+    frame = pd.DataFrame.from_records(rows, columns=COLUMNS).astype(NULLABLE_INTEGERS)
+    frame.to_parquet(path, index=False, compression=COMPRESSION)
+    return path
+
+
+def read_stock_deltas(paths, product_ids, since: dict, at: datetime, inclusive: bool, signs: dict):
+    """
+    Variação do estoque de cada produto pelos itens arquivados em `paths`: {product_id: variação}.
+    Entram os itens com movement_date até `at` (inclusive ou não) e a partir de since[product_id],
+    a fotografia de onde a consulta parte (produtos ausentes de `since` somam desde o início).
+    `signs` é o sinal de cada tipo de movimentação (crud.STOCK_SIGNS).
+    """
+    frames = [
+        pd.read_parquet(
+            path, columns=["movement_date", "type", "product_id", "quantity"],
+            filters=[("product_id", "in", list(product_ids))],
+        )
+        for path in paths
+    ]
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+    if frame.empty:
+        return {}
+
+    dates = frame["movement_date"]
+    starts = pd.to_datetime(frame["product_id"].map(since))
+    selected = (dates <= at if inclusive else dates < at) & (starts.isna() | (dates >= starts))
+    signed = frame["quantity"].fillna(0) * frame["type"].map(signs).fillna(0)
+    totals = signed[selected].groupby(frame.loc[selected, "product_id"]).sum()
+    return {int(product_id): int(delta) for product_id, delta in totals.items()}
@@ -0,0 +1,6 @@
+"""
+Benchmarks do backend.
+
+Cada módulo é executável a partir do diretório backend, por exemplo:
+    python -m benchmarks.create_movement --database-url sqlite:///bench.db
+"""
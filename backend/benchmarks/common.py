@@ -0,0 +1,108 @@
+"""
+Utilitários compartilhados pelos benchmarks: criação e carga de banco isolado e medição de tempo.
+"""
+import os
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+
+import migrations
+import models
+from crud import rebuild_stock_balances
+
+SEED_BATCH_SIZE = 100000
+
+DEFAULT_DATABASE_URL = os.getenv("BENCHMARK_DATABASE_URL", "sqlite:///benchmark.db")
+
+
+def add_database_argument(parser):
+    parser.add_argument(
+        "--database-url",
+        default=DEFAULT_DATABASE_URL,
+        help="Banco usado no benchmark; as tabelas são recriadas (padrão: %(default)s)",
+    )
+
+
+def make_session_factory(database_url, **engine_options):
+    # Banco descartável: apaga todas as tabelas e recria o esquema pelas migrações, como em produção
+    engine = create_engine(database_url, **engine_options)
+    models.Base.metadata.drop_all(bind=engine)
+    migrations.migration_metadata.drop_all(bind=engine)
+    migrations.upgrade(engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def seed_inventory(session_factory, product_count, movement_count, lines, days):
+    """
+    Produtos e movimentações com `lines` itens cada, espalhadas pelos últimos `days` dias, com
+    os saldos materializados coerentes com o histórico gerado. Os dados dependem apenas dos
+    parâmetros (gerador aleatório com semente fixa).
+    """
+    rng = random.Random(0)
+    now = datetime.now()
+    db = session_factory()
+    try:
+        for start in range(1, product_count + 1, SEED_BATCH_SIZE):
+            db.execute(insert(models.ProductModel), [
+                {"id": product_id, "sku": f"SKU{product_id}", "name": f"Product {product_id}", "price": rng.uniform(1, 100)}
+                for product_id in range(start, min(start + SEED_BATCH_SIZE, product_count + 1))
+            ])
+        db.commit()
+
+        step = max(SEED_BATCH_SIZE // lines, 1)
+        for start in range(1, movement_count + 1, step):
+            movement_ids = range(start, min(start + step, movement_count + 1))
+            db.execute(insert(models.StockMovementModel), [
+                {
+                    "id": movement_id,
+                    "type": "entrada" if rng.random() < 0.6 else "saída",
+                    "movement_date": now - timedelta(minutes=rng.randint(0, days * 24 * 60)),
+                }
+                for movement_id in movement_ids
+            ])
+            db.execute(insert(models.StockMovementItemModel), [
+                {"movement_id": movement_id, "product_id": rng.randint(1, product_count), "quantity": rng.randint(1, 10)}
+                for movement_id in movement_ids
+                for _ in range(lines)
+            ])
+            db.commit()
+
+        # Os ids foram informados explicitamente: no PostgreSQL, as sequências passam a continuar deles
+        if db.get_bind().dialect.name == "postgresql":
+            for table in ("products", "stock_movements"):
+                db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"))
+            db.commit()
+        rebuild_stock_balances(db)
+    finally:
+        db.close()
+
+
+@contextmanager
+def timer(samples):
+    # Acrescenta à lista a duração do bloco, em segundos
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples.append(time.perf_counter() - start)
+
+
+def summarize(samples):
+    return {
+        "runs": len(samples),
+        "mean_ms": statistics.mean(samples) * 1000,
+        "min_ms": min(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+
+def percentile(samples, percent):
+    # Percentil por ordenação (nearest-rank), suficiente para relatórios de benchmark
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
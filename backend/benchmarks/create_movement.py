@@ -0,0 +1,99 @@
+"""
+Compara o caminho de escrita de movimentações de estoque:
+
+- legacy: caminho original (commit do cabeçalho, refresh, db.add de cada item e segundo commit)
+- current: crud.create_stock_movement (uma transação, itens inseridos com executemany)
+
+Uso:
+    python -m benchmarks.create_movement --sizes 1 100 10000 --repeat 5
+"""
+import argparse
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from benchmarks.common import add_database_argument, make_session_factory, summarize, timer
+from crud import create_stock_movement
+from models import ProductModel, StockBalanceModel, StockMovementModel, StockMovementItemModel
+from schemas import StockMovementWithItemsCreate
+
+
+def legacy_create_stock_movement(db, movement_data):
+    # Reprodução do caminho de escrita anterior, usada apenas como referência
+    new_movement = StockMovementModel(type=movement_data.type, movement_date=movement_data.movement_date)
+    db.add(new_movement)
+    db.commit()
+    db.refresh(new_movement)
+    for item_data in movement_data.items:
+        db.add(StockMovementItemModel(
+            movement_id=new_movement.id,
+            product_id=item_data.product_id,
+            quantity=item_data.quantity,
+        ))
+    db.commit()
+    return new_movement
+
+
+def seed_products(session_factory, count):
+    db = session_factory()
+    try:
+        db.execute(insert(ProductModel), [
+            {"id": product_id, "name": f"Product {product_id}", "price": 1.0}
+            for product_id in range(1, count + 1)
+        ])
+        db.execute(insert(StockBalanceModel), [
+            {"product_id": product_id, "quantity": 0} for product_id in range(1, count + 1)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def build_movement(size, product_count):
+    return StockMovementWithItemsCreate(
+        type="entrada",
+        movement_date=datetime.now(),
+        items=[
+            {"product_id": line % product_count + 1, "quantity": 1}
+            for line in range(size)
+        ],
+    )
+
+
+def run(session_factory, size, repeat, product_count):
+    movement = build_movement(size, product_count)
+    results = {}
+    for name, write in (("legacy", legacy_create_stock_movement), ("current", create_stock_movement)):
+        samples = []
+        for _ in range(repeat):
+            db = session_factory()
+            try:
+                with timer(samples):
+                    write(db, movement)
+            finally:
+                db.close()
+        results[name] = summarize(samples)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_database_argument(parser)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--products", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    engine, session_factory = make_session_factory(args.database_url)
+    seed_products(session_factory, args.products)
+
+    print(f"{'lines':>8} {'path':>8} {'mean ms':>10} {'min ms':>10} {'lines/s':>12}")
+    for size in args.sizes:
+        for name, stats in run(session_factory, size, args.repeat, args.products).items():
+            print(f"{size:>8} {name:>8} {stats['mean_ms']:>10.2f} {stats['min_ms']:>10.2f} "
+                  f"{size / (stats['mean_ms'] / 1000):>12.0f}")
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
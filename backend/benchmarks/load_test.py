@@ -0,0 +1,101 @@
+"""
+Teste de carga HTTP: compara latência (p50/p99) e requisições por segundo entre servidores já em execução,
+por exemplo a mesma API nos modos síncrono e assíncrono:
+
+    DATABASE_MODE=sync  uvicorn main:app --port 8000
+    DATABASE_MODE=async uvicorn main:app --port 8001
+    python -m benchmarks.load_test --target sync=http://localhost:8000 --target async=http://localhost:8001 --seed
+
+A carga mistura leituras de produto e de estoque de produtos aleatórios, com `--concurrency` clientes simultâneos.
+Requer o pacote httpx.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from benchmarks.common import percentile
+
+
+async def seed(base_url, products):
+    # Cadastra produtos com uma entrada de estoque, para que as leituras encontrem dados
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        product_ids = []
+        for index in range(products):
+            response = await client.post("/products/", json={"name": f"Load test {index}", "price": 1.0})
+            response.raise_for_status()
+            product_ids.append(response.json()["id"])
+        response = await client.post("/stock-movements/", json={
+            "type": "entrada",
+            "movement_date": "2025-01-01T00:00:00",
+            "items": [{"product_id": product_id, "quantity": 1000} for product_id in product_ids],
+        })
+        response.raise_for_status()
+    return product_ids
+
+
+async def run_load(base_url, product_ids, concurrency, total_requests):
+    latencies = []
+    errors = 0
+    remaining = iter(range(total_requests))
+    rng = random.Random(0)
+
+    async def client_loop(client):
+        nonlocal errors
+        for _ in remaining:
+            product_id = rng.choice(product_ids)
+            path = rng.choice((f"/products/{product_id}", f"/products/{product_id}/stock"))
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_s": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def main_async(args):
+    targets = dict(target.split("=", 1) for target in args.target)
+    results = {}
+    for name, base_url in targets.items():
+        if args.seed:
+            product_ids = await seed(base_url, args.products)
+        else:
+            product_ids = list(range(1, args.products + 1))
+        results[name] = await run_load(base_url, product_ids, args.concurrency, args.requests)
+
+    print(f"{'target':>10} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, result in results.items():
+        print(f"{name:>10} {result['requests']:>9} {result['errors']:>7} {result['requests_per_s']:>9.1f} "
+              f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", required=True, help="nome=URL base do servidor; pode repetir")
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20000, help="Total de requisições por alvo")
+    parser.add_argument("--products", type=int, default=100)
+    parser.add_argument("--seed", action="store_true", help="Cadastra os produtos antes da carga")
+    asyncio.run(main_async(parser.parse_args(argv)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+Cache de leitura (read-through) das consultas de produto e de estoque feitas em crud.py.
+
+As entradas são guardadas por namespace ("product", "stock") e id, como dicionários JSON, junto com
+a versão dos dados (contadores da tabela data_versions) lida antes da consulta que as produziu. Uma
+leitura só aceita a entrada gravada com a versão atual: uma consulta que começou antes de uma
+alteração e grava o valor antigo depois da invalidação deixa uma entrada que nunca mais é servida,
+em qualquer processo. As funções de crud.py também removem as entradas alteradas logo após o
+commit, e o TTL limita quanto tempo as entradas de versões antigas ocupam o cache.
+
+Configuração por variáveis de ambiente:
+    CACHE_BACKEND      memory (padrão): LRU em memória, por processo
+                       redis: compartilhado entre processos (recomendado com vários workers)
+                       none: desativa o cache
+    CACHE_TTL          validade das entradas, em segundos (padrão 30)
+    CACHE_MAX_ENTRIES  tamanho máximo do LRU em memória (padrão 10000)
+    REDIS_URL          endereço do Redis (padrão redis://localhost:6379/0)
+    CACHE_PREFIX       prefixo das chaves no Redis (padrão crud:)
+
+Em testes, qualquer cliente com a interface do redis-py (por exemplo, fakeredis) pode ser usado
+com configure(RedisCache(cliente)).
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryCache:
+    # LRU com TTL; seguro para as rotas síncronas, que rodam em várias threads
+    name = "memory"
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()  # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, values: dict):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    # Cache compartilhado; `client` é um redis.Redis (ou um cliente compatível, como o fakeredis)
+    name = "redis"
+
+    def __init__(self, client, ttl: float, prefix: str = "crud:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget([self.prefix + key for key in keys])
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, values: dict):
+        pipeline = self.client.pipeline()
+        for key, value in values.items():
+            pipeline.set(self.prefix + key, json.dumps(value), px=int(self.ttl * 1000))
+        pipeline.execute()
+
+    def delete_many(self, keys):
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            self.client.delete(*keys)
+
+    def delete_prefix(self, prefix: str):
+        keys = list(self.client.scan_iter(match=f"{self.prefix}{prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self):
+        return None  # o Redis pode ser compartilhado com outros dados; não há contagem barata só das nossas chaves
+
+
+class NullCache:
+    # CACHE_BACKEND=none: toda leitura é um miss e nada é guardado
+    name = "none"
+    ttl = 0
+
+    def get_many(self, keys):
+        return {}
+
+    def set_many(self, values: dict):
+        pass
+
+    def delete_many(self, keys):
+        pass
+
+    def delete_prefix(self, prefix: str):
+        pass
+
+    def size(self):
+        return 0
+
+
+def make_backend():
+    name = os.getenv("CACHE_BACKEND", "memory")
+    ttl = float(os.getenv("CACHE_TTL", "30"))
+    if name == "memory":
+        return MemoryCache(ttl, int(os.getenv("CACHE_MAX_ENTRIES", "10000")))
+    if name == "redis":
+        import redis  # dependência necessária apenas com CACHE_BACKEND=redis
+
+        client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return RedisCache(client, ttl, os.getenv("CACHE_PREFIX", "crud:"))
+    if name == "none":
+        return NullCache()
+    raise ValueError(f"Invalid CACHE_BACKEND {name!r}: expected 'memory', 'redis' or 'none'")
+
+
+backend = make_backend()
+
+# Contadores por namespace, deste processo: {"product": {"hits": 0, "misses": 0, "invalidations": 0}, ...}
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def configure(new_backend):
+    # Troca o backend (por exemplo, em testes) e zera os contadores
+    global backend
+    backend = new_backend
+    with _counters_lock:
+        _counters.clear()
+
+
+def _count(namespace: str, counter: str, amount: int):
+    if amount:
+        with _counters_lock:
+            counters = _counters.setdefault(namespace, {"hits": 0, "misses": 0, "invalidations": 0})
+            counters[counter] += amount
+
+
+def get_many(namespace: str, ids, version: str):
+    # Valores em cache dos ids pedidos gravados com `version`: {id: valor}; os demais ids contam como miss
+    ids = list(dict.fromkeys(ids))
+    found = backend.get_many(f"{namespace}:{id_}" for id_ in ids)
+    values = {}
+    for id_ in ids:
+        entry = found.get(f"{namespace}:{id_}")
+        if entry is not None and entry["version"] == version:
+            values[id_] = entry["value"]
+    _count(namespace, "hits", len(values))
+    _count(namespace, "misses", len(ids) - len(values))
+    return values
+
+
+def set_many(namespace: str, values: dict, version: str):
+    # `version` deve ter sido lida antes da consulta que produziu os valores
+    if values:
+        backend.set_many({f"{namespace}:{id_}": {"version": version, "value": value} for id_, value in values.items()})
+
+
+def invalidate(namespace: str, ids):
+    keys = [f"{namespace}:{id_}" for id_ in set(ids)]
+    backend.delete_many(keys)
+    _count(namespace, "invalidations", len(keys))
+
+
+def invalidate_namespace(namespace: str):
+    # Remove todas as entradas do namespace, para alterações em massa cujos ids não são conhecidos
+    backend.delete_prefix(f"{namespace}:")
+    _count(namespace, "invalidations", 1)
+
+
+def stats():
+    with _counters_lock:
+        namespaces = {namespace: dict(counters) for namespace, counters in _counters.items()}
+    return {
+        "backend": backend.name,
+        "ttl_seconds": backend.ttl,
+        "entries": backend.size(),
+        "max_entries": getattr(backend, "max_entries", None),
+        "evictions": getattr(backend, "evictions", None),
+        "namespaces": namespaces,
+    }
@@ -1,143 +1,1340 @@
-from sqlalchemy.orm import Session
-from datetime import datetime
-from schemas import ProductCreate, ProductUpdate, StockMovementWithItemsCreate, StockCalculationResponse, Error
-from models import ProductModel, StockMovementModel, StockMovementItemModel
+from sqlalchemy.orm import Session, selectinload, aliased
+from sqlalchemy import func, case, insert, update, bindparam, text, select, or_, literal_column
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from datetime import date, datetime, time, timedelta, timezone
+from itertools import groupby
+import csv
+import hashlib
+import io
+import os
+from schemas import ProductCreate, ProductUpdate, ProductResponse, StockMovementWithItemsCreate, StockMovementResponse, StockCalculationResponse, StockSeriesPoint, StockSeriesResponse, Error
+from models import ProductModel, StockMovementModel, StockMovementItemModel, StockBalanceModel, IngestCheckpointModel, DataVersionModel, StockSnapshotModel, StockOpeningBalanceModel, StockArchiveModel, StockMovementArchiveModel, IdempotencyKeyModel
 from fastapi import HTTPException
+import archive
+import cache
+
+# Sinal de cada tipo de movimentação sobre o saldo do produto; outros tipos não alteram o estoque
+STOCK_SIGNS = {'entrada': 1, 'saída': -1}
+
+# Tipo do lançamento que anula cada tipo de movimentação (estorno, no livro append-only)
+REVERSAL_TYPES = {'entrada': 'saída', 'saída': 'entrada'}
+
+"""
+Modo do livro de movimentações (variável de ambiente STOCK_LEDGER_MODE):
+    mutable (padrão): alterar ou excluir uma movimentação muda (ou remove) o registro original.
+    append_only: o histórico nunca é alterado. Excluir grava um estorno (mesmos itens, tipo oposto,
+    mesma data) ligado ao original por reverses_movement_id; alterar grava o estorno e um lançamento
+    de correção com os novos dados, ligado por replaces_movement_id. Os saldos (stock_balances) e as
+    fotografias recebem apenas o efeito de cada novo lançamento, como em uma inclusão.
+Os lançamentos antigos podem ser compactados com compact_stock_ledger.
+"""
+STOCK_LEDGER_MODE = os.getenv("STOCK_LEDGER_MODE", "mutable")
+if STOCK_LEDGER_MODE not in ("mutable", "append_only"):
+    raise ValueError(f"Invalid STOCK_LEDGER_MODE {STOCK_LEDGER_MODE!r}: expected 'mutable' or 'append_only'")
+
+# Conjuntos de dados (tabela data_versions) de que cada resposta depende: usados pelo cache (cache.py)
+# e pelos ETags das rotas; o estoque traz também nome e descrição do produto
+PRODUCT_VERSIONS = ("products",)
+MOVEMENT_VERSIONS = ("stock_movements",)
+STOCK_VERSIONS = ("products", "stock_movements")
+
+# Tamanho dos lotes de ids em consultas IN (...) das listagens em dicionários
+ROWS_IN_BATCH_SIZE = 10000
+
+# Prazo em que uma chave de idempotência (cabeçalho Idempotency-Key) repete a resposta gravada
+IDEMPOTENCY_TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+
+def dialect_insert(db: Session, model):
+    # INSERT com suporte a ON CONFLICT do banco em uso (PostgreSQL ou SQLite)
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
 
 # Funções CRUD para Produtos
 def create_product(db: Session, product_data: ProductCreate):
     new_product = ProductModel(
+        sku=product_data.sku,
         name=product_data.name,
         description=product_data.description,
         price=product_data.price
     )
     db.add(new_product)
+    try:
+        db.flush()
+    except IntegrityError:
+        raise _sku_conflict(db)
+    # Todo produto nasce com saldo zero
+    db.add(StockBalanceModel(product_id=new_product.id, quantity=0))
+    _touch_data_versions(db, "products")
     db.commit()
     db.refresh(new_product)
     return new_product
 
-def get_product(db: Session, product_id: int):
-    return db.query(ProductModel).filter(ProductModel.id == product_id).first()
+def get_product(db: Session, product_id: int, versions=None):
+    """
+    Leitura pelo cache (ver cache.py); retorna um ProductResponse, ou None se o produto não existir.
+    `versions` são as versões de PRODUCT_VERSIONS já lidas pela rota (get_data_versions), se houver.
+    """
+    version = _cache_version(db, PRODUCT_VERSIONS, versions)
+    cached = cache.get_many("product", [product_id], version)
+    if product_id in cached:
+        return ProductResponse.model_validate(cached[product_id])
+    product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
+    if product is None:
+        return None
+    response = ProductResponse.model_validate(product)
+    cache.set_many("product", {product_id: response.model_dump(mode="json")}, version)
+    return response
 
-def get_products(db: Session):
-    return db.query(ProductModel).order_by(ProductModel.id).all()
+def get_products(db: Session, after_id: int = None, limit: int = None, name: str = None):
+    # Paginação por chave (keyset): a próxima página começa depois do último id recebido
+    return _page_products(db.query(ProductModel), after_id, limit, name).all()
+
+def get_product_rows(db: Session, after_id: int = None, limit: int = None, name: str = None):
+    """
+    Mesma listagem de get_products, já como dicionários no formato de ProductResponse, montados a
+    partir das colunas, sem objetos ORM. Usada pelas respostas rápidas (FAST_JSON_RESPONSES).
+    """
+    query = db.query(
+        ProductModel.sku, ProductModel.name, ProductModel.description, ProductModel.price,
+        ProductModel.id, ProductModel.created_at,
+    )
+    return [row._asdict() for row in _page_products(query, after_id, limit, name)]
+
+def _page_products(query, after_id, limit, name):
+    # Filtro por trecho do nome (sem diferenciar maiúsculas; % e _ são literais) e paginação por id
+    query = query.order_by(ProductModel.id)
+    if name:
+        pattern = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(ProductModel.name.ilike(f"%{pattern}%", escape="\\"))
+    if after_id is not None:
+        query = query.filter(ProductModel.id > after_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def iter_products(db: Session, batch_size: int = 1000):
+    # Percorre todos os produtos com cursor do lado do servidor, em lotes, com memória constante
+    return db.query(ProductModel).order_by(ProductModel.id).yield_per(batch_size)
 
 def update_product(db: Session, product_id: int, product_data: ProductUpdate):
     product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
     if product:
+        product.sku = product_data.sku if product_data.sku else product.sku
         product.name = product_data.name if product_data.name else product.name
         product.description = product_data.description if product_data.description else product.description
         product.price = product_data.price if product_data.price else product.price
-        db.commit()
+        _touch_data_versions(db, "products")
+        try:
+            db.commit()
+        except IntegrityError:
+            raise _sku_conflict(db)
+        # A consulta de estoque também traz o nome e a descrição do produto
+        cache.invalidate("product", [product_id])
+        cache.invalidate("stock", [product_id])
     return product
 
+def _sku_conflict(db: Session):
+    # Violação do índice único ux_products_sku: desfaz a transação e responde 409
+    db.rollback()
+    return HTTPException(status_code=409, detail="SKU já cadastrado")
+
 def delete_product(db: Session, product_id: int):
     product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
     if product:
+        db.query(StockBalanceModel).filter(StockBalanceModel.product_id == product_id).delete()
+        db.query(StockSnapshotModel).filter(StockSnapshotModel.product_id == product_id).delete()
+        db.query(StockOpeningBalanceModel).filter(StockOpeningBalanceModel.product_id == product_id).delete()
         db.delete(product)
+        _touch_data_versions(db, "products")
         db.commit()
+        cache.invalidate("product", [product_id])
+        cache.invalidate("stock", [product_id])
     return product
 
+def upsert_products(db: Session, products):
+    """
+    Insere ou atualiza (pelo SKU) uma lista de ProductImportRow em uma única transação.
+    No PostgreSQL os dados entram por COPY em uma tabela temporária e são aplicados com um único
+    INSERT ... ON CONFLICT; nos demais bancos, por um INSERT ... ON CONFLICT em lote.
+    Produtos novos ganham a linha de saldo zerada. Retorna (inseridos, atualizados).
+    """
+    # SKUs repetidos no mesmo lote: vale a última ocorrência (o ON CONFLICT não aceita a mesma linha duas vezes)
+    rows = list({product.sku: product for product in products}.values())
+    if not rows:
+        return 0, 0
+
+    if db.get_bind().dialect.name == "postgresql":
+        inserted, updated = _copy_upsert_products(db, rows)
+    else:
+        inserted, updated = _batch_upsert_products(db, rows)
+    _touch_data_versions(db, "products")
+    db.commit()
+    # Os ids atualizados não são conhecidos no caminho do COPY; a importação descarta o cache de produtos
+    if updated:
+        cache.invalidate_namespace("product")
+        cache.invalidate_namespace("stock")
+    return inserted, updated
+
+def _copy_upsert_products(db: Session, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row.sku, row.name, row.description, row.price])
+    buffer.seek(0)
+
+    db.execute(text(
+        "CREATE TEMP TABLE products_import_staging "
+        "(sku VARCHAR, name VARCHAR, description VARCHAR, price DOUBLE PRECISION) ON COMMIT DROP"
+    ))
+    # COPY pelo cursor do psycopg2, na mesma conexão (e transação) da sessão
+    cursor = db.connection().connection.cursor()
+    cursor.copy_expert("COPY products_import_staging (sku, name, description, price) FROM STDIN WITH (FORMAT csv)", buffer)
+
+    # Upsert e saldos dos produtos novos em um único comando; xmax = 0 identifica as linhas inseridas
+    inserted, updated = db.execute(text(
+        "WITH upserted AS ("
+        "  INSERT INTO products (sku, name, description, price, created_at) "
+        "  SELECT sku, name, description, price, now() FROM products_import_staging "
+        "  ON CONFLICT (sku) DO UPDATE SET "
+        "  name = EXCLUDED.name, description = EXCLUDED.description, price = EXCLUDED.price "
+        "  RETURNING id, (xmax = 0) AS inserted"
+        "), balances AS ("
+        "  INSERT INTO stock_balances (product_id, quantity) SELECT id, 0 FROM upserted WHERE inserted"
+        ") "
+        "SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted"
+    )).one()
+    return inserted, updated
+
+def _batch_upsert_products(db: Session, rows):
+    existing = {
+        sku for (sku,) in db.query(ProductModel.sku).filter(ProductModel.sku.in_([row.sku for row in rows]))
+    }
+    statement = dialect_insert(db, ProductModel).values([
+        {"sku": row.sku, "name": row.name, "description": row.description, "price": row.price, "created_at": func.now()}
+        for row in rows
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[ProductModel.sku],
+        set_={"name": statement.excluded.name, "description": statement.excluded.description, "price": statement.excluded.price},
+    ).returning(ProductModel.id, ProductModel.sku)
+    inserted_ids = [product_id for product_id, sku in db.execute(statement) if sku not in existing]
+    if inserted_ids:
+        db.execute(insert(StockBalanceModel), [{"product_id": product_id, "quantity": 0} for product_id in inserted_ids])
+    return len(inserted_ids), len(rows) - len(inserted_ids)
+
 # Funções CRUD para Movimentações de Estoque
-def create_stock_movement(db: Session, movement_data: StockMovementWithItemsCreate):
-    # Inicia a criação do movimento de estoque
-    new_movement = StockMovementModel(
-        type=movement_data.type,
-        movement_date=movement_data.movement_date
-    )
+def create_stock_movement(db: Session, movement_data: StockMovementWithItemsCreate, lock_stock: bool = True, idempotency_key: str = None):
+    # Com idempotency_key, uma repetição da requisição recebe a resposta gravada, sem validar nem gravar de novo
+    if idempotency_key is not None:
+        replay = _claim_idempotency_key(db, idempotency_key, movement_data)
+        if replay is not None:
+            return replay
 
-    # Lista para armazenar mensagens de erro
-    errors = []
+    # Reserva do estoque: em saídas concorrentes, a segunda espera a primeira confirmar antes de validar
+    if lock_stock and movement_data.type == 'saída':
+        _lock_stock_balances(db, [item_data.product_id for item_data in movement_data.items])
 
     # Validação antes de inserir qualquer item no banco de dados
-    for item_data in movement_data.items:
-        if movement_data.type == 'saída':  # Verificação apenas para movimentações de saída
-            current_stock_response = calculate_stock(db, item_data.product_id)
-            if item_data.quantity > current_stock_response.current_stock:
-                errors.append(f"Not enough stock for product ID {item_data.product_id}. Available: {current_stock_response.current_stock}, Requested: {item_data.quantity}")
-        
+    errors = _check_stock_availability(db, movement_data.type, movement_data.items)
+
     if errors:
+        db.rollback()  # Libera os bloqueios da reserva
         raise HTTPException(
             status_code=400,
             detail=Error(error="Failed to create movement due to stock limitations", details=errors).model_dump()  # Usando .dict() para serializar a resposta
         )
 
-    # Se não houver erros, adicione a movimentação
-    db.add(new_movement)
-    db.commit()
-    db.refresh(new_movement)
-
-    # Agora, adicione os itens da movimentação
-    for item_data in movement_data.items:
-        new_item = StockMovementItemModel(
-            movement_id=new_movement.id,
-            product_id=item_data.product_id,
-            quantity=item_data.quantity
-        )
-        db.add(new_item)
+    # Se não houver erros, grava a movimentação, os itens e os saldos, sem commit
+    new_movement = _insert_stock_movement(db, movement_data.type, movement_data.movement_date, movement_data.items)
 
-    db.commit()  # Confirma a movimentação e os itens
+    _touch_data_versions(db, "stock_movements")
+    if idempotency_key is not None:
+        _store_idempotent_response(db, idempotency_key, new_movement)
+    db.commit()  # Confirma a movimentação, os itens e os saldos juntos
+    cache.invalidate("stock", [item_data.product_id for item_data in movement_data.items])
     return new_movement
 
-def get_stock_movements(db: Session):
-    return db.query(StockMovementModel).all()
+def _claim_idempotency_key(db: Session, key: str, movement_data: StockMovementWithItemsCreate):
+    """
+    Reserva a chave de idempotência na transação corrente, antes da movimentação; retorna None se a
+    chave for nova (ou estiver vencida) ou a resposta gravada pela requisição que a usou antes.
+    Não há bloqueio explícito: o INSERT ... ON CONFLICT pela chave primária faz uma requisição
+    simultânea com a mesma chave esperar o fim da transação da primeira. Se a primeira confirmar, a
+    segunda recebe a resposta dela; se falhar (rollback, por exemplo por falta de estoque), a
+    segunda reserva a chave e executa normalmente. A mesma chave com outro corpo gera 422.
+    """
+    request_hash = hashlib.sha256(movement_data.model_dump_json().encode()).hexdigest()
+    now = _naive(datetime.now(timezone.utc))
+    statement = dialect_insert(db, IdempotencyKeyModel).values(key=key, request_hash=request_hash, expires_at=now + IDEMPOTENCY_TTL)
+    claimed = db.execute(statement.on_conflict_do_update(
+        index_elements=[IdempotencyKeyModel.key],
+        set_={"request_hash": statement.excluded.request_hash, "response": None, "expires_at": statement.excluded.expires_at},
+        where=IdempotencyKeyModel.expires_at <= now,
+    )).rowcount
+    if claimed:
+        return None
+
+    stored_hash, response = db.query(IdempotencyKeyModel.request_hash, IdempotencyKeyModel.response).filter(
+        IdempotencyKeyModel.key == key
+    ).one()
+    db.rollback()
+    if stored_hash != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    if response is None:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    return StockMovementResponse.model_validate_json(response)
+
+def _store_idempotent_response(db: Session, key: str, movement):
+    # Grava a resposta na transação da movimentação; o refresh traz os valores como o banco os retorna
+    db.refresh(movement)
+    db.query(IdempotencyKeyModel).filter(IdempotencyKeyModel.key == key).update(
+        {IdempotencyKeyModel.response: StockMovementResponse.model_validate(movement, from_attributes=True).model_dump_json()},
+        synchronize_session=False,
+    )
+
+def purge_idempotency_keys(db: Session):
+    # Remove as chaves de idempotência vencidas; retorna quantas foram removidas
+    removed = db.query(IdempotencyKeyModel).filter(
+        IdempotencyKeyModel.expires_at <= _naive(datetime.now(timezone.utc))
+    ).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+def _insert_stock_movement(db: Session, movement_type: str, movement_date: datetime, items, **ledger_references):
+    """
+    Grava uma movimentação e seus itens (objetos com product_id e quantity) na transação corrente,
+    sem commit, aplicando seu efeito nos saldos e nas fotografias. Usada nas inclusões e nos
+    lançamentos de estorno e correção do livro append-only.
+    """
+    # Atualiza os saldos antes de gravar os itens (ver _apply_stock_deltas)
+    deltas = _movement_deltas(movement_type, items)
+    _apply_stock_deltas(db, deltas)
+    _apply_snapshot_deltas(db, [(movement_date, deltas)])
+
+    # O flush apenas obtém o id, sem commit
+    movement = StockMovementModel(type=movement_type, movement_date=movement_date, **ledger_references)
+    db.add(movement)
+    db.flush()
+
+    # Agora, insere todos os itens de uma vez (executemany), na mesma transação
+    if items:
+        db.execute(insert(StockMovementItemModel), [
+            {
+                "movement_id": movement.id,
+                "product_id": item.product_id,
+                "quantity": item.quantity,
+            }
+            for item in items
+        ])
+    return movement
+
+def get_stock_movements(
+    db: Session,
+    movement_type: str = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    product_id: int = None,
+    order_by: str = 'id',
+    cursor: str = None,
+    limit: int = None,
+):
+    """
+    Lista movimentações com filtros e paginação por chave (keyset) em `id` ou em (`movement_date`, `id`).
+    `cursor` é o valor retornado por stock_movement_cursor para o último item da página anterior.
+    """
+    # Os itens de todas as movimentações da página vêm em uma única consulta extra (sem N+1)
+    return stock_movements_query(
+        db, movement_type, date_from, date_to, product_id, order_by, cursor, limit
+    ).options(selectinload(StockMovementModel.items)).all()
+
+def stock_movements_query(
+    db: Session,
+    movement_type: str = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    product_id: int = None,
+    order_by: str = 'id',
+    cursor: str = None,
+    limit: int = None,
+):
+    # Consulta da página usada por get_stock_movements, sem os itens; exposta para inspeção do plano (migrations.explain_query)
+    query = _filter_stock_movements(db.query(StockMovementModel), movement_type, date_from, date_to, product_id)
+    return _page_stock_movements(query, order_by, cursor, limit)
+
+def get_stock_movement_rows(
+    db: Session,
+    movement_type: str = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    product_id: int = None,
+    order_by: str = 'id',
+    cursor: str = None,
+    limit: int = None,
+):
+    """
+    Mesma listagem de get_stock_movements, já como dicionários no formato de StockMovementResponse,
+    montados a partir das colunas, sem objetos ORM. Usada pelas respostas rápidas (FAST_JSON_RESPONSES).
+    """
+    query = _filter_stock_movements(
+        db.query(StockMovementModel.id, StockMovementModel.type, StockMovementModel.movement_date),
+        movement_type, date_from, date_to, product_id,
+    )
+    movements = [
+        {"id": movement_id, "type": movement_type, "movement_date": movement_date, "items": []}
+        for movement_id, movement_type, movement_date in _page_stock_movements(query, order_by, cursor, limit)
+    ]
+
+    # Itens em lotes de ids, como o selectinload, mas sem criar objetos
+    by_id = {movement["id"]: movement for movement in movements}
+    ids = list(by_id)
+    for start in range(0, len(ids), ROWS_IN_BATCH_SIZE):
+        for movement_id, item_product_id, quantity in db.query(
+            StockMovementItemModel.movement_id, StockMovementItemModel.product_id, StockMovementItemModel.quantity
+        ).filter(StockMovementItemModel.movement_id.in_(ids[start:start + ROWS_IN_BATCH_SIZE])).order_by(StockMovementItemModel.id):
+            by_id[movement_id]["items"].append({"product_id": item_product_id, "quantity": quantity})
+    return movements
+
+def _page_stock_movements(query, order_by: str, cursor: str, limit: int):
+    if order_by == 'movement_date':
+        query = query.order_by(StockMovementModel.movement_date, StockMovementModel.id)
+        if cursor is not None:
+            after_date, after_id = _parse_stock_movement_cursor(cursor, order_by)
+            query = query.filter(
+                (StockMovementModel.movement_date > after_date)
+                | ((StockMovementModel.movement_date == after_date) & (StockMovementModel.id > after_id))
+            )
+    else:
+        query = query.order_by(StockMovementModel.id)
+        if cursor is not None:
+            query = query.filter(StockMovementModel.id > _parse_stock_movement_cursor(cursor, order_by))
+
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def stock_movement_cursor(movement, order_by: str = 'id'):
+    # Cursor opaco para continuar a listagem depois desta movimentação (objeto ORM ou dicionário de get_stock_movement_rows)
+    if isinstance(movement, dict):
+        movement_id, movement_date = movement["id"], movement["movement_date"]
+    else:
+        movement_id, movement_date = movement.id, movement.movement_date
+    if order_by == 'movement_date':
+        return f"{movement_date.isoformat()}|{movement_id}"
+    return str(movement_id)
+
+def _parse_stock_movement_cursor(cursor: str, order_by: str):
+    # Levanta ValueError para cursores malformados
+    if order_by == 'movement_date':
+        after_date, after_id = cursor.rsplit('|', 1)
+        return datetime.fromisoformat(after_date), int(after_id)
+    return int(cursor)
+
+def _filter_stock_movements(query, movement_type=None, date_from=None, date_to=None, product_id=None):
+    if movement_type is not None:
+        query = query.filter(StockMovementModel.type == movement_type)
+    if date_from is not None:
+        query = query.filter(StockMovementModel.movement_date >= date_from)
+    if date_to is not None:
+        query = query.filter(StockMovementModel.movement_date <= date_to)
+    if product_id is not None:
+        query = query.filter(StockMovementModel.items.any(StockMovementItemModel.product_id == product_id))
+    return query
+
+def iter_stock_movements(
+    db: Session,
+    movement_type: str = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    product_id: int = None,
+    batch_size: int = 1000,
+):
+    """
+    Percorre as movimentações filtradas, com seus itens, em ordem de id, gerando dicionários no formato
+    de StockMovementResponse. Usa uma única consulta (movimentações + itens) lida por cursor do lado do
+    servidor em lotes de `batch_size` linhas, com memória constante.
+    """
+    query = _filter_stock_movements(
+        db.query(
+            StockMovementModel.id,
+            StockMovementModel.type,
+            StockMovementModel.movement_date,
+            StockMovementItemModel.product_id,
+            StockMovementItemModel.quantity,
+        ).outerjoin(StockMovementModel.items),
+        movement_type, date_from, date_to, product_id,
+    ).order_by(StockMovementModel.id, StockMovementItemModel.id).yield_per(batch_size)
+
+    for movement_id, rows in groupby(query, key=lambda row: row.id):
+        rows = list(rows)
+        yield {
+            "id": movement_id,
+            "type": rows[0].type,
+            "movement_date": rows[0].movement_date,
+            "items": [
+                {"product_id": row.product_id, "quantity": row.quantity}
+                for row in rows if row.product_id is not None
+            ],
+        }
 
 def get_stock_movement(db: Session, movement_id: int):
-    return db.query(StockMovementModel).filter(StockMovementModel.id == movement_id).first()
+    return db.query(StockMovementModel).options(
+        selectinload(StockMovementModel.items)
+    ).filter(StockMovementModel.id == movement_id).first()
 
 def delete_stock_movement(db: Session, movement_id: int):
-    # Primeiro, obtemos o movimento de estoque
-    movement = db.query(StockMovementModel).filter(StockMovementModel.id == movement_id).first()
-    
+    # Primeiro, obtemos o movimento de estoque (levanta ValueError se ele não puder mais ser corrigido)
+    movement = _get_correctable_stock_movement(db, movement_id)
     if movement:
+        # Excluir uma entrada já consumida deixaria o saldo negativo
+        _check_stock_deltas(db, {
+            product_id: -delta for product_id, delta in _movement_deltas(movement.type, movement.items).items()
+        }, "delete")
+
+    if movement and STOCK_LEDGER_MODE == 'append_only':
+        # O original permanece no livro; o estorno anula seu efeito
+        _insert_stock_movement(
+            db, REVERSAL_TYPES[movement.type], movement.movement_date, movement.items, reverses_movement_id=movement.id
+        )
+        _touch_data_versions(db, "stock_movements")
+        db.commit()
+        cache.invalidate("stock", [item.product_id for item in movement.items])
+    elif movement:
+        # Estorna o efeito da movimentação nos saldos
+        reversed_deltas = {
+            product_id: -delta
+            for product_id, delta in _movement_deltas(movement.type, movement.items).items()
+        }
+        _apply_stock_deltas(db, reversed_deltas)
+        _apply_snapshot_deltas(db, [(movement.movement_date, reversed_deltas)])
+
         # Antes de deletar o movimento, deletamos todos os itens associados
+        # (redundante com o ON DELETE CASCADE, mas necessário em bancos sem FKs ativas, como o SQLite)
         db.query(StockMovementItemModel).filter(StockMovementItemModel.movement_id == movement_id).delete()
         
         # Agora deletamos o movimento
+        product_ids = [item.product_id for item in movement.items]
         db.delete(movement)
+        _touch_data_versions(db, "stock_movements")
         db.commit()
+        cache.invalidate("stock", product_ids)
     
     return movement
 
 def update_stock_movement(db: Session, movement_id: int, movement_data: StockMovementWithItemsCreate):
-    movement = db.query(StockMovementModel).filter(StockMovementModel.id == movement_id).first()
+    """
+    Altera o tipo e a data da movimentação (os itens são mantidos). No livro append-only, grava o
+    estorno do original e um lançamento de correção com os novos dados, que é o retornado.
+    Levanta ValueError se a movimentação não puder mais ser corrigida, e HTTPException 400 se a
+    alteração deixar algum saldo negativo.
+    """
+    movement = _get_correctable_stock_movement(db, movement_id)
     if movement:
+        # Trocar uma entrada por uma saída não pode deixar o saldo negativo
+        old_deltas = _movement_deltas(movement.type, movement.items)
+        new_deltas = _movement_deltas(movement_data.type, movement.items)
+        _check_stock_deltas(db, {
+            product_id: new_deltas.get(product_id, 0) - old_deltas.get(product_id, 0)
+            for product_id in old_deltas.keys() | new_deltas.keys()
+        }, "update")
+    if movement and STOCK_LEDGER_MODE == 'append_only':
+        _insert_stock_movement(
+            db, REVERSAL_TYPES[movement.type], movement.movement_date, movement.items, reverses_movement_id=movement.id
+        )
+        replacement = _insert_stock_movement(
+            db, movement_data.type, movement_data.movement_date, movement.items, replaces_movement_id=movement.id
+        )
+        _touch_data_versions(db, "stock_movements")
+        db.commit()
+        cache.invalidate("stock", [item.product_id for item in movement.items])
+        return replacement
+    if movement:
+        if movement.type != movement_data.type:
+            # A troca de tipo inverte (ou anula) o efeito dos itens já gravados
+            _apply_stock_deltas(db, {
+                product_id: new_deltas.get(product_id, 0) - old_deltas.get(product_id, 0)
+                for product_id in old_deltas.keys() | new_deltas.keys()
+            })
+        # As fotografias dependem também da data: estorna o efeito antigo e aplica o novo
+        _apply_snapshot_deltas(db, [
+            (movement.movement_date, {product_id: -delta for product_id, delta in old_deltas.items()}),
+            (movement_data.movement_date, new_deltas),
+        ])
         movement.type = movement_data.type
         movement.movement_date = movement_data.movement_date
+        _touch_data_versions(db, "stock_movements")
         db.commit()
+        cache.invalidate("stock", [item.product_id for item in movement.items])
     return movement
 
-def calculate_stock(db: Session, product_id: int):
+def _get_correctable_stock_movement(db: Session, movement_id: int):
+    """
+    Movimentação a ser alterada ou excluída, bloqueada até o fim da transação, ou None se não existir.
+    Estornos e movimentações já estornadas não podem ser corrigidos (nos dois modos), pois o par
+    já se anula nos saldos; a correção é feita sobre o lançamento de correção mais recente. Também
+    não podem ser corrigidas as correções cujo original foi arquivado, para não partir a cadeia
+    entre o arquivo e a tabela.
+    """
+    movement = db.query(StockMovementModel).filter(StockMovementModel.id == movement_id).with_for_update().first()
+    if movement is None:
+        return None
+    if movement.reverses_movement_id is not None:
+        db.rollback()
+        raise ValueError(f"Stock movement {movement_id} is a reversal and cannot be changed")
+    if movement.replaces_movement_id is not None and not db.query(StockMovementModel.id).filter(
+        StockMovementModel.id == movement.replaces_movement_id
+    ).first():
+        db.rollback()
+        raise ValueError(f"Stock movement {movement_id} corrects archived movement {movement.replaces_movement_id} and cannot be changed")
+    if db.query(StockMovementModel.id).filter(StockMovementModel.reverses_movement_id == movement_id).first():
+        db.rollback()
+        raise ValueError(f"Stock movement {movement_id} was already reversed")
+    return movement
 
-    product = db.query(ProductModel).filter(ProductModel.id == product_id).first()
+def get_stock_movement_corrections(db: Session, movement_id: int):
+    """
+    Cadeia de correções de uma movimentação, em ordem de gravação: a própria movimentação, seu
+    estorno e o lançamento de correção, seguido das correções deste, e assim por diante.
+    Retorna None se a movimentação não existir.
+    """
+    movement = get_stock_movement(db, movement_id)
+    if movement is None:
+        return None
+    entries = [movement]
+    current_ids = [movement.id]
+    while current_ids:
+        corrections = db.query(StockMovementModel).options(selectinload(StockMovementModel.items)).filter(or_(
+            StockMovementModel.reverses_movement_id.in_(current_ids),
+            StockMovementModel.replaces_movement_id.in_(current_ids),
+        )).order_by(StockMovementModel.id).all()
+        entries.extend(corrections)
+        current_ids = [correction.id for correction in corrections if correction.replaces_movement_id is not None]
+    return entries
 
-    if product:
-        # Busca todas as movimentações de entrada para o produto
-        entries = db.query(StockMovementItemModel).join(StockMovementModel).filter(
-            StockMovementItemModel.product_id == product_id,
-            StockMovementModel.type == 'entrada'
-        ).all()
+def compact_stock_ledger(db: Session, before: datetime):
+    """
+    Compacta o livro de movimentações até `before`: grava a fotografia (checkpoint) dos saldos em
+    `before`, a partir da qual as consultas históricas somam apenas os lançamentos posteriores, e
+    remove os pares movimentação/estorno com movement_date anterior. Cada par tem a mesma data e
+    efeitos opostos, então saldos e fotografias não mudam; as correções que apontavam para um original
+    removido ficam sem a referência (replaces_movement_id nulo).
+    Retorna (produtos fotografados, movimentações removidas).
+    """
+    snapshots = create_stock_snapshots(db, before)
 
-        # Busca todas as movimentações de saída para o produto
-        exits = db.query(StockMovementItemModel).join(StockMovementModel).filter(
-            StockMovementItemModel.product_id == product_id,
-            StockMovementModel.type == 'saída'
-        ).all()
+    reversals = aliased(StockMovementModel)
+    pairs = db.query(reversals.id, reversals.reverses_movement_id).filter(
+        reversals.reverses_movement_id.isnot(None), reversals.movement_date < _naive(before)
+    ).all()
+    reversal_ids = [reversal_id for reversal_id, _ in pairs]
+    original_ids = [original_id for _, original_id in pairs]
+    for ids in (reversal_ids, original_ids):
+        for start in range(0, len(ids), ROWS_IN_BATCH_SIZE):
+            chunk = ids[start:start + ROWS_IN_BATCH_SIZE]
+            # Itens e referências explicitamente, para bancos sem FKs ativas (como o SQLite)
+            db.query(StockMovementItemModel).filter(StockMovementItemModel.movement_id.in_(chunk)).delete(synchronize_session=False)
+            db.query(StockMovementModel).filter(StockMovementModel.replaces_movement_id.in_(chunk)).update(
+                {StockMovementModel.replaces_movement_id: None}, synchronize_session=False
+            )
+            db.query(StockMovementModel).filter(StockMovementModel.id.in_(chunk)).delete(synchronize_session=False)
+    if pairs:
+        _touch_data_versions(db, "stock_movements")
+    db.commit()
+    return snapshots, len(reversal_ids) + len(original_ids)
+
+ARCHIVE_STORAGES = ('table', 'parquet')
+
+def archive_stock_movements(db: Session, before: datetime, storage: str = 'table', directory: str = None):
+    """
+    Arquiva as movimentações com movement_date anterior a `before` (início de um mês já encerrado),
+    um mês por transação: os itens de cada mês vão para o arquivo frio (storage "table": partição
+    mensal de stock_movement_archive; "parquet": um arquivo em `directory`, comprimido com zstd),
+    os totais entram nos saldos de abertura de cada produto (stock_opening_balances) e as
+    movimentações saem de stock_movements e stock_movement_items, que ficam só com os dados recentes.
+    Antes, grava a fotografia dos saldos em `before`, de onde as consultas de estoque a partir do
+    limite partem sem ler o arquivo; as consultas anteriores somam também os itens arquivados, e
+    saldos, fotografias e verify continuam com os mesmos resultados. Lançamentos que apontam para
+    uma movimentação arquivada mantêm a referência, e os que corrigem uma delas não podem mais ser corrigidos.
+    Pode ser executado de novo com o mesmo limite, por exemplo após movimentações com data retroativa.
+    Retorna [(início do mês, movimentações, itens)] para cada mês arquivado.
+    """
+    before = _naive(before)
+    if storage not in ARCHIVE_STORAGES:
+        raise ValueError(f"Invalid archive storage {storage!r}: expected one of {', '.join(ARCHIVE_STORAGES)}")
+    if storage == 'parquet' and not directory:
+        raise ValueError("A directory is required to archive to Parquet files")
+    if before != _month_start(before):
+        raise ValueError(f"The archive boundary must be the start of a month, got {before.isoformat()}")
+    if before > _month_start(datetime.now(timezone.utc).replace(tzinfo=None)):
+        raise ValueError("Only closed months can be archived")
+
+    create_stock_snapshots(db, before)
+    archived = []
+    oldest = db.query(func.min(StockMovementModel.movement_date)).filter(StockMovementModel.movement_date < before).scalar()
+    month = _month_start(oldest) if oldest is not None else before
+    while month < before:
+        next_month = _month_start(month + timedelta(days=31))
+        counts = _archive_month(db, month, next_month, before, storage, directory)
+        if counts:
+            archived.append((month, *counts))
+        month = next_month
+    return archived
+
+def _archive_month(db: Session, month: datetime, next_month: datetime, before: datetime, storage: str, directory: str):
+    # Arquiva as movimentações de [month, next_month) e faz o commit; retorna (movimentações, itens), ou None se não houver
+    movements = StockMovementModel.__table__
+    items = StockMovementItemModel.__table__
+    result = db.execute(select(
+        movements.c.id, movements.c.movement_date, movements.c.type, items.c.product_id, items.c.quantity,
+        movements.c.reverses_movement_id, movements.c.replaces_movement_id, movements.c.recorded_at,
+    ).select_from(movements.outerjoin(items, items.c.movement_id == movements.c.id)).where(
+        movements.c.movement_date >= month, movements.c.movement_date < next_month
+    ).order_by(movements.c.id, items.c.id))
+
+    # Uma linha por item, na ordem de archive.COLUMNS; movimentações sem itens ficam com uma linha sem produto
+    rows = []
+    totals = {}
+    for movement_id, lines in groupby(result, key=lambda row: row.id):
+        for line, row in enumerate(lines):
+            rows.append((
+                movement_id, line, row.movement_date, row.type, row.product_id, row.quantity,
+                row.reverses_movement_id, row.replaces_movement_id, row.recorded_at,
+            ))
+            if row.product_id is not None and row.type in STOCK_SIGNS:
+                entries, exits = totals.get(row.product_id, (0, 0))
+                totals[row.product_id] = (entries + row.quantity, exits) if row.type == 'entrada' else (entries, exits + row.quantity)
+    if not rows:
+        return None
+    movement_ids = list(dict.fromkeys(row[0] for row in rows))
+
+    if storage == 'table':
+        location = _archive_partition(db, month, next_month)
+        archive_table = StockMovementArchiveModel.__table__
+        for start in range(0, len(rows), ROWS_IN_BATCH_SIZE):
+            db.execute(insert(archive_table), [dict(zip(archive.COLUMNS, row)) for row in rows[start:start + ROWS_IN_BATCH_SIZE]])
+    else:
+        location = archive.write_movements(rows, directory, month)
+
+    if totals:
+        statement = dialect_insert(db, StockOpeningBalanceModel)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[StockOpeningBalanceModel.product_id],
+            set_={
+                "entries": StockOpeningBalanceModel.entries + statement.excluded.entries,
+                "exits": StockOpeningBalanceModel.exits + statement.excluded.exits,
+                "archived_before": statement.excluded.archived_before,
+            },
+        ), [
+            {"product_id": product_id, "entries": entries, "exits": exits, "archived_before": before}
+            for product_id, (entries, exits) in sorted(totals.items())
+        ])
 
-        # Calcula a quantidade total de entradas
-        total_entries = sum(item.quantity for item in entries)
+    # Estornos têm a data do original e são arquivados com ele; correções de meses seguintes continuam
+    # apontando para o original arquivado (replaces_movement_id, sem FK) e não podem mais ser corrigidas
+    for start in range(0, len(movement_ids), ROWS_IN_BATCH_SIZE):
+        chunk = movement_ids[start:start + ROWS_IN_BATCH_SIZE]
+        # Itens explicitamente, para bancos sem FKs ativas (como o SQLite)
+        db.query(StockMovementItemModel).filter(StockMovementItemModel.movement_id.in_(chunk)).delete(synchronize_session=False)
+        db.query(StockMovementModel).filter(StockMovementModel.id.in_(chunk)).delete(synchronize_session=False)
 
-        # Calcula a quantidade total de saídas
-        total_exits = sum(item.quantity for item in exits)
+    item_count = sum(1 for row in rows if row[4] is not None)
+    db.add(StockArchiveModel(
+        period_start=month, period_end=next_month, archived_before=before, storage=storage, location=location,
+        movements=len(movement_ids), items=item_count,
+    ))
+    _touch_data_versions(db, "stock_movements")
+    db.commit()
+    return len(movement_ids), item_count
+
+def _archive_partition(db: Session, month: datetime, next_month: datetime):
+    # Partição mensal de stock_movement_archive (PostgreSQL), criada se ainda não existir; retorna onde as linhas ficam
+    if db.get_bind().dialect.name != "postgresql":
+        return StockMovementArchiveModel.__tablename__
+    name = f"{StockMovementArchiveModel.__tablename__}_{month:%Y_%m}"
+    db.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {StockMovementArchiveModel.__tablename__} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+    ))
+    return name
+
+def _month_start(value: datetime):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def calculate_stock(db: Session, product_id: int, at: datetime = None, versions=None):
+    stocks = calculate_stocks(db, [product_id], at=at, versions=versions)
+    if stocks:
+        return stocks[0]
+    else:
+        return {"error": "Product not found"}
 
-        # Calcula o estoque atual subtraindo as saídas das entradas
-        stock = total_entries - total_exits
+def calculate_stocks(db: Session, product_ids, at: datetime = None, versions=None):
+    """
+    Estoque de vários produtos, pelo cache (ver cache.py); só os produtos ausentes do cache são consultados.
+    Validações de disponibilidade não devem usar o cache: elas chamam _query_stocks, dentro da transação.
+    Com `at`, retorna o estoque naquele instante (ver calculate_stocks_at), sem passar pelo cache.
+    `versions` são as versões de STOCK_VERSIONS já lidas pela rota (get_data_versions), se houver.
+    """
+    if at is not None:
+        return calculate_stocks_at(db, product_ids, at)
+    version = _cache_version(db, STOCK_VERSIONS, versions)
+    cached = cache.get_many("stock", product_ids, version)
+    stocks = {product_id: StockCalculationResponse.model_validate(value) for product_id, value in cached.items()}
+    missing = [product_id for product_id in dict.fromkeys(product_ids) if product_id not in cached]
+    if missing:
+        loaded = _query_stocks(db, missing)
+        cache.set_many("stock", {stock.product_id: stock.model_dump(mode="json") for stock in loaded}, version)
+        stocks.update((stock.product_id, stock) for stock in loaded)
 
-        return StockCalculationResponse(
+    # Mantém a ordem pedida, ignorando IDs repetidos e produtos inexistentes
+    return [stocks[product_id] for product_id in dict.fromkeys(product_ids) if product_id in stocks]
+
+def warm_caches(db: Session, limit: int):
+    """
+    Carrega no cache (cache.py) os produtos e os estoques dos `limit` produtos movimentados mais
+    recentemente, completando com os primeiros produtos por id; usada ao iniciar o processo
+    (health.warm_up). Retorna quantos produtos foram carregados.
+    """
+    recent = db.query(StockMovementItemModel.product_id).order_by(StockMovementItemModel.id.desc()).limit(limit * 10)
+    product_ids = list(dict.fromkeys(product_id for product_id, in recent))[:limit]
+    if len(product_ids) < limit:
+        first = db.query(ProductModel.id).order_by(ProductModel.id).limit(limit)
+        product_ids = list(dict.fromkeys(product_ids + [product_id for product_id, in first]))[:limit]
+    version = _cache_version(db, PRODUCT_VERSIONS)
+    products = db.query(ProductModel).filter(ProductModel.id.in_(product_ids)).all()
+    cache.set_many("product", {
+        product.id: ProductResponse.model_validate(product).model_dump(mode="json") for product in products
+    }, version)
+    calculate_stocks(db, product_ids)
+    return len(products)
+
+def _query_stocks(db: Session, product_ids):
+    # Estoque de vários produtos em uma única consulta: produtos + saldo materializado
+    rows = db.query(ProductModel, StockBalanceModel.quantity).outerjoin(
+        StockBalanceModel, StockBalanceModel.product_id == ProductModel.id
+    ).filter(ProductModel.id.in_(set(product_ids))).all()
+
+    # Produtos anteriores à tabela de saldos: calcula pelo histórico, também em uma única consulta
+    missing = [product.id for product, stock in rows if stock is None]
+    totals = get_stock_totals(db, missing) if missing else {}
+
+    stocks = {}
+    for product, stock in rows:
+        if stock is None:
+            entries, exits = totals.get(product.id, (0, 0))
+            stock = entries - exits
+        stocks[product.id] = StockCalculationResponse(
             product_id=product.id,
             product_name=product.name,
             current_stock=stock,
             description=product.description
         )
+
+    # Mantém a ordem pedida, ignorando IDs repetidos e produtos inexistentes
+    return [stocks[product_id] for product_id in dict.fromkeys(product_ids) if product_id in stocks]
+
+def get_stock_totals(db: Session, product_ids=None):
+    """
+    Totais de entrada e saída por produto, agregados no banco com um único SUM(CASE ...)
+    agrupado por produto, sem carregar os itens como objetos, mais os saldos de abertura das
+    movimentações arquivadas (ver archive_stock_movements).
+    Retorna {product_id: (total_entradas, total_saídas)}; produtos sem itens nem saldo de abertura não aparecem.
+    """
+    totals = {
+        product_id: (int(entries or 0), int(exits or 0))
+        for product_id, entries, exits in stock_totals_query(db, product_ids).all()
+    }
+    openings = db.query(StockOpeningBalanceModel.product_id, StockOpeningBalanceModel.entries, StockOpeningBalanceModel.exits)
+    if product_ids is not None:
+        openings = openings.filter(StockOpeningBalanceModel.product_id.in_(product_ids))
+    for product_id, entries, exits in openings:
+        hot_entries, hot_exits = totals.get(product_id, (0, 0))
+        totals[product_id] = (hot_entries + entries, hot_exits + exits)
+    return totals
+
+def stock_totals_query(db: Session, product_ids=None):
+    # Consulta usada por get_stock_totals; exposta para inspeção do plano (migrations.py explain)
+    query = db.query(
+        StockMovementItemModel.product_id,
+        func.sum(case((StockMovementModel.type == 'entrada', StockMovementItemModel.quantity), else_=0)),
+        func.sum(case((StockMovementModel.type == 'saída', StockMovementItemModel.quantity), else_=0)),
+    ).join(StockMovementModel).group_by(StockMovementItemModel.product_id)
+    if product_ids is not None:
+        query = query.filter(StockMovementItemModel.product_id.in_(product_ids))
+    return query
+
+def _check_stock_availability(db: Session, movement_type: str, items):
+    # Os produtos são conferidos em todas as movimentações; o saldo, apenas nas saídas
+
+    # Linhas repetidas do mesmo produto são somadas, para não validarem cada uma contra o saldo inteiro
+    requested = {}
+    for item in items:
+        requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+    if not requested:
+        return []
+
+    # Disponibilidade de todos os produtos da movimentação em uma única consulta
+    available = {stock.product_id: stock.current_stock for stock in _query_stocks(db, list(requested))}
+
+    # Lista para armazenar mensagens de erro
+    errors = []
+    for product_id, quantity in requested.items():
+        if product_id not in available:
+            errors.append(f"Product ID {product_id} not found")
+        elif movement_type == 'saída' and quantity > available[product_id]:
+            errors.append(f"Not enough stock for product ID {product_id}. Available: {available[product_id]}, Requested: {quantity}")
+    return errors
+
+def _check_stock_deltas(db: Session, deltas: dict, action: str):
+    """
+    Validação das exclusões e alterações, antes de gravá-las: bloqueia os saldos dos produtos cuja
+    variação líquida é negativa e levanta HTTPException 400, com o mesmo Error das inclusões, se
+    algum deles ficar negativo. Produtos que não existem mais não têm saldo a proteger.
+    """
+    requested = {product_id: -delta for product_id, delta in deltas.items() if delta < 0}
+    if not requested:
+        return
+    _lock_stock_balances(db, list(requested))
+    available = {stock.product_id: stock.current_stock for stock in _query_stocks(db, list(requested))}
+    errors = [
+        f"Not enough stock for product ID {product_id}. Available: {available[product_id]}, Requested: {quantity}"
+        for product_id, quantity in sorted(requested.items())
+        if product_id in available and quantity > available[product_id]
+    ]
+    if errors:
+        db.rollback()  # Libera os bloqueios da movimentação e dos saldos
+        raise HTTPException(
+            status_code=400,
+            detail=Error(error=f"Failed to {action} movement due to stock limitations", details=errors).model_dump()
+        )
+
+# Funções de manutenção do saldo materializado (tabela stock_balances)
+def _lock_stock_balances(db: Session, product_ids):
+    """
+    Bloqueia (SELECT ... FOR UPDATE) as linhas de saldo dos produtos até o fim da transação.
+    As linhas são sempre bloqueadas em ordem de product_id, evitando deadlocks entre movimentações
+    que envolvem os mesmos produtos em ordens diferentes. Somente produtos com linha em stock_balances
+    são serializados; produtos antigos ganham a linha com `python stock_balances.py rebuild`.
+    """
+    db.query(StockBalanceModel.product_id).filter(
+        StockBalanceModel.product_id.in_(set(product_ids))
+    ).order_by(StockBalanceModel.product_id).with_for_update().all()
+
+def _movement_deltas(movement_type: str, items):
+    # Soma as quantidades por produto, já com o sinal do tipo da movimentação
+    sign = STOCK_SIGNS.get(movement_type, 0)
+    deltas = {}
+    for item in items:
+        deltas[item.product_id] = deltas.get(item.product_id, 0) + sign * item.quantity
+    return deltas
+
+def _stock_from_history(db: Session, product_ids=None):
+    # Saldo pelo histórico de itens: {product_id: entradas - saídas}
+    return {product_id: entries - exits for product_id, (entries, exits) in get_stock_totals(db, product_ids).items()}
+
+def _apply_stock_deltas(db: Session, deltas: dict):
+    """
+    Aplica as variações de saldo na transação corrente, sem commit.
+    Deve ser chamada antes do flush da mutação: produtos ainda sem linha em stock_balances
+    são inicializados pelo histórico gravado até aqui, e só então recebem a variação.
+    """
+    # Ordenado por product_id, para que os bloqueios implícitos do UPDATE sigam sempre a mesma ordem
+    deltas = {product_id: delta for product_id, delta in sorted(deltas.items()) if delta}
+    if not deltas:
+        return
+
+    existing = {
+        product_id for (product_id,) in db.query(StockBalanceModel.product_id).filter(
+            StockBalanceModel.product_id.in_(deltas)
+        )
+    }
+    missing = [product_id for product_id in deltas if product_id not in existing]
+    history = _stock_from_history(db, missing) if missing else {}
+
+    # Um único UPDATE ... SET quantity = quantity + :delta executado em lote (executemany)
+    updates = [{"b_product_id": product_id, "b_delta": delta} for product_id, delta in deltas.items() if product_id in existing]
+    if updates:
+        balances = StockBalanceModel.__table__
+        db.execute(
+            update(balances)
+            .where(balances.c.product_id == bindparam("b_product_id"))
+            .values(quantity=balances.c.quantity + bindparam("b_delta")),
+            updates,
+        )
+
+    for product_id in missing:
+        db.add(StockBalanceModel(product_id=product_id, quantity=history.get(product_id, 0) + deltas[product_id]))
+
+def verify_stock_balances(db: Session):
+    # Compara os saldos gravados com o histórico; retorna (product_id, gravado, esperado) para cada divergência
+    stored = {product_id: quantity for product_id, quantity in db.query(
+        StockBalanceModel.product_id, StockBalanceModel.quantity
+    )}
+    expected = _stock_from_history(db)
+    product_ids = [product_id for (product_id,) in db.query(ProductModel.id).order_by(ProductModel.id)]
+
+    drift = []
+    for product_id in product_ids:
+        if stored.get(product_id) != expected.get(product_id, 0):
+            drift.append((product_id, stored.get(product_id), expected.get(product_id, 0)))
+    return drift
+
+def rebuild_stock_balances(db: Session):
+    # Corrige as divergências encontradas por verify_stock_balances e retorna a lista corrigida
+    drift = verify_stock_balances(db)
+    for product_id, stored, expected in drift:
+        if stored is None:
+            db.add(StockBalanceModel(product_id=product_id, quantity=expected))
+        else:
+            db.query(StockBalanceModel).filter(StockBalanceModel.product_id == product_id).update(
+                {StockBalanceModel.quantity: expected}, synchronize_session=False
+            )
+    if drift:
+        _touch_data_versions(db, "stock_movements")
+    db.commit()
+    cache.invalidate("stock", [product_id for product_id, stored, expected in drift])
+    return drift
+
+# Ingestão de movimentações em lote (movement_ingest.py)
+def start_ingest_checkpoint(db: Session, batch_id: str, digest: str, total: int):
+    # Checkpoint do lote, criado na primeira execução; um lote não pode ser retomado com outro conteúdo
+    db.execute(dialect_insert(db, IngestCheckpointModel).values(
+        batch_id=batch_id, digest=digest, total=total, position=0, applied=0, rejected=0, updated_at=datetime.now()
+    ).on_conflict_do_nothing(index_elements=[IngestCheckpointModel.batch_id]))
+    db.commit()
+    checkpoint = db.get(IngestCheckpointModel, batch_id)
+    if checkpoint.digest != digest:
+        raise ValueError(f"Batch {batch_id} was started with a different file")
+    return checkpoint
+
+def ingest_stock_movements(db: Session, batch_id: str, movements, position: int):
+    """
+    Aplica um trecho de um lote de movimentações, já em ordem de data, e avança o checkpoint
+    na mesma transação. `movements` são pares (linha, StockMovementWithItemsCreate) e `position`
+    é a posição do checkpoint esperada no início do trecho.
+    Os saldos dos produtos do trecho são bloqueados e lidos uma única vez; a partir daí cada
+    movimentação é validada contra o saldo corrente em memória. Movimentações sem estoque ou com
+    produtos inexistentes são recusadas inteiras, sem interromper as demais.
+    Retorna (quantidade aplicada, [(linha, erro)]).
+    """
+    # Bloqueia o checkpoint, para que duas execuções do mesmo lote não apliquem o mesmo trecho
+    checkpoint = db.query(IngestCheckpointModel).filter(
+        IngestCheckpointModel.batch_id == batch_id
+    ).with_for_update().one()
+    if checkpoint.position != position:
+        db.rollback()
+        raise ValueError(f"Batch {batch_id} checkpoint is at {checkpoint.position}, expected {position}")
+
+    product_ids = sorted({item.product_id for _, movement in movements for item in movement.items})
+    _lock_stock_balances(db, product_ids)
+    balances = {stock.product_id: stock.current_stock for stock in _query_stocks(db, product_ids)}
+
+    accepted = []
+    errors = []
+    deltas = {}
+    dated_deltas = []
+    for row, movement in movements:
+        movement_deltas = _movement_deltas(movement.type, movement.items)
+        problems = []
+        for product_id, delta in movement_deltas.items():
+            if product_id not in balances:
+                problems.append(f"Product ID {product_id} not found")
+            elif balances[product_id] + delta < 0:
+                problems.append(f"Not enough stock for product ID {product_id}. Available: {balances[product_id]}, Requested: {-delta}")
+        if problems:
+            errors.append((row, "; ".join(problems)))
+            continue
+        for product_id, delta in movement_deltas.items():
+            balances[product_id] += delta
+            deltas[product_id] = deltas.get(product_id, 0) + delta
+        accepted.append(movement)
+        dated_deltas.append((movement.movement_date, movement_deltas))
+
+    # Saldos antes dos itens (ver _apply_stock_deltas); cabeçalhos e itens em dois INSERTs em lote
+    _apply_stock_deltas(db, deltas)
+    _apply_snapshot_deltas(db, dated_deltas)
+    if accepted:
+        movement_ids = db.scalars(
+            insert(StockMovementModel).returning(StockMovementModel.id, sort_by_parameter_order=True),
+            [{"type": movement.type, "movement_date": movement.movement_date} for movement in accepted],
+        ).all()
+        items = [
+            {"movement_id": movement_id, "product_id": item.product_id, "quantity": item.quantity}
+            for movement_id, movement in zip(movement_ids, accepted)
+            for item in movement.items
+        ]
+        if items:
+            db.execute(insert(StockMovementItemModel), items)
+
+    checkpoint.position = position + len(movements)
+    checkpoint.applied += len(accepted)
+    checkpoint.rejected += len(errors)
+    checkpoint.updated_at = datetime.now()
+    if checkpoint.position >= checkpoint.total:
+        checkpoint.completed_at = checkpoint.updated_at
+    if accepted:
+        _touch_data_versions(db, "stock_movements")
+    db.commit()  # Movimentações, saldos e checkpoint juntos
+    cache.invalidate("stock", deltas)
+    return len(accepted), errors
+
+# Versões dos dados (tabela data_versions), usadas nos ETags das rotas de leitura
+def get_data_versions(db: Session, names):
+    # (versão, atualizado em) de cada nome, na ordem pedida
+    rows = {
+        name: (version, updated_at) for name, version, updated_at in db.query(
+            DataVersionModel.name, DataVersionModel.version, DataVersionModel.updated_at
+        ).filter(DataVersionModel.name.in_(names))
+    }
+    return [rows.get(name, (0, datetime(1970, 1, 1))) for name in names]
+
+def _cache_version(db: Session, names, versions=None):
+    # Versão das entradas do cache (ver cache.py): os contadores de `names`, lidos antes da consulta dos dados
+    if versions is None:
+        versions = get_data_versions(db, names)
+    return ".".join(str(version) for version, _ in versions)
+
+def _touch_data_versions(db: Session, *names):
+    """
+    Incrementa as versões na transação corrente, sem commit.
+    Deve ser o último comando antes do commit: a linha do contador fica bloqueada até o fim
+    da transação, e toda alteração do mesmo conjunto de dados passa por ela.
+    """
+    versions = DataVersionModel.__table__
+    db.execute(
+        update(versions)
+        .where(versions.c.name.in_(names))
+        .values(version=versions.c.version + 1, updated_at=datetime.now(timezone.utc).replace(tzinfo=None))
+    )
+
+# Estoque histórico, por movement_date, e fotografias periódicas (tabela stock_snapshots)
+SERIES_INTERVALS = ('day', 'week', 'month')
+MAX_SERIES_POINTS = 3660
+
+def calculate_stocks_at(db: Session, product_ids, at: datetime):
+    # Estoque de vários produtos no instante `at` (movimentações com movement_date <= at), na ordem pedida
+    products = {
+        product.id: product
+        for product in db.query(ProductModel).filter(ProductModel.id.in_(set(product_ids)))
+    }
+    stocks = get_stocks_at(db, list(products), at)
+    return [
+        StockCalculationResponse(
+            product_id=product_id,
+            product_name=products[product_id].name,
+            current_stock=stocks.get(product_id, 0),
+            description=products[product_id].description,
+            as_of=at,
+        )
+        for product_id in dict.fromkeys(product_ids) if product_id in products
+    ]
+
+def get_stocks_at(db: Session, product_ids, at: datetime, inclusive: bool = True):
+    """
+    Saldo de cada produto em `at`: {product_id: saldo}; produtos sem movimentações até lá não aparecem.
+    Parte da fotografia mais recente com snapshot_at <= at e soma apenas os itens a partir dela,
+    em duas consultas agregadas. Com inclusive=False, as movimentações exatamente em `at` não entram.
+    """
+    if not product_ids:
+        return {}
+    snapshots = StockSnapshotModel.__table__
+    latest = select(
+        snapshots.c.product_id, func.max(snapshots.c.snapshot_at).label("snapshot_at")
+    ).where(snapshots.c.product_id.in_(product_ids), snapshots.c.snapshot_at <= at).group_by(snapshots.c.product_id).subquery()
+
+    stocks = {
+        product_id: quantity for product_id, quantity in db.execute(
+            select(snapshots.c.product_id, snapshots.c.quantity).join(latest, (snapshots.c.product_id == latest.c.product_id) & (snapshots.c.snapshot_at == latest.c.snapshot_at))
+        )
+    }
+
+    movement_date = StockMovementModel.movement_date
+    query = db.query(StockMovementItemModel.product_id, func.sum(_signed_quantity())).join(StockMovementModel).outerjoin(
+        latest, latest.c.product_id == StockMovementItemModel.product_id
+    ).filter(
+        StockMovementItemModel.product_id.in_(product_ids),
+        movement_date <= at if inclusive else movement_date < at,
+        or_(latest.c.snapshot_at.is_(None), movement_date >= latest.c.snapshot_at),
+    ).group_by(StockMovementItemModel.product_id)
+    for product_id, delta in query:
+        stocks[product_id] = stocks.get(product_id, 0) + int(delta or 0)
+
+    # Antes do limite do arquivamento, os itens anteriores à fotografia podem estar no arquivo frio
+    boundary = get_archive_boundary(db)
+    if boundary is not None and _naive(at) < boundary:
+        for product_id, delta in _archived_stock_deltas(db, product_ids, latest, _naive(at), inclusive).items():
+            stocks[product_id] = stocks.get(product_id, 0) + delta
+    return stocks
+
+def _archived_stock_deltas(db: Session, product_ids, latest, at: datetime, inclusive: bool):
+    # Variação de cada produto pelos itens arquivados entre a fotografia de partida (`latest`) e `at`
+    storages = {storage for (storage,) in db.query(StockArchiveModel.storage).filter(StockArchiveModel.period_start <= at).distinct()}
+    deltas = {}
+    if "table" in storages:
+        archived = StockMovementArchiveModel.__table__
+        movement_date = archived.c.movement_date
+        signed = case(
+            (archived.c.type == 'entrada', archived.c.quantity),
+            (archived.c.type == 'saída', -archived.c.quantity),
+            else_=0,
+        )
+        query = select(archived.c.product_id, func.sum(signed)).outerjoin(
+            latest, latest.c.product_id == archived.c.product_id
+        ).where(
+            archived.c.product_id.in_(product_ids),
+            movement_date <= at if inclusive else movement_date < at,
+            or_(latest.c.snapshot_at.is_(None), movement_date >= latest.c.snapshot_at),
+        ).group_by(archived.c.product_id)
+        for product_id, delta in db.execute(query):
+            deltas[product_id] = deltas.get(product_id, 0) + int(delta or 0)
+    if "parquet" in storages:
+        since = {product_id: snapshot_at for product_id, snapshot_at in db.execute(select(latest.c.product_id, latest.c.snapshot_at))}
+        files = db.query(StockArchiveModel.location).filter(StockArchiveModel.storage == "parquet", StockArchiveModel.period_start <= at)
+        if len(since) == len(set(product_ids)):
+            # Todos os produtos partem de uma fotografia: os meses anteriores à mais antiga não entram
+            files = files.filter(StockArchiveModel.period_end > min(since.values()))
+        paths = [location for (location,) in files.order_by(StockArchiveModel.id)]
+        for product_id, delta in archive.read_stock_deltas(paths, product_ids, since, at, inclusive, STOCK_SIGNS).items():
+            deltas[product_id] = deltas.get(product_id, 0) + delta
+    return deltas
+
+def get_archive_boundary(db: Session):
+    # Limite do arquivamento mais recente (movimentações anteriores podem estar arquivadas), ou None
+    return db.query(func.max(StockArchiveModel.archived_before)).scalar()
+
+def get_stock_series(db: Session, product_id: int, interval: str, date_from: date, date_to: date):
+    """
+    Série de saldos de um produto por dia, semana (iniciada na segunda-feira) ou mês.
+    Entradas e saídas de cada período são somadas no banco, e o saldo acumulado é calculado com
+    SUM(...) OVER (ORDER BY período) a partir do saldo anterior ao primeiro período.
+    Períodos sem movimentações repetem o saldo do anterior. Retorna None se o produto não existir.
+    """
+    if interval not in SERIES_INTERVALS:
+        raise ValueError(f"Invalid interval {interval!r}")
+    if db.query(ProductModel.id).filter(ProductModel.id == product_id).first() is None:
+        return None
+    periods = _period_starts(interval, date_from, date_to)
+    if len(periods) > MAX_SERIES_POINTS:
+        raise ValueError(f"Series would have {len(periods)} points; the maximum is {MAX_SERIES_POINTS}")
+
+    start = datetime.combine(periods[0], time.min)
+    end = datetime.combine(date_to + timedelta(days=1), time.min)
+    # As entradas e saídas de cada período são somadas nas tabelas principais, sem o arquivo frio
+    boundary = get_archive_boundary(db)
+    if boundary is not None and start < boundary:
+        raise ValueError(f"Stock history before {boundary.isoformat()} is archived; the series must start on or after it")
+    opening = get_stocks_at(db, [product_id], start, inclusive=False).get(product_id, 0)
+
+    period = _period_start_expression(db, interval).label("period")
+    rows = db.query(
+        period,
+        func.sum(case((StockMovementModel.type == 'entrada', StockMovementItemModel.quantity), else_=0)),
+        func.sum(case((StockMovementModel.type == 'saída', StockMovementItemModel.quantity), else_=0)),
+        func.sum(func.sum(_signed_quantity())).over(order_by=period),
+    ).join(StockMovementModel).filter(
+        StockMovementItemModel.product_id == product_id,
+        StockMovementModel.movement_date >= start,
+        StockMovementModel.movement_date < end,
+    ).group_by(period).all()
+    totals = {_as_date(row[0]): row[1:] for row in rows}
+
+    points = []
+    running = 0
+    for period_start in periods:
+        entries, exits, running_total = totals.get(period_start, (0, 0, running))
+        running = int(running_total or 0)
+        points.append(StockSeriesPoint(
+            period_start=period_start, entries=int(entries or 0), exits=int(exits or 0), closing_stock=opening + running
+        ))
+    return StockSeriesResponse(
+        product_id=product_id, interval=interval, date_from=periods[0], date_to=date_to,
+        opening_stock=opening, points=points,
+    )
+
+def create_stock_snapshots(db: Session, at: datetime):
+    """
+    Grava (ou recalcula) a fotografia de todos os produtos em `at`, com as movimentações anteriores
+    a esse instante. Retorna a quantidade de produtos fotografados.
+    """
+    product_ids = [product_id for (product_id,) in db.query(ProductModel.id)]
+    stocks = get_stocks_at(db, product_ids, at, inclusive=False)
+    rows = [{"product_id": product_id, "snapshot_at": at, "quantity": stocks.get(product_id, 0)} for product_id in product_ids]
+    if rows:
+        statement = dialect_insert(db, StockSnapshotModel)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[StockSnapshotModel.product_id, StockSnapshotModel.snapshot_at],
+            set_={"quantity": statement.excluded.quantity},
+        ), rows)
+    db.commit()
+    return len(rows)
+
+def _signed_quantity():
+    # Quantidade do item com o sinal do tipo da movimentação (ver STOCK_SIGNS)
+    return case(
+        (StockMovementModel.type == 'entrada', StockMovementItemModel.quantity),
+        (StockMovementModel.type == 'saída', -StockMovementItemModel.quantity),
+        else_=0,
+    )
+
+def _period_start_expression(db: Session, interval: str):
+    # Início do período de movement_date; `interval` já validado, usado como literal no SQL
+    column = StockMovementModel.movement_date
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(literal_column(f"'{interval}'"), column)
+    if interval == 'day':
+        return func.date(column)
+    if interval == 'week':
+        return func.date(column, literal_column("'weekday 0'"), literal_column("'-6 days'"))
+    return func.strftime(literal_column("'%Y-%m-01'"), column)
+
+def _as_date(value):
+    # date_trunc (PostgreSQL) retorna datetime; as funções de data do SQLite retornam texto
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def _period_starts(interval: str, date_from: date, date_to: date):
+    if interval == 'week':
+        current = date_from - timedelta(days=date_from.weekday())
+    elif interval == 'month':
+        current = date_from.replace(day=1)
     else:
-        return {"error": "Product not found"}
\ No newline at end of file
+        current = date_from
+    periods = []
+    while current <= date_to and len(periods) <= MAX_SERIES_POINTS:
+        periods.append(current)
+        if interval == 'day':
+            current += timedelta(days=1)
+        elif interval == 'week':
+            current += timedelta(days=7)
+        else:
+            current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return periods
+
+def _apply_snapshot_deltas(db: Session, dated_deltas):
+    """
+    Corrige as fotografias posteriores à data de cada movimentação, na transação corrente.
+    `dated_deltas` são pares (movement_date, {product_id: variação}). Uma consulta ao
+    snapshot_at mais recente evita o UPDATE no caso comum de movimentações mais novas que
+    todas as fotografias.
+    """
+    latest = db.query(func.max(StockSnapshotModel.snapshot_at)).scalar()
+    if latest is None:
+        return
+    updates = [
+        {"b_product_id": product_id, "b_movement_date": movement_date, "b_delta": delta}
+        for movement_date, deltas in dated_deltas if _naive(movement_date) < latest
+        for product_id, delta in sorted(deltas.items()) if delta
+    ]
+    if updates:
+        snapshots = StockSnapshotModel.__table__
+        db.execute(
+            update(snapshots)
+            .where(snapshots.c.product_id == bindparam("b_product_id"), snapshots.c.snapshot_at > bindparam("b_movement_date"))
+            .values(quantity=snapshots.c.quantity + bindparam("b_delta")),
+            updates,
+        )
+
+def _naive(value: datetime):
+    # Datas com fuso em UTC sem fuso, para comparação com as colunas DateTime
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo is not None else value
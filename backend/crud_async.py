@@ -0,0 +1,89 @@
+"""
+Versões assíncronas das funções de crud.py, usadas pelas rotas de router_async.
+
+Cada função executa a função síncrona correspondente com AsyncSession.run_sync: o código SQLAlchemy
+de crud.py roda sobre a conexão assíncrona (asyncpg) e cada ida ao banco é aguardada sem bloquear o
+event loop. Assim as regras (saldos, validação, bloqueios) ficam em um único lugar.
+Os resultados são convertidos nos schemas de resposta ainda dentro do run_sync, pois fora dele
+o carregamento tardio de atributos (lazy load) não é permitido.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+from schemas import ProductCreate, ProductUpdate, ProductResponse, StockMovementWithItemsCreate, StockMovementResponse
+
+
+def _validated(schema, obj):
+    return None if obj is None else schema.model_validate(obj, from_attributes=True)
+
+
+def _validated_list(schema, objs):
+    return [schema.model_validate(obj, from_attributes=True) for obj in objs]
+
+
+# Funções CRUD para Produtos
+async def create_product(db: AsyncSession, product_data: ProductCreate):
+    return await db.run_sync(lambda session: _validated(ProductResponse, crud.create_product(session, product_data)))
+
+async def get_product(db: AsyncSession, product_id: int, versions=None):
+    return await db.run_sync(
+        lambda session: _validated(ProductResponse, crud.get_product(session, product_id, versions=versions))
+    )
+
+async def get_products(db: AsyncSession, after_id: int = None, limit: int = None, name: str = None):
+    return await db.run_sync(
+        lambda session: _validated_list(
+            ProductResponse, crud.get_products(session, after_id=after_id, limit=limit, name=name)
+        )
+    )
+
+async def get_product_rows(db: AsyncSession, after_id: int = None, limit: int = None, name: str = None):
+    return await db.run_sync(lambda session: crud.get_product_rows(session, after_id=after_id, limit=limit, name=name))
+
+async def update_product(db: AsyncSession, product_id: int, product_data: ProductUpdate):
+    return await db.run_sync(
+        lambda session: _validated(ProductResponse, crud.update_product(session, product_id, product_data))
+    )
+
+async def delete_product(db: AsyncSession, product_id: int):
+    return await db.run_sync(lambda session: _validated(ProductResponse, crud.delete_product(session, product_id)))
+
+# Funções CRUD para Movimentações de Estoque
+async def create_stock_movement(db: AsyncSession, movement_data: StockMovementWithItemsCreate, lock_stock: bool = True, idempotency_key: str = None):
+    return await db.run_sync(lambda session: _validated(
+        StockMovementResponse,
+        crud.create_stock_movement(session, movement_data, lock_stock=lock_stock, idempotency_key=idempotency_key),
+    ))
+
+async def get_stock_movements(db: AsyncSession, **filters):
+    # Aceita os mesmos filtros e parâmetros de paginação de crud.get_stock_movements
+    return await db.run_sync(
+        lambda session: _validated_list(StockMovementResponse, crud.get_stock_movements(session, **filters))
+    )
+
+async def get_stock_movement_rows(db: AsyncSession, **filters):
+    return await db.run_sync(lambda session: crud.get_stock_movement_rows(session, **filters))
+
+async def get_stock_movement(db: AsyncSession, movement_id: int):
+    return await db.run_sync(
+        lambda session: _validated(StockMovementResponse, crud.get_stock_movement(session, movement_id))
+    )
+
+async def delete_stock_movement(db: AsyncSession, movement_id: int):
+    return await db.run_sync(
+        lambda session: _validated(StockMovementResponse, crud.delete_stock_movement(session, movement_id))
+    )
+
+async def update_stock_movement(db: AsyncSession, movement_id: int, movement_data: StockMovementWithItemsCreate):
+    return await db.run_sync(lambda session: _validated(
+        StockMovementResponse, crud.update_stock_movement(session, movement_id, movement_data)
+    ))
+
+async def calculate_stock(db: AsyncSession, product_id: int, at=None, versions=None):
+    return await db.run_sync(lambda session: crud.calculate_stock(session, product_id, at=at, versions=versions))
+
+async def calculate_stocks(db: AsyncSession, product_ids, at=None, versions=None):
+    return await db.run_sync(lambda session: crud.calculate_stocks(session, product_ids, at=at, versions=versions))
+
+async def get_data_versions(db: AsyncSession, names):
+    return await db.run_sync(lambda session: crud.get_data_versions(session, names))
@@ -0,0 +1,103 @@
+"""
+Inicialização e saúde de cada processo do backend.
+
+Antes de atender a primeira requisição (lifespan do app em main.py), warm_up abre as conexões do
+pool, para que as primeiras requisições não paguem a conexão com o banco, e carrega no cache os
+produtos e estoques mais usados (crud.warm_caches). Só então o processo passa a se declarar pronto.
+
+- GET /health/live: o processo está de pé e o loop de eventos responde (não consulta o banco)
+- GET /health/ready: o aquecimento terminou e o banco responde; 503 caso contrário
+
+Configuração por variáveis de ambiente:
+    WARMUP_CACHE_PRODUCTS  produtos carregados no cache ao iniciar (padrão 1000; 0 desativa)
+"""
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import text
+
+import crud
+import database
+
+WARMUP_CACHE_PRODUCTS = int(os.getenv("WARMUP_CACHE_PRODUCTS", "1000"))
+
+# Logger configurado pelo uvicorn em cada worker (as mensagens saem junto com as do servidor)
+logger = logging.getLogger("uvicorn.error")
+
+started_at = time.monotonic()
+warmup_seconds = None  # preenchido ao fim de warm_up; None enquanto o processo não está pronto
+
+
+def _warm_pool(engine):
+    # Abre ao mesmo tempo as conexões que o pool mantém (uma só sem pool) e as devolve a ele
+    size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    connections = []
+    try:
+        for _ in range(size):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+    return size
+
+
+async def _warm_async_pool(engine):
+    size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    connections = []
+    try:
+        for _ in range(size):
+            connection = await engine.connect()
+            connections.append(connection)
+            await connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            await connection.close()
+    return size
+
+
+def _warm_caches():
+    if not WARMUP_CACHE_PRODUCTS:
+        return 0
+    db = database.SessionLocal()
+    try:
+        return crud.warm_caches(db, WARMUP_CACHE_PRODUCTS)
+    finally:
+        db.close()
+
+
+async def warm_up():
+    global warmup_seconds
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    connections = await loop.run_in_executor(None, _warm_pool, database.engine)
+    if database.async_engine is not None:
+        connections += await _warm_async_pool(database.async_engine)
+    products = await loop.run_in_executor(None, _warm_caches)
+    warmup_seconds = time.perf_counter() - start
+    logger.info(
+        "Process %s ready in %.2fs (%s connections opened, %s products cached)",
+        os.getpid(), warmup_seconds, connections, products,
+    )
+
+
+def status(state: str):
+    return {
+        "status": state,
+        "pid": os.getpid(),
+        "uptime_seconds": time.monotonic() - started_at,
+        "warmup_seconds": warmup_seconds,
+    }
+
+
+def check_database():
+    # Consulta mínima pelo pool; retorna a mensagem de erro, ou None se o banco respondeu
+    try:
+        with database.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except Exception as error:
+        return str(error)
+    return None
@@ -4,21 +4,26 @@ aplicação web principal.
 """
 from fastapi import FastAPI
 
+"""
+Importa o módulo os, usado para ler a variável de ambiente RUN_MIGRATIONS, e asynccontextmanager,
+usado para declarar o ciclo de vida (lifespan) da aplicação.
+"""
+import os
+from contextlib import asynccontextmanager
+
 """
 Importa a variável engine do módulo database. 
 O engine é tipicamente usado para se conectar ao banco de dados. 
 Ele serve como a interface principal para a base de dados e é usado para executar 
 as instruções SQL.
 """
-from database import engine
+from database import engine, async_engine, DATABASE_MODE
 
 """
-Importa o módulo models. 
-Este módulo geralmente contém definições de modelos de dados usando um ORM 
-(Object-Relational Mapping), como SQLAlchemy, que mapeia classes Python a tabelas no 
-banco de dados.
+Importa o módulo migrations, responsável por criar e atualizar o esquema do banco de dados
+(tabelas, índices e restrições) de forma versionada.
 """
-import models
+import migrations
 """
 Importa a variável router do módulo router. No FastAPI, router é usado para declarar 
 operações de API diferentes, facilitando a organização e reutilização de código ao 
@@ -27,22 +32,60 @@ agrupar rotas relacionadas.
 from router import router
 
 """
-Esta linha executa a criação das tabelas no banco de dados, baseadas nas 
-definições de modelos encontradas no módulo models. 
-O método create_all() verifica as tabelas definidas nos modelos e as cria no banco de dados, 
-vinculado pelo engine, se ainda não existirem.
+Importa o middleware de métricas, que mede cada requisição (latência, tempo no banco, consultas,
+linhas e serialização), publica os histogramas em /metrics e envia o cabeçalho Server-Timing.
+"""
+from metrics import MetricsMiddleware
+
+"""
+Importa o módulo health, que aquece o pool de conexões e os caches antes de o processo atender
+requisições e responde às verificações de liveness e readiness (/health/live e /health/ready).
 """
-models.Base.metadata.create_all(bind=engine)
+import health
+
+"""
+Esta linha aplica as migrações pendentes do esquema no banco de dados vinculado pelo engine.
+Em um banco vazio, cria todas as tabelas, índices e restrições; em um banco criado pelo antigo
+Base.metadata.create_all(), adiciona apenas o que falta. Também pode ser executado à parte
+com `python migrations.py upgrade`.
+Com RUN_MIGRATIONS=false a verificação é pulada: o ponto de entrada de produção (server.py) aplica
+as migrações uma única vez, antes de iniciar os workers, que recebem essa variável.
+"""
+if os.getenv("RUN_MIGRATIONS", "true").lower() in ("1", "true", "yes"):
+    migrations.upgrade(engine)
+
+"""
+Ciclo de vida de cada processo: o uvicorn só começa a aceitar conexões depois do aquecimento
+(health.warm_up); ao encerrar, depois de concluir as requisições em andamento, as conexões do pool
+são fechadas.
+"""
+@asynccontextmanager
+async def lifespan(app):
+    await health.warm_up()
+    yield
+    engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
 
 """
 Cria uma instância da aplicação FastAPI. 
 Esta instância será usada para registrar as rotas e iniciar o servidor.
 """
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 """
 Inclui o roteador (definido em outra parte do código e importado) na aplicação. 
 Isso efetivamente adiciona todas as rotas e operações definidas no router à aplicação 
 FastAPI, permitindo que elas sejam acessadas via HTTP.
 """
+"""
+No modo assíncrono (DATABASE_MODE=async), as rotas async def de router_async são registradas
+antes, e por isso têm precedência sobre as rotas equivalentes de router; as demais rotas
+continuam sendo atendidas pelo router síncrono.
+"""
+if DATABASE_MODE == "async":
+    from router_async import router as async_router
+    app.include_router(async_router)
+
 app.include_router(router)
\ No newline at end of file
@@ -0,0 +1,222 @@
+"""
+Métricas por requisição: latência total, tempo no banco, número de consultas, linhas lidas e tempo
+de serialização da resposta.
+
+Os valores de cada requisição são acumulados em um RequestMetrics, guardado em uma ContextVar pelo
+MetricsMiddleware; as consultas são contadas pelos eventos do SQLAlchemy registrados em
+database.instrument_engine, e o fim do endpoint é marcado pelas rotas TimedRoute. Ao fim da
+requisição os valores entram nos histogramas (expostos em GET /metrics, no formato de texto do
+Prometheus) e são enviados ao cliente no cabeçalho Server-Timing.
+
+Configuração por variáveis de ambiente:
+    METRICS_ENABLED   true (padrão): mede as requisições; false desativa o middleware
+    SERVER_TIMING     true (padrão): envia o cabeçalho Server-Timing nas respostas
+    SLOW_QUERY_MS     consultas a partir deste tempo, em milissegundos, vão para o log
+                      slow_query com a rota, o SQL e os parâmetros (padrão 200; 0 desativa)
+
+As linhas lidas vêm do rowcount do driver, informado pelo psycopg2 e pelo asyncpg, mas não pelo
+sqlite3. Os histogramas são por processo: com vários workers, cada um expõe os seus.
+"""
+import bisect
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from fastapi.routing import APIRoute
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+# Tamanho máximo do texto dos parâmetros no log de consultas lentas (executemany pode ter milhares)
+SLOW_QUERY_PARAMETERS_LENGTH = 2000
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+slow_query_logger = logging.getLogger("slow_query")
+
+
+class Histogram:
+    # Histograma com buckets fixos e séries por rótulos (method, route, status), seguro entre threads
+    def __init__(self, name: str, documentation: str, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}  # rótulos -> [contagem por bucket..., contagem acima do último, soma]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in series_items:
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return "\n".join(lines)
+
+
+def _escape(value: str):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Total request latency.", LATENCY_BUCKETS)
+DB_DURATION = Histogram("http_request_db_duration_seconds", "Time spent in database queries per request.", LATENCY_BUCKETS)
+DB_QUERIES = Histogram("http_request_db_queries", "Database queries per request.", QUERY_BUCKETS)
+DB_ROWS = Histogram("http_request_db_rows", "Rows fetched from the database per request.", ROW_BUCKETS)
+SERIALIZATION_DURATION = Histogram(
+    "http_request_serialization_duration_seconds", "Time from the end of the endpoint to the response start.", LATENCY_BUCKETS
+)
+HISTOGRAMS = (REQUEST_DURATION, DB_DURATION, DB_QUERIES, DB_ROWS, SERIALIZATION_DURATION)
+
+
+class RequestMetrics:
+    # Valores acumulados durante uma requisição
+    __slots__ = ("scope", "start", "db_time", "queries", "rows", "endpoint_end", "response_start")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.start = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.endpoint_end = None
+        self.response_start = None
+
+    @property
+    def route(self):
+        # Caminho declarado da rota (por exemplo, /products/{product_id}), definido pelo roteamento
+        route = self.scope.get("route")
+        return getattr(route, "path_format", None) or "unmatched"
+
+    @property
+    def serialization_time(self):
+        if self.endpoint_end is None or self.response_start is None:
+            return 0.0
+        return max(self.response_start - self.endpoint_end, 0.0)
+
+    def server_timing(self):
+        total = (self.response_start or time.perf_counter()) - self.start
+        return (
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries, {self.rows} rows", '
+            f"serialize;dur={self.serialization_time * 1000:.1f}, "
+            f"total;dur={total * 1000:.1f}"
+        )
+
+
+current = ContextVar("request_metrics", default=None)
+
+
+def record_query(duration: float, rows: int, statement: str, parameters):
+    # Chamado pelos eventos do engine (database.instrument_engine) após cada consulta
+    request_metrics = current.get()
+    if request_metrics is not None:
+        request_metrics.db_time += duration
+        request_metrics.queries += 1
+        request_metrics.rows += rows
+    if SLOW_QUERY_MS and duration * 1000 >= SLOW_QUERY_MS:
+        parameters_text = repr(parameters)
+        if len(parameters_text) > SLOW_QUERY_PARAMETERS_LENGTH:
+            parameters_text = parameters_text[:SLOW_QUERY_PARAMETERS_LENGTH] + "..."
+        slow_query_logger.warning(
+            "Slow query (%.1f ms) on %s: %s | parameters: %s",
+            duration * 1000,
+            request_metrics.route if request_metrics is not None else "-",
+            " ".join(statement.split()),
+            parameters_text,
+        )
+
+
+def _observe(request_metrics: RequestMetrics, method: str, status: int):
+    labels = (("method", method), ("route", request_metrics.route), ("status", str(status)))
+    REQUEST_DURATION.observe(labels, time.perf_counter() - request_metrics.start)
+    DB_DURATION.observe(labels, request_metrics.db_time)
+    DB_QUERIES.observe(labels, request_metrics.queries)
+    DB_ROWS.observe(labels, request_metrics.rows)
+    SERIALIZATION_DURATION.observe(labels, request_metrics.serialization_time)
+
+
+class MetricsMiddleware:
+    # Middleware ASGI: mede cada requisição HTTP e acrescenta o cabeçalho Server-Timing
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        request_metrics = RequestMetrics(scope)
+        status = 500
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                request_metrics.response_start = time.perf_counter()
+                status = message["status"]
+                if SERVER_TIMING:
+                    message = {
+                        **message,
+                        "headers": [*message.get("headers", []), (b"server-timing", request_metrics.server_timing().encode())],
+                    }
+            await send(message)
+
+        token = current.set(request_metrics)
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            current.reset(token)
+            _observe(request_metrics, scope["method"], status)
+
+
+def _mark_endpoint_end():
+    request_metrics = current.get()
+    if request_metrics is not None:
+        request_metrics.endpoint_end = time.perf_counter()
+
+
+class TimedRoute(APIRoute):
+    """
+    Rota que marca o fim da execução do endpoint; o tempo entre esse ponto e o início da resposta
+    (validação pelo response_model e codificação em JSON) é o tempo de serialização.
+    """
+    def __init__(self, path: str, endpoint, **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def timed_endpoint(*args, **endpoint_kwargs):
+                try:
+                    return await endpoint(*args, **endpoint_kwargs)
+                finally:
+                    _mark_endpoint_end()
+        else:
+            @functools.wraps(endpoint)
+            def timed_endpoint(*args, **endpoint_kwargs):
+                try:
+                    return endpoint(*args, **endpoint_kwargs)
+                finally:
+                    _mark_endpoint_end()
+        super().__init__(path, timed_endpoint, **kwargs)
+
+
+def render():
+    # Todos os histogramas no formato de texto do Prometheus
+    return "\n".join(histogram.render() for histogram in HISTOGRAMS) + "\n"
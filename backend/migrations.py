@@ -0,0 +1,243 @@
+"""
+Migrações do esquema do banco de dados.
+
+Cada migração é uma função que recebe uma conexão e é aplicada uma única vez, dentro de uma
+transação, em ordem de versão. As versões já aplicadas ficam registradas na tabela schema_migrations.
+As migrações verificam o que já existe antes de criar algo, pois bancos criados pelo antigo
+Base.metadata.create_all já possuem parte do esquema.
+
+Uso:
+    python migrations.py upgrade   # aplica as migrações pendentes
+    python migrations.py current   # mostra a versão atual do esquema
+    python migrations.py explain   # confere se a consulta de estoque usa o índice de itens
+"""
+import argparse
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.schema import AddConstraint, DropConstraint, ForeignKeyConstraint
+
+from database import engine as default_engine, SessionLocal
+import models
+
+migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _initial_schema(conn):
+    # Tabelas originais e a tabela de saldos; não faz nada se já existirem
+    models.Base.metadata.create_all(bind=conn, tables=[
+        models.ProductModel.__table__,
+        models.StockMovementModel.__table__,
+        models.StockMovementItemModel.__table__,
+        models.StockBalanceModel.__table__,
+    ])
+
+
+def _movement_indexes_and_constraints(conn):
+    inspector = inspect(conn)
+
+    # Índices das consultas de estoque, da listagem e do cascade de itens
+    # (índices de colunas criadas por migrações posteriores ficam para elas)
+    for table in (models.StockMovementModel.__table__, models.StockMovementItemModel.__table__):
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if index.name not in existing and all(column.name in columns for column in index.columns):
+                index.create(bind=conn)
+
+    # O SQLite não altera restrições de tabelas existentes; bancos SQLite novos já as recebem na migração 1
+    if conn.dialect.name == "sqlite":
+        return
+
+    items = models.StockMovementItemModel.__table__
+    for foreign_key in inspector.get_foreign_keys(items.name):
+        if foreign_key["referred_table"] == "stock_movements" and \
+                (foreign_key.get("options") or {}).get("ondelete", "").upper() != "CASCADE":
+            conn.execute(DropConstraint(ForeignKeyConstraint(
+                foreign_key["constrained_columns"], ["stock_movements.id"], name=foreign_key["name"], table=items,
+            )))
+            conn.execute(AddConstraint(ForeignKeyConstraint(
+                ["movement_id"], ["stock_movements.id"], name=foreign_key["name"], ondelete="CASCADE", table=items,
+            )))
+
+    movements = models.StockMovementModel.__table__
+    existing = {check["name"] for check in inspector.get_check_constraints(movements.name)}
+    for constraint in movements.constraints:
+        if constraint.name == "ck_stock_movements_type" and constraint.name not in existing:
+            conn.execute(AddConstraint(constraint))
+
+
+def _product_sku(conn):
+    # Chave natural dos produtos, usada pela importação em massa
+    inspector = inspect(conn)
+    if "sku" not in {column["name"] for column in inspector.get_columns("products")}:
+        conn.execute(text("ALTER TABLE products ADD COLUMN sku VARCHAR"))
+    existing = {index["name"] for index in inspector.get_indexes("products")}
+    for index in models.ProductModel.__table__.indexes:
+        if index.name not in existing:
+            index.create(bind=conn)
+
+
+def _ingest_checkpoints(conn):
+    # Checkpoints da ingestão de movimentações em lote
+    models.Base.metadata.create_all(bind=conn, tables=[models.IngestCheckpointModel.__table__])
+
+
+def _data_versions(conn):
+    # Contadores de versão usados nos ETags; começam em 1 para os conjuntos já existentes
+    models.Base.metadata.create_all(bind=conn, tables=[models.DataVersionModel.__table__])
+    table = models.DataVersionModel.__table__
+    existing = {name for (name,) in conn.execute(select(table.c.name))}
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for name in ("products", "stock_movements"):
+        if name not in existing:
+            conn.execute(table.insert().values(name=name, version=1, updated_at=now))
+
+
+def _stock_snapshots(conn):
+    # Fotografias periódicas de estoque, usadas nas consultas históricas
+    models.Base.metadata.create_all(bind=conn, tables=[models.StockSnapshotModel.__table__])
+
+
+def _movement_ledger(conn):
+    # Referências de estorno e correção do livro append-only, e a data de gravação dos lançamentos
+    movements = models.StockMovementModel.__table__
+    inspector = inspect(conn)
+    existing = {column["name"] for column in inspector.get_columns(movements.name)}
+    for name in ("reverses_movement_id", "replaces_movement_id"):
+        if name not in existing:
+            conn.execute(text(
+                f"ALTER TABLE stock_movements ADD COLUMN {name} INTEGER REFERENCES stock_movements (id) ON DELETE SET NULL"
+            ))
+    if "recorded_at" not in existing:
+        column_type = movements.c.recorded_at.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE stock_movements ADD COLUMN recorded_at {column_type}"))
+    indexes = {index["name"] for index in inspector.get_indexes(movements.name)}
+    for index in movements.indexes:
+        if index.name not in indexes:
+            index.create(bind=conn)
+
+
+def _movement_archive(conn):
+    # Saldos de abertura, registro dos meses arquivados e a tabela fria (particionada no PostgreSQL)
+    models.Base.metadata.create_all(bind=conn, tables=[
+        models.StockOpeningBalanceModel.__table__,
+        models.StockArchiveModel.__table__,
+        models.StockMovementArchiveModel.__table__,
+    ])
+
+
+def _idempotency_keys(conn):
+    # Chaves de idempotência da inclusão de movimentações
+    models.Base.metadata.create_all(bind=conn, tables=[models.IdempotencyKeyModel.__table__])
+
+
+def _movement_references_without_foreign_keys(conn):
+    # Estornos e correções mantêm o id do original arquivado, que não está mais em stock_movements;
+    # o SQLite não remove restrições de tabelas existentes, mas também não as verifica (sem PRAGMA foreign_keys)
+    if conn.dialect.name == "sqlite":
+        return
+    movements = models.StockMovementModel.__table__
+    for foreign_key in inspect(conn).get_foreign_keys(movements.name):
+        if foreign_key["referred_table"] == "stock_movements" and \
+                set(foreign_key["constrained_columns"]) <= {"reverses_movement_id", "replaces_movement_id"}:
+            conn.execute(DropConstraint(ForeignKeyConstraint(
+                foreign_key["constrained_columns"], ["stock_movements.id"], name=foreign_key["name"], table=movements,
+            )))
+
+
+# (versão, descrição, função); novas migrações entram no fim da lista
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "movement indexes, cascade and type check", _movement_indexes_and_constraints),
+    (3, "product sku", _product_sku),
+    (4, "ingest checkpoints", _ingest_checkpoints),
+    (5, "data versions", _data_versions),
+    (6, "stock snapshots", _stock_snapshots),
+    (7, "movement ledger", _movement_ledger),
+    (8, "movement archive", _movement_archive),
+    (9, "idempotency keys", _idempotency_keys),
+    (10, "movement references without foreign keys", _movement_references_without_foreign_keys),
+]
+
+
+def current_version(conn):
+    migration_metadata.create_all(bind=conn)
+    return conn.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version.desc())).scalar() or 0
+
+
+def upgrade(engine=default_engine):
+    # Aplica as migrações pendentes; retorna a lista de versões aplicadas
+    applied = []
+    with engine.begin() as conn:
+        version = current_version(conn)
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=migration_version, description=description, applied_at=datetime.now()
+            ))
+        applied.append(migration_version)
+    return applied
+
+
+def explain_query(db, query):
+    """
+    Plano de execução de uma consulta do ORM (EXPLAIN no PostgreSQL, EXPLAIN QUERY PLAN no SQLite),
+    uma linha por passo. No PostgreSQL o seq scan é desabilitado para a transação, para que o plano
+    mostre se os índices são utilizáveis mesmo com tabelas pequenas.
+    """
+    statement = query.statement.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True})
+    if db.bind.dialect.name == "postgresql":
+        db.execute(text("SET LOCAL enable_seqscan = off"))
+        rows = db.execute(text(f"EXPLAIN {statement}")).all()
+    else:
+        rows = db.execute(text(f"EXPLAIN QUERY PLAN {statement}")).all()
+    db.rollback()
+    return [str(row[-1]) for row in rows]
+
+
+def explain_stock_totals(db, product_id=1):
+    # Plano da consulta de estoque de um produto (crud.stock_totals_query)
+    from crud import stock_totals_query
+
+    return explain_query(db, stock_totals_query(db, [product_id]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrações do esquema do banco de dados.")
+    parser.add_argument("command", choices=["upgrade", "current", "explain"])
+    args = parser.parse_args(argv)
+
+    if args.command == "upgrade":
+        applied = upgrade()
+        print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+    elif args.command == "current":
+        with default_engine.begin() as conn:
+            print(current_version(conn))
+    else:
+        db = SessionLocal()
+        try:
+            plan = explain_stock_totals(db)
+        finally:
+            db.close()
+        print("\n".join(plan))
+        if not any("ix_stock_movement_items_product_id_movement_id" in line for line in plan):
+            print("Stock query does not use ix_stock_movement_items_product_id_movement_id")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
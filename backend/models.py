@@ -1,5 +1,5 @@
 # Importações de classes do SQLAlchemy para construir o modelo ORM.
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, CheckConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -10,8 +10,13 @@ from datetime import datetime
 
 class ProductModel(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Chave natural usada na importação em massa (upsert); produtos sem SKU são permitidos
+        Index("ux_products_sku", "sku", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
+    sku = Column(String)
     name = Column(String)
     description = Column(String)
     price = Column(Float)
@@ -19,11 +24,25 @@ class ProductModel(Base):
 
 class StockMovementModel(Base):
     __tablename__ = "stock_movements"
+    __table_args__ = (
+        # Filtros por tipo e período na listagem de movimentações
+        Index("ix_stock_movements_type_movement_date", "type", "movement_date"),
+        CheckConstraint("type IN ('entrada', 'saída')", name="ck_stock_movements_type"),
+        # Uma movimentação só pode ser estornada uma vez, mesmo com correções concorrentes
+        Index("ux_stock_movements_reverses_movement_id", "reverses_movement_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     type = Column(String)  # 'entrada' ou 'saída'
-    movement_date = Column(DateTime)
-    items = relationship("StockMovementItemModel", back_populates="movement")
+    movement_date = Column(DateTime, index=True)
+    # Livro append-only (crud.STOCK_LEDGER_MODE): exclusões e alterações gravam novos lançamentos,
+    # ligados ao original, em vez de mudá-lo. Sem FK: a referência continua gravada quando o original
+    # é arquivado (crud.archive_stock_movements) e deixa a tabela
+    reverses_movement_id = Column(Integer)  # estorno de
+    replaces_movement_id = Column(Integer)  # correção de
+    recorded_at = Column(DateTime(timezone=True), default=func.now())  # quando o lançamento foi gravado
+    # passive_deletes: os itens são removidos pelo ON DELETE CASCADE do banco
+    items = relationship("StockMovementItemModel", back_populates="movement", passive_deletes=True)
     """
     Esta linha é usada na classe StockMovementModel para definir um relacionamento entre 
     uma movimentação de estoque e seus itens. Ela diz que cada instância de StockMovementModel 
@@ -54,9 +73,16 @@ class StockMovementModel(Base):
 
 class StockMovementItemModel(Base):
     __tablename__ = "stock_movement_items"
+    __table_args__ = (
+        # Agregação de estoque por produto; no PostgreSQL a quantidade fica no índice (index-only scan)
+        Index(
+            "ix_stock_movement_items_product_id_movement_id", "product_id", "movement_id",
+            postgresql_include=["quantity"],
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
-    movement_id = Column(Integer, ForeignKey('stock_movements.id'))
+    movement_id = Column(Integer, ForeignKey('stock_movements.id', ondelete='CASCADE'), index=True)
     product_id = Column(Integer, ForeignKey('products.id'))
     quantity = Column(Integer)
     movement = relationship("StockMovementModel", back_populates="items")
@@ -65,6 +91,132 @@ class StockMovementItemModel(Base):
 # Ajuste para relacionar ProductModel com os itens do estoque
 ProductModel.stock_items = relationship("StockMovementItemModel", back_populates="product")
 
+class StockBalanceModel(Base):
+    """
+    Saldo corrente (materializado) de cada produto.
+    É mantido pelas funções de movimentação em crud.py na mesma transação que grava os itens,
+    de modo que a consulta de estoque seja apenas uma busca pela chave primária.
+    Pode ser recalculado a partir do histórico com o comando stock_balances.py.
+    """
+    __tablename__ = "stock_balances"
+
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+
+class StockSnapshotModel(Base):
+    """
+    Fotografia periódica do estoque: `quantity` é o saldo do produto considerando todas as
+    movimentações com movement_date anterior a `snapshot_at`. As consultas históricas partem da
+    fotografia mais recente e somam apenas os itens posteriores a ela. Movimentações gravadas com
+    data anterior a uma fotografia a corrigem na mesma transação (ver crud._apply_snapshot_deltas).
+    Criadas com `python stock_balances.py snapshot`.
+    """
+    __tablename__ = "stock_snapshots"
+
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    snapshot_at = Column(DateTime, primary_key=True, index=True)
+    quantity = Column(Integer, nullable=False)
+
+class StockOpeningBalanceModel(Base):
+    """
+    Totais de entrada e saída das movimentações já arquivadas de cada produto (ver
+    crud.archive_stock_movements): o histórico completo do produto é este saldo de abertura mais os
+    itens que continuam em stock_movement_items. Acumula os totais de todos os arquivamentos.
+    """
+    __tablename__ = "stock_opening_balances"
+
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    entries = Column(Integer, nullable=False, default=0)
+    exits = Column(Integer, nullable=False, default=0)
+    archived_before = Column(DateTime, nullable=False)  # limite do arquivamento mais recente
+
+class StockArchiveModel(Base):
+    """
+    Registro de cada mês arquivado: onde estão as movimentações com movement_date em
+    [period_start, period_end) retiradas das tabelas principais. `storage` é "table" (partição da
+    tabela stock_movement_archive) ou "parquet" (arquivo em `location`). Um mesmo mês pode ter mais
+    de um registro, quando movimentações com data retroativa são arquivadas depois.
+    """
+    __tablename__ = "stock_archives"
+
+    id = Column(Integer, primary_key=True)
+    period_start = Column(DateTime, nullable=False, index=True)
+    period_end = Column(DateTime, nullable=False)
+    archived_before = Column(DateTime, nullable=False)  # limite (--before) da execução que arquivou o mês
+    storage = Column(String, nullable=False)
+    location = Column(String, nullable=False)  # nome da partição ou caminho do arquivo Parquet
+    movements = Column(Integer, nullable=False)
+    items = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=func.now())
+
+class StockMovementArchiveModel(Base):
+    """
+    Movimentações arquivadas com storage "table", uma linha por item (`line` é a posição do item;
+    movimentações sem itens ficam com uma linha sem produto). No PostgreSQL a tabela é particionada
+    por mês de movement_date (RANGE), com as partições criadas pelo arquivamento; as consultas
+    históricas leem apenas as partições do período pedido.
+    """
+    __tablename__ = "stock_movement_archive"
+    __table_args__ = (
+        Index("ix_stock_movement_archive_product_id_movement_date", "product_id", "movement_date"),
+        {"postgresql_partition_by": "RANGE (movement_date)"},
+    )
+
+    movement_id = Column(Integer, primary_key=True, autoincrement=False)
+    line = Column(Integer, primary_key=True, autoincrement=False)
+    movement_date = Column(DateTime, primary_key=True)  # chave de partição, parte da chave primária
+    type = Column(String, nullable=False)
+    product_id = Column(Integer)
+    quantity = Column(Integer)
+    reverses_movement_id = Column(Integer)
+    replaces_movement_id = Column(Integer)
+    recorded_at = Column(DateTime(timezone=True))
+
+class DataVersionModel(Base):
+    """
+    Contador de versão de cada conjunto de dados ("products", "stock_movements").
+    É incrementado por crud.py na mesma transação de cada alteração, de modo que as rotas de leitura
+    calculam ETag e Last-Modified com uma busca pela chave primária, sem percorrer as tabelas.
+    """
+    __tablename__ = "data_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)  # UTC
+
+class IngestCheckpointModel(Base):
+    """
+    Progresso de cada arquivo de movimentações ingerido em lote (movement_ingest.py).
+    `position` é o número de movimentações já processadas, na ordem por data; é gravado na mesma
+    transação que o lote, de modo que um arquivo interrompido continua exatamente de onde parou.
+    """
+    __tablename__ = "ingest_checkpoints"
+
+    batch_id = Column(String, primary_key=True)
+    digest = Column(String, nullable=False)  # sha256 do conteúdo, para não retomar com outro arquivo
+    total = Column(Integer, nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+    applied = Column(Integer, nullable=False, default=0)
+    rejected = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=func.now())
+    completed_at = Column(DateTime)
+
+class IdempotencyKeyModel(Base):
+    """
+    Chaves de idempotência (cabeçalho Idempotency-Key) de POST /stock-movements/: o hash do corpo da
+    requisição e a resposta gravada na mesma transação que a movimentação. A chave primária resolve
+    requisições simultâneas com a mesma chave (ver crud._claim_idempotency_key); depois de
+    `expires_at` a chave pode ser reutilizada, e as linhas vencidas são removidas por
+    crud.purge_idempotency_keys.
+    """
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)  # sha256 do corpo validado
+    response = Column(String)  # JSON da resposta
+    created_at = Column(DateTime(timezone=True), default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)  # UTC
+
 if __name__ == '__main__':
     # Suponha que estas instâncias estejam criadas e devidamente relacionadas:
     # Uma movimentação de estoque
@@ -0,0 +1,138 @@
+"""
+Ingestão em lote de movimentações de estoque (arquivos noturnos dos sistemas do armazém).
+
+A entrada é NDJSON: uma StockMovementWithItemsCreate por linha. O arquivo é lido inteiro, validado
+e ordenado por movement_date (linhas com a mesma data mantêm a ordem do arquivo); as movimentações
+são então aplicadas em trechos de `chunk_size`, cada um em uma única transação, por
+crud.ingest_stock_movements. A disponibilidade de estoque é conferida contra os saldos correntes em
+memória, e não com uma consulta por item.
+
+Cada lote tem um checkpoint (tabela ingest_checkpoints) gravado junto com cada trecho. Executar de
+novo o mesmo arquivo com o mesmo batch_id (por padrão, o sha256 do conteúdo) continua de onde a
+execução anterior parou, sem aplicar nenhuma movimentação duas vezes.
+
+Uso:
+    python movement_ingest.py movimentos.ndjson [--batch-id ID] [--chunk-size N]
+    cat movimentos.ndjson | python movement_ingest.py -
+
+O código de saída é 1 quando alguma linha é inválida ou recusada, e 2 quando o lote não pode ser retomado.
+Também disponível pela API em POST /stock-movements/batch.
+"""
+import argparse
+import hashlib
+import json
+import sys
+import time
+from datetime import timezone
+
+from pydantic import ValidationError
+
+from crud import start_ingest_checkpoint, ingest_stock_movements
+from database import SessionLocal
+from product_import import format_validation_error
+from schemas import StockMovementWithItemsCreate, ImportRowError, MovementIngestReport
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def parse_movements(lines):
+    """
+    Lê as linhas do arquivo. Retorna o sha256 do conteúdo, as movimentações válidas como pares
+    (linha, movimentação) em ordem de data, e os erros como pares (linha, mensagem).
+    """
+    digest = hashlib.sha256()
+    movements = []
+    errors = []
+    row = 0
+    for line in lines:
+        line = line.rstrip("\r\n")
+        digest.update(line.encode("utf-8") + b"\n")
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            movements.append((row, StockMovementWithItemsCreate.model_validate(json.loads(line))))
+        except json.JSONDecodeError as error:
+            errors.append((row, f"Invalid JSON: {error.msg}"))
+        except ValidationError as error:
+            errors.append((row, format_validation_error(error)))
+
+    # Datas com fuso são comparadas em UTC, para poderem ser ordenadas junto com as datas sem fuso
+    def movement_order(entry):
+        row, movement = entry
+        date = movement.movement_date
+        if date.tzinfo is not None:
+            date = date.astimezone(timezone.utc).replace(tzinfo=None)
+        return date, row
+
+    movements.sort(key=movement_order)
+    return digest.hexdigest(), movements, errors
+
+
+def ingest(lines, batch_id: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE, max_errors: int = 1000):
+    """
+    Ingere as movimentações das linhas e retorna um MovementIngestReport.
+    Levanta ValueError se o batch_id já tiver sido usado com outro conteúdo ou estiver em uso por outra execução.
+    """
+    start = time.perf_counter()
+    digest, movements, invalid = parse_movements(lines)
+    batch_id = batch_id or digest
+
+    db = SessionLocal()
+    try:
+        checkpoint = start_ingest_checkpoint(db, batch_id, digest, len(movements))
+        skipped = position = checkpoint.position
+        applied = 0
+        rejected = []
+        while position < len(movements):
+            chunk = movements[position:position + chunk_size]
+            chunk_applied, chunk_rejected = ingest_stock_movements(db, batch_id, chunk, position)
+            applied += chunk_applied
+            rejected.extend(chunk_rejected)
+            position += len(chunk)
+    finally:
+        db.close()
+
+    errors = sorted(invalid + rejected)
+    elapsed = time.perf_counter() - start
+    return MovementIngestReport(
+        batch_id=batch_id,
+        rows_received=len(movements) + len(invalid),
+        invalid=len(invalid),
+        applied=applied,
+        rejected=len(rejected),
+        skipped=skipped,
+        errors=[ImportRowError(row=row, error=message) for row, message in errors[:max_errors]],
+        elapsed_seconds=elapsed,
+        movements_per_second=applied / elapsed if elapsed else 0.0,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingere um arquivo NDJSON de movimentações de estoque.")
+    parser.add_argument("file", help="arquivo NDJSON, ou - para a entrada padrão")
+    parser.add_argument("--batch-id", help="identificador do lote (padrão: sha256 do conteúdo)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="movimentações por transação")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    try:
+        report = ingest(source, batch_id=args.batch_id, chunk_size=args.chunk_size)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    for error in report.errors:
+        print(f"Line {error.row}: {error.error}")
+    print(
+        f"Batch {report.batch_id}: {report.applied} applied, {report.rejected} rejected, {report.invalid} invalid, "
+        f"{report.skipped} already applied ({report.movements_per_second:.0f} movements/s)"
+    )
+    return 1 if report.invalid or report.rejected else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
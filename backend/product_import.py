@@ -0,0 +1,135 @@
+"""
+Importação em massa de produtos (POST /products/import).
+
+O corpo da requisição é lido em streaming, linha a linha, em CSV (cabeçalho com sku, name, description
+e price) ou NDJSON (um objeto JSON por linha). As linhas são validadas com ProductImportRow em lotes de
+`chunk_size`; cada lote válido é gravado por crud.upsert_products em sua própria transação, no threadpool.
+Linhas inválidas não interrompem a importação: entram no relatório com o número da linha e o erro.
+"""
+import csv
+import json
+import time
+
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from starlette.concurrency import run_in_threadpool
+
+from crud import upsert_products
+from database import SessionLocal
+from schemas import ProductImportRow, ImportRowError, ProductImportReport
+
+
+async def iter_lines(request):
+    # Linhas do corpo da requisição, decodificadas conforme chegam
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8").rstrip("\r")
+
+
+async def iter_csv_records(lines):
+    """
+    Registros (número da linha, dicionário ou mensagem de erro) de um CSV com cabeçalho.
+    Campos entre aspas com quebra de linha são reagrupados antes da leitura.
+    """
+    header = None
+    record = ""
+    row = 0
+    async for line in lines:
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue  # aspas abertas: o campo continua na próxima linha
+        text, record = record, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [column.strip() for column in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield row, {column: (value if value != "" else None) for column, value in zip(header, values)}
+
+
+async def iter_ndjson_records(lines):
+    # Registros (número da linha, dicionário ou mensagem de erro) de um NDJSON
+    row = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            yield row, json.loads(line)
+        except json.JSONDecodeError as error:
+            yield row, f"Invalid JSON: {error.msg}"
+
+
+def format_validation_error(error: ValidationError):
+    return "; ".join(f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}" for detail in error.errors())
+
+
+def _write_chunk(products):
+    db = SessionLocal()
+    try:
+        return upsert_products(db, products)
+    finally:
+        db.close()
+
+
+async def import_products(request, file_format: str, chunk_size: int, max_errors: int):
+    start = time.perf_counter()
+    records = iter_csv_records(iter_lines(request)) if file_format == "csv" else iter_ndjson_records(iter_lines(request))
+
+    rows_received = inserted = updated = failed = 0
+    errors = []
+    chunk = []
+
+    def add_error(row, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < max_errors:
+            errors.append(ImportRowError(row=row, error=message))
+
+    async def flush():
+        nonlocal inserted, updated
+        try:
+            chunk_inserted, chunk_updated = await run_in_threadpool(_write_chunk, [product for _, product in chunk])
+        except SQLAlchemyError as error:
+            # O lote inteiro foi desfeito; as demais linhas seguem sendo importadas
+            for row, _ in chunk:
+                add_error(row, f"Database error: {error.__class__.__name__}")
+        else:
+            inserted += chunk_inserted
+            updated += chunk_updated
+        chunk.clear()
+
+    async for row, record in records:
+        rows_received += 1
+        if isinstance(record, str):
+            add_error(row, record)
+            continue
+        try:
+            chunk.append((row, ProductImportRow.model_validate(record)))
+        except ValidationError as error:
+            add_error(row, format_validation_error(error))
+        if len(chunk) >= chunk_size:
+            await flush()
+    if chunk:
+        await flush()
+
+    elapsed = time.perf_counter() - start
+    return ProductImportReport(
+        rows_received=rows_received,
+        inserted=inserted,
+        updated=updated,
+        failed=failed,
+        errors=errors,
+        elapsed_seconds=elapsed,
+        rows_per_second=rows_received / elapsed if elapsed else 0.0,
+    )
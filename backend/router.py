@@ -1,23 +1,123 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
+import os
+import database
+import cache
+import health
+import metrics
 from database import SessionLocal, get_db
-from schemas import ProductResponse, ProductUpdate, ProductCreate, StockMovementWithItemsCreate, StockMovementResponse, StockCalculationResponse, Error
-from typing import List, Union
+from schemas import ProductResponse, ProductUpdate, ProductCreate, StockMovementWithItemsCreate, StockMovementResponse, StockMovementLedgerEntry, StockCalculationResponse, StockBatchRequest, StockBatchResponse, STOCK_BATCH_MAX_IDS, Error, StockSeriesResponse, InventoryMetrics, InventorySummary, PoolDiagnostics, ProductImportReport, MovementIngestReport, CacheDiagnostics, HealthStatus
+from typing import List, Literal, Optional, Union
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from starlette.concurrency import run_in_threadpool
+from product_import import import_products, iter_lines
+import movement_ingest
+import analytics
 from crud import (
     create_product,
     get_products,
+    get_product_rows,
+    iter_products,
     get_product,
     delete_product,
     update_product,
     create_stock_movement,
     get_stock_movements,
+    get_stock_movement_rows,
+    iter_stock_movements,
+    stock_movement_cursor,
     get_stock_movement,
+    get_stock_movement_corrections,
     delete_stock_movement,
     update_stock_movement,
     calculate_stock,
+    calculate_stocks,
+    get_data_versions,
+    get_stock_series,
+    PRODUCT_VERSIONS,
+    MOVEMENT_VERSIONS,
+    STOCK_VERSIONS,
 )
 
-router = APIRouter()
+router = APIRouter(route_class=metrics.TimedRoute)
+
+# Paginação das listagens: o cabeçalho X-Next-Cursor traz o cursor da próxima página quando ela pode existir
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def not_modified(request: Request, response: Response, versions, exists=None):
+    """
+    Preenche ETag, Last-Modified e Cache-Control a partir das versões (crud.get_data_versions) e
+    retorna uma resposta 304 se o cliente já tiver essa versão: If-None-Match, ou If-Modified-Since
+    na ausência dele. Caso contrário retorna None e a rota segue com a consulta.
+    As versões devem ser lidas antes dos dados, para que o ETag nunca seja mais novo que o conteúdo;
+    as rotas de um único recurso que passam pelo cache repassam as mesmas versões à consulta
+    (ETag e corpo da mesma leitura) e chamam esta função depois dela, para que um recurso
+    inexistente responda 404 mesmo com If-None-Match: *. Nas demais, `exists` (uma função sem
+    argumentos) confirma que o recurso existe antes de responder 304.
+    """
+    last_modified = max(updated_at for _, updated_at in versions).replace(tzinfo=timezone.utc)
+    etag = 'W/"{}.{}"'.format("-".join(str(version) for version, _ in versions), int(last_modified.timestamp() * 1000000))
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": "no-cache",  # o cliente pode guardar a resposta, mas revalida a cada uso
+    }
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        fresh = "*" in tags or etag.removeprefix("W/") in tags
+    else:
+        fresh = _not_modified_since(request.headers.get("if-modified-since"), last_modified)
+    if fresh and exists is not None:
+        fresh = exists()
+    return Response(status_code=304, headers=headers) if fresh else None
+
+def _not_modified_since(if_modified_since, last_modified):
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # Last-Modified tem precisão de segundos
+    return last_modified.replace(microsecond=0) <= since
+
+# Respostas rápidas das listagens (FAST_JSON_RESPONSES=true): as linhas são lidas como colunas, já no
+# formato dos schemas de resposta, e codificadas com orjson, sem objetos ORM nem validação item a item
+# pelo response_model. O JSON produzido é o mesmo do caminho padrão.
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "false").lower() in ("1", "true", "yes")
+if FAST_JSON_RESPONSES:
+    import orjson  # dependência necessária apenas com FAST_JSON_RESPONSES=true
+
+def fast_json_response(rows, response: Response):
+    # Os cabeçalhos definidos em `response` (cursor, ETag) não são aplicados a uma Response retornada diretamente
+    return Response(
+        orjson.dumps(rows, option=orjson.OPT_UTC_Z),  # UTC como "Z", como o Pydantic
+        media_type="application/json",
+        headers=dict(response.headers),
+    )
+
+def ndjson_response(rows, schema):
+    """
+    Resposta NDJSON (um objeto JSON por linha) gerada sob demanda.
+    `rows` recebe uma sessão própria, pois a sessão de get_db é fechada antes do envio do corpo.
+    """
+    def generate():
+        db = SessionLocal()
+        try:
+            for row in rows(db):
+                yield schema.model_validate(row).model_dump_json() + "\n"
+        finally:
+            db.close()
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 # Rotas para produtos
 @router.post("/products/", response_model=ProductResponse, description="Cria um novo produto.")
@@ -25,16 +125,55 @@ def create_product_route(product: ProductCreate, db: Session = Depends(get_db)):
     return create_product(db=db, product_data=product)
 
 @router.get("/products/", response_model=List[ProductResponse])
-def read_all_products_route(db: Session = Depends(get_db)):
-    products = get_products(db)
+def read_all_products_route(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    name: Optional[str] = Query(None, max_length=200, description="Trecho do nome, sem diferenciar maiúsculas."),
+    db: Session = Depends(get_db),
+):
+    unchanged = not_modified(request, response, get_data_versions(db, PRODUCT_VERSIONS))
+    if unchanged is not None:
+        return unchanged
+    if FAST_JSON_RESPONSES:
+        rows = get_product_rows(db, after_id=cursor, limit=limit, name=name)
+        if len(rows) == limit:
+            response.headers[NEXT_CURSOR_HEADER] = str(rows[-1]["id"])
+        return fast_json_response(rows, response)
+
+    products = get_products(db, after_id=cursor, limit=limit, name=name)
+    if len(products) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(products[-1].id)
     return products
 
+@router.post(
+    "/products/import",
+    response_model=ProductImportReport,
+    description="Importa produtos em massa (CSV com cabeçalho sku,name,description,price ou NDJSON), "
+                "inserindo ou atualizando pelo SKU. O formato padrão segue o Content-Type.",
+)
+async def import_products_route(
+    request: Request,
+    file_format: Optional[Literal["csv", "ndjson"]] = Query(None, alias="format"),
+    chunk_size: int = Query(5000, ge=1, le=100000),
+    max_errors: int = Query(1000, ge=0),
+):
+    if file_format is None:
+        file_format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    return await import_products(request, file_format, chunk_size, max_errors)
+
+@router.get("/products/stream", description="Exporta todos os produtos em NDJSON, com memória constante.")
+def stream_products_route():
+    return ndjson_response(iter_products, ProductResponse)
+
 @router.get("/products/{product_id}", response_model=ProductResponse)
-def read_product_route(product_id: int, db: Session = Depends(get_db)):
-    db_product = get_product(db, product_id=product_id)
+def read_product_route(product_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    versions = get_data_versions(db, PRODUCT_VERSIONS)
+    db_product = get_product(db, product_id=product_id, versions=versions)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return db_product
+    return not_modified(request, response, versions) or db_product
 
 @router.delete("/products/{product_id}", response_model=ProductResponse)
 def delete_product_route(product_id: int, db: Session = Depends(get_db)):
@@ -53,45 +192,319 @@ def update_product_route(
     return db_product
 
 # Rotas para movimentações de estoque
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_KEY_DESCRIPTION = (
+    "Chave única por movimentação, gerada pelo cliente; repetir o envio com a mesma chave retorna a "
+    "resposta da primeira requisição sem gravar de novo."
+)
+
 @router.post("/stock-movements/", response_model=Union[StockMovementResponse, Error])
-def create_stock_movement_route(movement: StockMovementWithItemsCreate, db: Session = Depends(get_db)):
-    return create_stock_movement(db=db, movement_data=movement)
+def create_stock_movement_route(
+    movement: StockMovementWithItemsCreate,
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=IDEMPOTENCY_KEY_MAX_LENGTH, description=IDEMPOTENCY_KEY_DESCRIPTION),
+    db: Session = Depends(get_db),
+):
+    return create_stock_movement(db=db, movement_data=movement, idempotency_key=idempotency_key)
+
+@router.post(
+    "/stock-movements/batch",
+    response_model=MovementIngestReport,
+    description="Ingere em lote movimentações em NDJSON, aplicadas em ordem de data. "
+                "Repetir o envio com o mesmo batch_id continua de onde o anterior parou.",
+)
+async def ingest_stock_movements_route(
+    request: Request,
+    batch_id: Optional[str] = None,
+    chunk_size: int = Query(movement_ingest.DEFAULT_CHUNK_SIZE, ge=1, le=100000),
+    max_errors: int = Query(1000, ge=0),
+):
+    # O arquivo precisa estar completo para ser ordenado por data; a ingestão roda no threadpool
+    lines = [line async for line in iter_lines(request)]
+    try:
+        return await run_in_threadpool(movement_ingest.ingest, lines, batch_id, chunk_size, max_errors)
+    except ValueError as error:
+        raise HTTPException(status_code=409, detail=str(error))
 
 @router.get("/stock-movements/", response_model=List[StockMovementResponse])
-def read_all_stock_movements_route(db: Session = Depends(get_db)):
-    movements = get_stock_movements(db)
-    return movements
+def read_all_stock_movements_route(
+    request: Request,
+    response: Response,
+    movement_type: Optional[str] = Query(None, alias="type"),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    product_id: Optional[int] = None,
+    order_by: Literal["id", "movement_date"] = "id",
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    unchanged = not_modified(request, response, get_data_versions(db, MOVEMENT_VERSIONS))
+    if unchanged is not None:
+        return unchanged
+    try:
+        movements = (get_stock_movement_rows if FAST_JSON_RESPONSES else get_stock_movements)(
+            db,
+            movement_type=movement_type,
+            date_from=date_from,
+            date_to=date_to,
+            product_id=product_id,
+            order_by=order_by,
+            cursor=cursor,
+            limit=limit,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if len(movements) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = stock_movement_cursor(movements[-1], order_by)
+    return fast_json_response(movements, response) if FAST_JSON_RESPONSES else movements
+
+@router.get("/stock-movements/stream", description="Exporta as movimentações filtradas em NDJSON, com memória constante.")
+def stream_stock_movements_route(
+    movement_type: Optional[str] = Query(None, alias="type"),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    product_id: Optional[int] = None,
+):
+    return ndjson_response(
+        lambda db: iter_stock_movements(
+            db, movement_type=movement_type, date_from=date_from, date_to=date_to, product_id=product_id
+        ),
+        StockMovementResponse,
+    )
 
 @router.get("/stock-movements/{movement_id}", response_model=StockMovementResponse)
-def read_stock_movement_route(movement_id: int, db: Session = Depends(get_db)):
+def read_stock_movement_route(movement_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    versions = get_data_versions(db, MOVEMENT_VERSIONS)
     movement = get_stock_movement(db, movement_id=movement_id)
     if movement is None:
         raise HTTPException(status_code=404, detail="Stock movement not found")
-    return movement
+    return not_modified(request, response, versions) or movement
+
+@router.get(
+    "/stock-movements/{movement_id}/corrections",
+    response_model=List[StockMovementLedgerEntry],
+    description="A movimentação seguida de seus estornos e lançamentos de correção (livro append-only), em ordem de gravação.",
+)
+def read_stock_movement_corrections_route(movement_id: int, db: Session = Depends(get_db)):
+    entries = get_stock_movement_corrections(db, movement_id)
+    if entries is None:
+        raise HTTPException(status_code=404, detail="Stock movement not found")
+    return entries
 
-@router.delete("/stock-movements/{movement_id}", response_model=StockMovementResponse)
+@router.delete(
+    "/stock-movements/{movement_id}",
+    response_model=StockMovementResponse,
+    description="Exclui a movimentação ou, com STOCK_LEDGER_MODE=append_only, grava seu estorno e mantém o original.",
+)
 def delete_stock_movement_route(movement_id: int, db: Session = Depends(get_db)):
-    movement = delete_stock_movement(db, movement_id=movement_id)
+    try:
+        movement = delete_stock_movement(db, movement_id=movement_id)
+    except ValueError as error:
+        raise HTTPException(status_code=409, detail=str(error))
     if movement is None:
         raise HTTPException(status_code=404, detail="Stock movement not found")
     return movement
 
-@router.put("/stock-movements/{movement_id}", response_model=StockMovementResponse)
+@router.put(
+    "/stock-movements/{movement_id}",
+    response_model=StockMovementResponse,
+    description="Altera o tipo e a data da movimentação. Com STOCK_LEDGER_MODE=append_only, grava o estorno do "
+                "original e retorna o novo lançamento de correção.",
+)
 def update_stock_movement_route(
     movement_id: int, movement: StockMovementWithItemsCreate, db: Session = Depends(get_db)
 ):
-    updated_movement = update_stock_movement(db, movement_id=movement_id, movement_data=movement)
+    try:
+        updated_movement = update_stock_movement(db, movement_id=movement_id, movement_data=movement)
+    except ValueError as error:
+        raise HTTPException(status_code=409, detail=str(error))
     if updated_movement is None:
         raise HTTPException(status_code=404, detail="Stock movement not found")
     return updated_movement
 
-@router.get("/products/{product_id}/stock", response_model=StockCalculationResponse)
-def get_product_stock(product_id: int, db: Session = Depends(get_db)):
+@router.get(
+    "/products/{product_id}/stock",
+    response_model=StockCalculationResponse,
+    description="Estoque atual do produto ou, com `at`, o estoque naquele instante (movimentações até `at`, inclusive).",
+)
+def get_product_stock(
+    product_id: int, request: Request, response: Response, at: Optional[datetime] = None, db: Session = Depends(get_db)
+):
+    versions = get_data_versions(db, STOCK_VERSIONS)
     # Chama a função calculate_stock e armazena o resultado
-    stock_response = calculate_stock(db, product_id)
+    stock_response = calculate_stock(db, product_id, at=at, versions=versions)
 
     # Verifica se a resposta contém um erro
     if "error" in stock_response:
         raise HTTPException(status_code=404, detail=stock_response["error"])
 
-    return stock_response
\ No newline at end of file
+    return not_modified(request, response, versions) or stock_response
+
+@router.get(
+    "/products/{product_id}/stock/series",
+    response_model=StockSeriesResponse,
+    description="Saldo do produto ao fim de cada dia, semana ou mês entre date_from e date_to.",
+)
+def get_product_stock_series(
+    product_id: int,
+    request: Request,
+    response: Response,
+    date_from: date,
+    date_to: Optional[date] = None,
+    interval: Literal["day", "week", "month"] = "day",
+    db: Session = Depends(get_db),
+):
+    versions = get_data_versions(db, STOCK_VERSIONS)
+    unchanged = not_modified(request, response, versions, exists=lambda: get_product(db, product_id) is not None)
+    if unchanged is not None:
+        return unchanged
+    try:
+        series = get_stock_series(db, product_id, interval, date_from, date_to or date.today())
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if series is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return series
+
+@router.get(
+    "/stock/",
+    response_model=List[StockCalculationResponse],
+    description="Consulta o estoque de vários produtos em uma única requisição (no instante `at`, se informado). "
+                "IDs inexistentes são ignorados.",
+)
+def get_products_stock(
+    request: Request,
+    response: Response,
+    product_ids: List[int] = Query(..., min_length=1, max_length=STOCK_BATCH_MAX_IDS),
+    at: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+):
+    versions = get_data_versions(db, STOCK_VERSIONS)
+    unchanged = not_modified(request, response, versions)
+    if unchanged is not None:
+        return unchanged
+    return calculate_stocks(db, product_ids, at=at, versions=versions)
+
+@router.post(
+    "/products/stock:batch",
+    response_model=StockBatchResponse,
+    description="Estoque de uma lista de produtos (até 10 mil IDs no corpo), calculado em uma única consulta. "
+                "IDs inexistentes voltam em `missing`.",
+)
+def get_products_stock_batch(batch: StockBatchRequest, request: Request, response: Response, db: Session = Depends(get_db)):
+    # Mesma consulta de GET /stock/ (cache, ETag e validação), com os IDs no corpo
+    stocks = get_products_stock(request, response, batch.product_ids, batch.at, db)
+    return stock_batch_response(batch.product_ids, stocks)
+
+def stock_batch_response(product_ids, stocks):
+    # Monta a resposta da consulta em lote: os estoques encontrados e os IDs sem produto (ou o 304 de not_modified)
+    if isinstance(stocks, Response):
+        return stocks
+    found = {stock.product_id for stock in stocks}
+    return StockBatchResponse(
+        stocks=stocks, missing=[product_id for product_id in dict.fromkeys(product_ids) if product_id not in found]
+    )
+
+# Rotas de relatórios de estoque (analytics.py)
+@router.get(
+    "/analytics/inventory",
+    response_model=List[InventoryMetrics],
+    description="Valor em estoque, giro e dias de cobertura de cada produto, paginados por product_id.",
+)
+def inventory_report_route(
+    response: Response,
+    period_days: int = Query(30, ge=1, le=3650),
+    cursor: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    rows = analytics.page(analytics.inventory_report(db, period_days), cursor, limit)
+    if len(rows) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(rows[-1]["product_id"])
+    return rows
+
+@router.get("/analytics/inventory/summary", response_model=InventorySummary, description="Totais do catálogo inteiro.")
+def inventory_summary_route(period_days: int = Query(30, ge=1, le=3650), db: Session = Depends(get_db)):
+    return analytics.summarize(analytics.inventory_report(db, period_days), period_days)
+
+@router.get(
+    "/analytics/inventory/export",
+    description="Exporta o relatório de todos os produtos em CSV ou Parquet.",
+)
+def export_inventory_report_route(
+    file_format: Literal["csv", "parquet"] = Query("csv", alias="format"),
+    period_days: int = Query(30, ge=1, le=3650),
+    db: Session = Depends(get_db),
+):
+    content = analytics.export(analytics.inventory_report(db, period_days), file_format)
+    media_type = "text/csv" if file_format == "csv" else "application/vnd.apache.parquet"
+    return Response(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="inventory.{file_format}"'},
+    )
+
+@router.get(
+    "/analytics/low-stock",
+    response_model=List[InventoryMetrics],
+    description="Produtos com saldo abaixo de `threshold` ou, se informado, com menos de `cover_days` dias de cobertura.",
+)
+def low_stock_report_route(
+    response: Response,
+    threshold: int = Query(..., ge=0),
+    cover_days: Optional[float] = Query(None, gt=0),
+    period_days: int = Query(30, ge=1, le=3650),
+    cursor: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    report = analytics.low_stock(analytics.inventory_report(db, period_days), threshold, cover_days)
+    rows = analytics.page(report, cursor, limit)
+    if len(rows) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(rows[-1]["product_id"])
+    return rows
+
+# Rotas de saúde do processo (health.py), para as verificações de liveness e readiness do orquestrador
+@router.get("/health/live", response_model=HealthStatus, description="O processo está de pé; não consulta o banco.")
+async def liveness_route():
+    return health.status("alive")
+
+@router.get(
+    "/health/ready",
+    response_model=HealthStatus,
+    description="O processo terminou o aquecimento (pool e caches) e o banco responde; 503 caso contrário.",
+)
+def readiness_route(response: Response):
+    if health.warmup_seconds is None:
+        response.status_code = 503
+        return health.status("starting")
+    error = health.check_database()
+    if error is not None:
+        response.status_code = 503
+        return {**health.status("unavailable"), "detail": error}
+    return health.status("ready")
+
+# Rotas de diagnóstico
+@router.get("/diagnostics/pool", response_model=PoolDiagnostics, description="Situação dos pools de conexões deste processo.")
+def pool_diagnostics_route():
+    return PoolDiagnostics(
+        database_mode=database.DATABASE_MODE,
+        sync_pool=database.pool_status(database.engine),
+        async_pool=database.pool_status(database.async_engine) if database.async_engine is not None else None,
+    )
+
+@router.get(
+    "/diagnostics/cache",
+    response_model=CacheDiagnostics,
+    description="Acertos e falhas do cache de produtos e de estoque neste processo, para dimensioná-lo.",
+)
+def cache_diagnostics_route():
+    return cache.stats()
+
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    description="Histogramas de latência, tempo no banco, consultas, linhas e serialização por rota, no formato do Prometheus.",
+)
+def metrics_route():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,224 @@
+"""
+Versão assíncrona (async def) das rotas de produtos, movimentações e estoque, ativada com DATABASE_MODE=async.
+As rotas aqui têm os mesmos caminhos e contratos de router.py e são registradas antes dele em main.py;
+as rotas sem versão assíncrona (como as exportações NDJSON) continuam atendidas por router.py.
+Os parâmetros de caminho usam o conversor :int para que, por exemplo, /products/stream não seja
+capturado por /products/{product_id} antes de chegar ao router.py.
+"""
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from metrics import TimedRoute
+from schemas import ProductResponse, ProductUpdate, ProductCreate, StockMovementWithItemsCreate, StockMovementResponse, StockCalculationResponse, StockBatchRequest, StockBatchResponse, STOCK_BATCH_MAX_IDS, Error
+from typing import List, Literal, Optional, Union
+from datetime import datetime
+from crud import stock_movement_cursor
+from crud_async import (
+    create_product,
+    get_products,
+    get_product_rows,
+    get_product,
+    delete_product,
+    update_product,
+    create_stock_movement,
+    get_stock_movements,
+    get_stock_movement_rows,
+    get_stock_movement,
+    delete_stock_movement,
+    update_stock_movement,
+    calculate_stock,
+    calculate_stocks,
+    get_data_versions,
+)
+from router import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    PRODUCT_VERSIONS,
+    MOVEMENT_VERSIONS,
+    STOCK_VERSIONS,
+    FAST_JSON_RESPONSES,
+    IDEMPOTENCY_KEY_MAX_LENGTH,
+    IDEMPOTENCY_KEY_DESCRIPTION,
+    fast_json_response,
+    not_modified,
+    stock_batch_response,
+)
+
+router = APIRouter(route_class=TimedRoute)
+
+# Rotas para produtos
+@router.post("/products/", response_model=ProductResponse, description="Cria um novo produto.")
+async def create_product_route(product: ProductCreate, db: AsyncSession = Depends(get_async_db)):
+    return await create_product(db=db, product_data=product)
+
+@router.get("/products/", response_model=List[ProductResponse])
+async def read_all_products_route(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    name: Optional[str] = Query(None, max_length=200, description="Trecho do nome, sem diferenciar maiúsculas."),
+    db: AsyncSession = Depends(get_async_db),
+):
+    unchanged = not_modified(request, response, await get_data_versions(db, PRODUCT_VERSIONS))
+    if unchanged is not None:
+        return unchanged
+    if FAST_JSON_RESPONSES:
+        rows = await get_product_rows(db, after_id=cursor, limit=limit, name=name)
+        if len(rows) == limit:
+            response.headers[NEXT_CURSOR_HEADER] = str(rows[-1]["id"])
+        return fast_json_response(rows, response)
+
+    products = await get_products(db, after_id=cursor, limit=limit, name=name)
+    if len(products) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(products[-1].id)
+    return products
+
+@router.get("/products/{product_id:int}", response_model=ProductResponse)
+async def read_product_route(
+    product_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)
+):
+    versions = await get_data_versions(db, PRODUCT_VERSIONS)
+    db_product = await get_product(db, product_id=product_id, versions=versions)
+    if db_product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return not_modified(request, response, versions) or db_product
+
+@router.delete("/products/{product_id:int}", response_model=ProductResponse)
+async def delete_product_route(product_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_product = await delete_product(db, product_id=product_id)
+    if db_product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return db_product
+
+@router.put("/products/{product_id:int}", response_model=ProductResponse)
+async def update_product_route(
+    product_id: int, product: ProductUpdate, db: AsyncSession = Depends(get_async_db)
+):
+    db_product = await update_product(db, product_id=product_id, product_data=product)
+    if db_product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return db_product
+
+# Rotas para movimentações de estoque
+@router.post("/stock-movements/", response_model=Union[StockMovementResponse, Error])
+async def create_stock_movement_route(
+    movement: StockMovementWithItemsCreate,
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=IDEMPOTENCY_KEY_MAX_LENGTH, description=IDEMPOTENCY_KEY_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await create_stock_movement(db=db, movement_data=movement, idempotency_key=idempotency_key)
+
+@router.get("/stock-movements/", response_model=List[StockMovementResponse])
+async def read_all_stock_movements_route(
+    request: Request,
+    response: Response,
+    movement_type: Optional[str] = Query(None, alias="type"),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    product_id: Optional[int] = None,
+    order_by: Literal["id", "movement_date"] = "id",
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db),
+):
+    unchanged = not_modified(request, response, await get_data_versions(db, MOVEMENT_VERSIONS))
+    if unchanged is not None:
+        return unchanged
+    try:
+        movements = await (get_stock_movement_rows if FAST_JSON_RESPONSES else get_stock_movements)(
+            db,
+            movement_type=movement_type,
+            date_from=date_from,
+            date_to=date_to,
+            product_id=product_id,
+            order_by=order_by,
+            cursor=cursor,
+            limit=limit,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if len(movements) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = stock_movement_cursor(movements[-1], order_by)
+    return fast_json_response(movements, response) if FAST_JSON_RESPONSES else movements
+
+@router.get("/stock-movements/{movement_id:int}", response_model=StockMovementResponse)
+async def read_stock_movement_route(
+    movement_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)
+):
+    versions = await get_data_versions(db, MOVEMENT_VERSIONS)
+    movement = await get_stock_movement(db, movement_id=movement_id)
+    if movement is None:
+        raise HTTPException(status_code=404, detail="Stock movement not found")
+    return not_modified(request, response, versions) or movement
+
+@router.delete("/stock-movements/{movement_id:int}", response_model=StockMovementResponse)
+async def delete_stock_movement_route(movement_id: int, db: AsyncSession = Depends(get_async_db)):
+    try:
+        movement = await delete_stock_movement(db, movement_id=movement_id)
+    except ValueError as error:
+        raise HTTPException(status_code=409, detail=str(error))
+    if movement is None:
+        raise HTTPException(status_code=404, detail="Stock movement not found")
+    return movement
+
+@router.put("/stock-movements/{movement_id:int}", response_model=StockMovementResponse)
+async def update_stock_movement_route(
+    movement_id: int, movement: StockMovementWithItemsCreate, db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        updated_movement = await update_stock_movement(db, movement_id=movement_id, movement_data=movement)
+    except ValueError as error:
+        raise HTTPException(status_code=409, detail=str(error))
+    if updated_movement is None:
+        raise HTTPException(status_code=404, detail="Stock movement not found")
+    return updated_movement
+
+@router.get("/products/{product_id:int}/stock", response_model=StockCalculationResponse)
+async def get_product_stock(
+    product_id: int,
+    request: Request,
+    response: Response,
+    at: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    versions = await get_data_versions(db, STOCK_VERSIONS)
+    stock_response = await calculate_stock(db, product_id, at=at, versions=versions)
+
+    # Verifica se a resposta contém um erro
+    if "error" in stock_response:
+        raise HTTPException(status_code=404, detail=stock_response["error"])
+
+    return not_modified(request, response, versions) or stock_response
+
+@router.get(
+    "/stock/",
+    response_model=List[StockCalculationResponse],
+    description="Consulta o estoque de vários produtos em uma única requisição. IDs inexistentes são ignorados.",
+)
+async def get_products_stock(
+    request: Request,
+    response: Response,
+    product_ids: List[int] = Query(..., min_length=1, max_length=STOCK_BATCH_MAX_IDS),
+    at: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    versions = await get_data_versions(db, STOCK_VERSIONS)
+    unchanged = not_modified(request, response, versions)
+    if unchanged is not None:
+        return unchanged
+    return await calculate_stocks(db, product_ids, at=at, versions=versions)
+
+@router.post(
+    "/products/stock:batch",
+    response_model=StockBatchResponse,
+    description="Estoque de uma lista de produtos (até 10 mil IDs no corpo), calculado em uma única consulta. "
+                "IDs inexistentes voltam em `missing`.",
+)
+async def get_products_stock_batch(
+    batch: StockBatchRequest, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)
+):
+    # Mesma consulta de GET /stock/ (cache, ETag e validação), com os IDs no corpo
+    stocks = await get_products_stock(request, response, batch.product_ids, batch.at, db)
+    return stock_batch_response(batch.product_ids, stocks)
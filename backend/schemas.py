@@ -1,9 +1,10 @@
 from pydantic import BaseModel, PositiveFloat, Field, PositiveInt 
-from datetime import datetime
-from typing import Optional, List
+from datetime import date, datetime
+from typing import Optional, List, Literal, Dict
 
 # Modelos para Produtos
 class ProductBase(BaseModel):
+    sku: Optional[str] = None
     name: str
     description: Optional[str] = None
     price: PositiveFloat
@@ -28,13 +29,31 @@ class ProductResponse(ProductBase):
         from_attributes  = True
 
 class ProductUpdate(BaseModel):
+    sku: Optional[str] = None
     name: Optional[str] = None
     description: Optional[str] = None
     price: Optional[PositiveFloat] = None
 
+# Linha de importação em massa de produtos: o SKU é obrigatório, pois é a chave do upsert
+class ProductImportRow(ProductBase):
+    sku: str
+
+class ImportRowError(BaseModel):
+    row: int  # número da linha de dados, começando em 1 (sem contar o cabeçalho do CSV)
+    error: str
+
+class ProductImportReport(BaseModel):
+    rows_received: int
+    inserted: int
+    updated: int
+    failed: int
+    errors: List[ImportRowError]  # limitado a max_errors entradas
+    elapsed_seconds: float
+    rows_per_second: float
+
 # Modelos para Movimentações de Estoque
 class StockMovementBase(BaseModel):
-    type: str  # 'entrada' ou 'saída'
+    type: Literal['entrada', 'saída']
     movement_date: datetime
 
 class StockMovementCreate(StockMovementBase):
@@ -73,6 +92,12 @@ class StockMovementResponse(BaseModel):
     class Config:
         from_attributes  = True
 
+# Lançamento do livro de movimentações, com as referências de estorno e correção (GET /stock-movements/{id}/corrections)
+class StockMovementLedgerEntry(StockMovementResponse):
+    reverses_movement_id: Optional[int] = None
+    replaces_movement_id: Optional[int] = None
+    recorded_at: Optional[datetime] = None
+
 # Este modelo é utilizado para adicionar itens a uma movimentação já existente.
 class StockMovementItemCreate(StockMovementItemBase):
     pass
@@ -81,15 +106,111 @@ class StockMovementItemCreate(StockMovementItemBase):
 class StockMovementWithItemsCreate(StockMovementBase):
     items: List[StockMovementItemCreate]
 
+class MovementIngestReport(BaseModel):
+    batch_id: str
+    rows_received: int
+    invalid: int  # linhas que não são uma movimentação válida
+    applied: int
+    rejected: int  # movimentações recusadas por falta de estoque ou produto inexistente
+    skipped: int  # movimentações já processadas em uma execução anterior do mesmo lote
+    errors: List[ImportRowError]  # limitado a max_errors entradas
+    elapsed_seconds: float
+    movements_per_second: float
+
 class StockCalculationResponse(BaseModel):
     product_id: int
     product_name: Optional[str] = None
     current_stock: int
     description: Optional[str] = None
+    as_of: Optional[datetime] = None  # preenchido nas consultas históricas (parâmetro at): estoque naquele instante
 
     class Config:
         from_attributes = True
 
+# Consulta de estoque em lote (POST /products/stock:batch): limite de IDs por requisição
+STOCK_BATCH_MAX_IDS = 10000
+
+class StockBatchRequest(BaseModel):
+    product_ids: List[int] = Field(..., min_length=1, max_length=STOCK_BATCH_MAX_IDS)
+    at: Optional[datetime] = None  # estoque naquele instante, como no parâmetro at de /products/{id}/stock
+
+class StockBatchResponse(BaseModel):
+    stocks: List[StockCalculationResponse]  # na ordem pedida, sem IDs repetidos
+    missing: List[int]  # IDs pedidos que não correspondem a nenhum produto
+
+class StockSeriesPoint(BaseModel):
+    period_start: date
+    entries: int
+    exits: int
+    closing_stock: int  # saldo ao fim do período
+
+class StockSeriesResponse(BaseModel):
+    product_id: int
+    interval: Literal['day', 'week', 'month']
+    date_from: date  # início do primeiro período (date_from pedido, alinhado ao início do período)
+    date_to: date
+    opening_stock: int  # saldo antes do primeiro período
+    points: List[StockSeriesPoint]
+
+# Modelos dos relatórios de estoque (analytics.py)
+class InventoryMetrics(BaseModel):
+    product_id: int
+    sku: Optional[str] = None
+    name: str
+    price: float
+    current_stock: int
+    stock_value: float
+    entries: int  # entradas no período
+    exits: int  # saídas no período
+    turnover: Optional[float] = None  # vazio quando o estoque médio do período não é positivo
+    days_of_cover: Optional[float] = None  # vazio quando não houve saídas no período
+
+class InventorySummary(BaseModel):
+    period_days: int
+    products: int
+    total_stock: int
+    total_value: float
+    entries: int
+    exits: int
+    turnover: Optional[float] = None
+
 class Error(BaseModel):
     error: str
-    details: List[str]
\ No newline at end of file
+    details: List[str]
+
+# Modelos de diagnóstico
+class PoolStatus(BaseModel):
+    pool_class: str
+    size: Optional[int] = None
+    checked_out: Optional[int] = None
+    checked_in: Optional[int] = None
+    overflow: Optional[int] = None
+    checkouts: int
+    timeouts: int
+    wait_time_total_ms: float
+    wait_time_max_ms: float
+
+class PoolDiagnostics(BaseModel):
+    database_mode: str
+    sync_pool: PoolStatus
+    async_pool: Optional[PoolStatus] = None
+
+class CacheCounters(BaseModel):
+    hits: int
+    misses: int
+    invalidations: int
+
+class CacheDiagnostics(BaseModel):
+    backend: str
+    ttl_seconds: float
+    entries: Optional[int] = None  # não informado pelo backend redis
+    max_entries: Optional[int] = None
+    evictions: Optional[int] = None
+    namespaces: Dict[str, CacheCounters]  # contadores deste processo, por namespace ("product", "stock")
+
+class HealthStatus(BaseModel):
+    status: Literal['alive', 'ready', 'starting', 'unavailable']
+    pid: int  # processo (worker) que respondeu
+    uptime_seconds: float
+    warmup_seconds: Optional[float] = None  # duração do aquecimento; None enquanto não terminou
+    detail: Optional[str] = None  # erro do banco, quando unavailable
@@ -0,0 +1,72 @@
+"""
+Ponto de entrada de produção: verifica e aplica as migrações uma única vez, no processo principal,
+e só então inicia os workers uvicorn, que recebem RUN_MIGRATIONS=false e não repetem a verificação
+do esquema (ver main.py). Cada worker aquece o pool de conexões e os caches antes de aceitar
+conexões (health.py); o uvicorn reinicia os workers que morrerem e, ao receber SIGTERM, espera as
+requisições em andamento por até --graceful-timeout segundos.
+
+Os workers compartilham o socket de escuta; com vários workers, cada um tem o seu pool de conexões
+(até DB_POOL_SIZE + DB_MAX_OVERFLOW conexões por worker) e, com CACHE_BACKEND=memory, o seu cache,
+que confere a versão dos dados a cada leitura (ver cache.py) e não serve o que outro worker alterou.
+
+Configuração por variáveis de ambiente (ou pelas opções equivalentes):
+    WEB_CONCURRENCY   número de workers (padrão: número de núcleos da máquina)
+    HOST / PORT       endereço de escuta (padrão 0.0.0.0:8000)
+
+Uso:
+    python server.py
+    python server.py --workers 4 --port 8000
+"""
+import argparse
+import logging
+import os
+import time
+
+import uvicorn
+
+logger = logging.getLogger("server")
+
+
+def default_workers():
+    return int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1
+
+
+def prepare():
+    # Hook executado antes de criar os workers: migrações pendentes, uma única vez para todos eles
+    import migrations
+    from database import engine
+
+    start = time.perf_counter()
+    applied = migrations.upgrade(engine)
+    engine.dispose()  # os workers abrem as próprias conexões
+    os.environ["RUN_MIGRATIONS"] = "false"
+    logger.info(
+        "Schema checked in %.2fs (%s)", time.perf_counter() - start,
+        f"applied migrations {applied}" if applied else "up to date",
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers(), help="padrão: WEB_CONCURRENCY ou os núcleos (%(default)s)")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="segundos de espera pelas requisições ao encerrar")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format="%(levelname)s:     %(message)s")
+    logger.setLevel(args.log_level.upper())
+    prepare()
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Comando de manutenção dos saldos materializados (tabela stock_balances).
+
+Uso:
+    python stock_balances.py verify    # apenas relata as divergências entre saldo e histórico
+    python stock_balances.py rebuild   # recalcula pelo histórico e corrige as divergências
+    python stock_balances.py snapshot [--at 2025-01-01T00:00:00]
+        # grava a fotografia do estoque no instante informado (padrão: início do mês corrente),
+        # usada pelas consultas históricas; para uso em rotina agendada (por exemplo, mensal)
+    python stock_balances.py compact --before 2024-01-01T00:00:00
+        # grava a fotografia em --before e remove do livro os pares movimentação/estorno anteriores
+    python stock_balances.py archive --before 2024-01-01T00:00:00 [--to parquet] [--directory archive]
+        # move as movimentações dos meses anteriores a --before (início de mês) para o arquivo frio:
+        # partições mensais de stock_movement_archive (padrão) ou arquivos Parquet em --directory
+        # (padrão: variável de ambiente ARCHIVE_DIR ou ./archive), com saldos de abertura por produto
+    python stock_balances.py purge-idempotency-keys
+        # remove as chaves de idempotência vencidas (IDEMPOTENCY_TTL_HOURS) de POST /stock-movements/
+
+O código de saída é 1 quando o verify encontra divergências, para uso em rotinas agendadas.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from database import SessionLocal
+from crud import verify_stock_balances, rebuild_stock_balances, create_stock_snapshots, compact_stock_ledger, archive_stock_movements, ARCHIVE_STORAGES, purge_idempotency_keys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verifica, reconstrói ou fotografa os saldos de estoque materializados.")
+    parser.add_argument("command", choices=["verify", "rebuild", "snapshot", "compact", "archive", "purge-idempotency-keys"])
+    parser.add_argument("--at", type=datetime.fromisoformat, help="instante da fotografia (apenas com snapshot)")
+    parser.add_argument("--before", type=datetime.fromisoformat, help="limite da compactação ou do arquivamento (obrigatório com compact e archive)")
+    parser.add_argument("--to", choices=ARCHIVE_STORAGES, default="table", help="destino do arquivamento (padrão: %(default)s)")
+    parser.add_argument("--directory", default=os.getenv("ARCHIVE_DIR", "archive"), help="diretório dos arquivos Parquet (padrão: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.command in ("compact", "archive") and args.before is None:
+        parser.error(f"{args.command} requires --before")
+
+    db = SessionLocal()
+    try:
+        if args.command == "snapshot":
+            at = args.at or datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            print(f"{create_stock_snapshots(db, at)} product(s) snapshotted at {at.isoformat()}")
+            return 0
+        if args.command == "compact":
+            snapshots, removed = compact_stock_ledger(db, args.before)
+            print(f"{snapshots} product(s) snapshotted at {args.before.isoformat()}, {removed} ledger movement(s) removed")
+            return 0
+        if args.command == "archive":
+            try:
+                archived = archive_stock_movements(db, args.before, args.to, args.directory)
+            except ValueError as error:
+                parser.error(str(error))
+            for month, movements, items in archived:
+                print(f"{month:%Y-%m}: {movements} movement(s), {items} item(s) archived")
+            print(f"{len(archived)} month(s) archived before {args.before.isoformat()} ({args.to})")
+            return 0
+        if args.command == "purge-idempotency-keys":
+            print(f"{purge_idempotency_keys(db)} expired idempotency key(s) removed")
+            return 0
+        if args.command == "verify":
+            drift = verify_stock_balances(db)
+        else:
+            drift = rebuild_stock_balances(db)
+    finally:
+        db.close()
+
+    for product_id, stored, expected in drift:
+        print(f"Product ID {product_id}: stored={stored} expected={expected}")
+    print(f"{len(drift)} product(s) with drift" + (" fixed" if args.command == "rebuild" and drift else ""))
+
+    return 1 if args.command == "verify" and drift else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Configuração dos testes: um banco SQLite descartável, criado pelas migrações como em produção.
+
+database.py lê DATABASE_URL ao ser importado; por isso a variável é definida aqui, antes de qualquer
+módulo do backend ser importado. Execute a partir do diretório backend:
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "tests.db")
+os.environ["CACHE_BACKEND"] = "none"
+
+import database  # noqa: E402
+import migrations  # noqa: E402
+import models  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    # Esquema recriado a cada teste, em conexões novas: o cache de comandos do sqlite3 pode guardar
+    # o resultado vazio de um PRAGMA de reflexão de um esquema anterior
+    database.engine.dispose()
+    models.Base.metadata.drop_all(bind=database.engine)
+    migrations.migration_metadata.drop_all(bind=database.engine)
+    migrations.upgrade(database.engine)
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+class QueryCounter:
+    # Conta os comandos enviados ao banco pelo engine (evento before_cursor_execute)
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@contextmanager
+def counting_queries():
+    counter = QueryCounter()
+    event.listen(database.engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(database.engine, "before_cursor_execute", counter)
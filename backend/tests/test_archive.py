@@ -0,0 +1,43 @@
+"""
+Arquivamento do livro append-only: estornos saem com o original, e correções posteriores ao limite
+mantêm a referência ao original arquivado e não podem mais ser corrigidas.
+"""
+from datetime import datetime
+
+import pytest
+
+import crud
+from models import StockMovementModel
+from schemas import ProductCreate, StockMovementWithItemsCreate
+
+
+@pytest.fixture
+def append_only(monkeypatch):
+    monkeypatch.setattr(crud, "STOCK_LEDGER_MODE", "append_only")
+
+
+def movement(product_id, movement_date, quantity=5):
+    return StockMovementWithItemsCreate(
+        type="entrada", movement_date=movement_date, items=[{"product_id": product_id, "quantity": quantity}],
+    )
+
+
+def test_archive_keeps_references_to_archived_movements(db, append_only):
+    product_id = crud.create_product(db, ProductCreate(name="Caneta", price=1)).id
+    original_id = crud.create_stock_movement(db, movement(product_id, datetime(2024, 11, 10))).id
+    correction_id = crud.update_stock_movement(db, original_id, movement(product_id, datetime(2025, 2, 3))).id
+    reversed_id = crud.create_stock_movement(db, movement(product_id, datetime(2024, 12, 1))).id
+    crud.delete_stock_movement(db, reversed_id)
+    stock = crud.calculate_stock(db, product_id).current_stock
+
+    crud.archive_stock_movements(db, datetime(2025, 1, 1))
+    db.expire_all()
+
+    remaining = db.query(StockMovementModel).order_by(StockMovementModel.id).all()
+    assert [(row.id, row.replaces_movement_id) for row in remaining] == [(correction_id, original_id)]
+    assert crud.calculate_stock(db, product_id).current_stock == stock
+
+    with pytest.raises(ValueError, match="archived"):
+        crud.update_stock_movement(db, correction_id, movement(product_id, datetime(2025, 3, 1)))
+    with pytest.raises(ValueError, match="archived"):
+        crud.delete_stock_movement(db, correction_id)
@@ -0,0 +1,52 @@
+"""
+Validação das movimentações: nas saídas, linhas repetidas do mesmo produto são somadas antes de
+conferir o saldo; em qualquer tipo, produtos inexistentes são relatados no corpo do erro 400.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def product_id(db):
+    product_id = client.post("/products/", json={"name": "Caneta", "price": 2.5}).json()["id"]
+    client.post("/stock-movements/", json={
+        "type": "entrada", "movement_date": "2025-01-01T00:00:00", "items": [{"product_id": product_id, "quantity": 10}],
+    })
+    return product_id
+
+
+def post_exit(items):
+    return client.post("/stock-movements/", json={
+        "type": "saída", "movement_date": "2025-01-02T00:00:00",
+        "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in items],
+    })
+
+
+def test_repeated_lines_are_summed(product_id):
+    response = post_exit([(product_id, 6), (product_id, 6)])
+
+    assert response.status_code == 400
+    assert response.json()["detail"]["details"] == [
+        f"Not enough stock for product ID {product_id}. Available: 10, Requested: 12"
+    ]
+    assert client.get(f"/products/{product_id}/stock").json()["current_stock"] == 10
+    assert post_exit([(product_id, 6), (product_id, 4)]).status_code == 200
+
+
+@pytest.mark.parametrize("movement_type", ["entrada", "saída"])
+def test_unknown_product(product_id, movement_type):
+    response = client.post("/stock-movements/", json={
+        "type": movement_type, "movement_date": "2025-01-02T00:00:00",
+        "items": [{"product_id": product_id, "quantity": 1}, {"product_id": 999, "quantity": 1}],
+    })
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == {
+        "error": "Failed to create movement due to stock limitations",
+        "details": ["Product ID 999 not found"],
+    }
+    assert client.get(f"/products/{product_id}/stock").json()["current_stock"] == 10
@@ -0,0 +1,56 @@
+"""
+Saldo materializado (stock_balances): acompanha inclusões, alterações e exclusões de movimentações,
+e verify_stock_balances / rebuild_stock_balances encontram e corrigem divergências.
+"""
+from datetime import datetime
+
+import crud
+from models import StockBalanceModel
+from schemas import ProductCreate, StockMovementWithItemsCreate
+
+
+def movement(movement_type, items, movement_date=datetime(2025, 1, 10)):
+    return StockMovementWithItemsCreate(
+        type=movement_type, movement_date=movement_date,
+        items=[{"product_id": product_id, "quantity": quantity} for product_id, quantity in items],
+    )
+
+
+def balances(db):
+    db.expire_all()
+    return {balance.product_id: balance.quantity for balance in db.query(StockBalanceModel)}
+
+
+def test_balances_follow_movements(db):
+    first, second = (crud.create_product(db, ProductCreate(name=name, price=1)).id for name in ("A", "B"))
+
+    entry = crud.create_stock_movement(db, movement("entrada", [(first, 10), (second, 4), (first, 2)]))
+    assert balances(db) == {first: 12, second: 4}
+
+    exit_id = crud.create_stock_movement(db, movement("saída", [(first, 5)])).id
+    assert balances(db) == {first: 7, second: 4}
+
+    crud.update_stock_movement(db, exit_id, movement("entrada", [], datetime(2025, 1, 11)))
+    assert balances(db) == {first: 17, second: 4}
+
+    crud.delete_stock_movement(db, exit_id)
+    crud.delete_stock_movement(db, entry.id)
+    assert balances(db) == {first: 0, second: 0}
+    assert crud.verify_stock_balances(db) == []
+
+
+def test_verify_and_rebuild(db):
+    first, second, third = (crud.create_product(db, ProductCreate(name=name, price=1)).id for name in ("A", "B", "C"))
+    crud.create_stock_movement(db, movement("entrada", [(first, 10), (second, 3), (third, 1)]))
+
+    # Divergências: um saldo alterado fora da aplicação e uma linha ausente
+    db.query(StockBalanceModel).filter(StockBalanceModel.product_id == first).update({StockBalanceModel.quantity: 99})
+    db.query(StockBalanceModel).filter(StockBalanceModel.product_id == second).delete()
+    db.commit()
+
+    drift = [(first, 99, 10), (second, None, 3)]
+    assert crud.verify_stock_balances(db) == drift
+    assert crud.rebuild_stock_balances(db) == drift
+    assert balances(db) == {first: 10, second: 3, third: 1}
+    assert crud.verify_stock_balances(db) == []
+    assert crud.calculate_stock(db, first).current_stock == 10
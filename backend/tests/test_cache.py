@@ -0,0 +1,60 @@
+"""
+Entradas do cache gravadas com a versão dos dados (cache.py): um valor antigo gravado depois da
+invalidação, ou uma alteração feita por outro processo, não voltam a ser servidos.
+"""
+from datetime import datetime
+
+import pytest
+
+import cache
+import crud
+from schemas import ProductCreate, ProductUpdate, StockMovementWithItemsCreate
+
+
+@pytest.fixture
+def memory_cache():
+    cache.configure(cache.MemoryCache(ttl=60, max_entries=100))
+    try:
+        yield
+    finally:
+        cache.configure(cache.NullCache())
+
+
+def test_stale_product_written_after_invalidation_is_not_served(db, memory_cache):
+    product = crud.create_product(db, ProductCreate(name="Old", price=1))
+    # Uma leitura começa (versão e produto lidos) antes da alteração...
+    version = crud._cache_version(db, crud.PRODUCT_VERSIONS)
+    stale = crud.ProductResponse.model_validate(product).model_dump(mode="json")
+
+    crud.update_product(db, product.id, ProductUpdate(name="New"))
+    # ...e grava o valor antigo depois do commit e da invalidação
+    cache.set_many("product", {product.id: stale}, version)
+
+    assert crud.get_product(db, product.id).name == "New"
+
+
+def test_stock_changed_by_another_process_is_not_served(db, memory_cache, monkeypatch):
+    product = crud.create_product(db, ProductCreate(name="A", price=1))
+    assert crud.calculate_stock(db, product.id).current_stock == 0
+    assert crud.calculate_stock(db, product.id).current_stock == 0  # do cache
+
+    # A movimentação é gravada por outro worker: a invalidação não chega a este cache
+    monkeypatch.setattr(cache, "invalidate", lambda namespace, ids: None)
+    crud.create_stock_movement(db, StockMovementWithItemsCreate(
+        type="entrada", movement_date=datetime(2025, 1, 1), items=[{"product_id": product.id, "quantity": 5}]
+    ))
+
+    assert crud.calculate_stock(db, product.id).current_stock == 5
+
+
+def test_unchanged_entries_are_served_from_cache(db, memory_cache):
+    product = crud.create_product(db, ProductCreate(name="A", price=1))
+    crud.get_product(db, product.id)
+    crud.calculate_stocks(db, [product.id])
+
+    crud.get_product(db, product.id)
+    crud.calculate_stocks(db, [product.id])
+
+    namespaces = cache.stats()["namespaces"]
+    assert namespaces["product"]["hits"] == 1
+    assert namespaces["stock"]["hits"] == 1
@@ -0,0 +1,46 @@
+"""
+Requisições condicionais (ETag / If-None-Match): o ETag e o corpo vêm da mesma leitura, e um recurso
+inexistente responde 404 mesmo com If-None-Match: *.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def product_id(db):
+    return client.post("/products/", json={"name": "Caneta", "price": 2.5}).json()["id"]
+
+
+@pytest.mark.parametrize("path", ["/products/{}", "/products/{}/stock", "/products/{}/stock/series?date_from=2025-01-01", "/stock-movements/{}"])
+def test_if_none_match_star_missing_resource(db, path):
+    response = client.get(path.format(999), headers={"If-None-Match": "*"})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("path", ["/products/{}", "/products/{}/stock", "/products/{}/stock/series?date_from=2025-01-01"])
+def test_if_none_match_star_existing_resource(product_id, path):
+    response = client.get(path.format(product_id), headers={"If-None-Match": "*"})
+    assert response.status_code == 304
+
+
+def test_if_none_match_star_existing_movement(product_id):
+    movement = client.post("/stock-movements/", json={
+        "type": "entrada", "movement_date": "2025-01-01T00:00:00", "items": [{"product_id": product_id, "quantity": 1}],
+    }).json()
+    response = client.get(f"/stock-movements/{movement['id']}", headers={"If-None-Match": "*"})
+    assert response.status_code == 304
+
+
+def test_etag_matches_body_after_update(product_id):
+    first = client.get(f"/products/{product_id}")
+    client.put(f"/products/{product_id}", json={"name": "Lápis", "price": 1.0})
+
+    second = client.get(f"/products/{product_id}", headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 200
+    assert second.json()["name"] == "Lápis"
+    assert second.headers["etag"] != first.headers["etag"]
+    assert client.get(f"/products/{product_id}", headers={"If-None-Match": second.headers["etag"]}).status_code == 304
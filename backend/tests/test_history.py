@@ -0,0 +1,87 @@
+"""
+Estoque histórico: calculate_stock(at=...), a série de saldos por período e a correção das
+fotografias (stock_snapshots) por movimentações com data retroativa.
+"""
+from datetime import date, datetime
+
+import pytest
+
+import crud
+from models import StockSnapshotModel
+from schemas import ProductCreate, StockMovementWithItemsCreate
+
+
+def add_movement(db, movement_type, product_id, quantity, movement_date):
+    crud.create_stock_movement(db, StockMovementWithItemsCreate(
+        type=movement_type, movement_date=movement_date, items=[{"product_id": product_id, "quantity": quantity}],
+    ))
+
+
+@pytest.fixture
+def product_id(db):
+    product_id = crud.create_product(db, ProductCreate(name="Caneta", price=1)).id
+    add_movement(db, "entrada", product_id, 10, datetime(2025, 1, 6, 9))
+    add_movement(db, "saída", product_id, 3, datetime(2025, 1, 7, 12))
+    add_movement(db, "entrada", product_id, 5, datetime(2025, 1, 14))
+    add_movement(db, "saída", product_id, 4, datetime(2025, 2, 3))
+    return product_id
+
+
+@pytest.mark.parametrize("at, expected", [
+    (datetime(2025, 1, 6), 0),
+    (datetime(2025, 1, 6, 9), 10),  # inclusive
+    (datetime(2025, 1, 10), 7),
+    (datetime(2025, 1, 31), 12),
+    (datetime(2025, 3, 1), 8),
+    (None, 8),
+])
+def test_stock_at(db, product_id, at, expected):
+    assert crud.calculate_stock(db, product_id, at=at).current_stock == expected
+
+
+@pytest.mark.parametrize("snapshot", [False, True])
+def test_stock_at_from_snapshot(db, product_id, snapshot):
+    if snapshot:
+        crud.create_stock_snapshots(db, datetime(2025, 1, 10))
+    assert [crud.calculate_stock(db, product_id, at=at).current_stock for at in (
+        datetime(2025, 1, 9), datetime(2025, 1, 10), datetime(2025, 1, 20),
+    )] == [7, 7, 12]
+
+
+def test_stock_series(db, product_id):
+    weekly = crud.get_stock_series(db, product_id, "week", date(2025, 1, 8), date(2025, 1, 26))
+
+    # A semana começa na segunda-feira: o primeiro período (6/1) inclui a entrada anterior a date_from
+    assert weekly.date_from == date(2025, 1, 6)
+    assert weekly.opening_stock == 0
+    assert [(point.period_start, point.entries, point.exits, point.closing_stock) for point in weekly.points] == [
+        (date(2025, 1, 6), 10, 3, 7),
+        (date(2025, 1, 13), 5, 0, 12),
+        (date(2025, 1, 20), 0, 0, 12),
+    ]
+
+    daily = crud.get_stock_series(db, product_id, "day", date(2025, 1, 13), date(2025, 1, 15))
+    assert daily.opening_stock == 7
+    assert [point.closing_stock for point in daily.points] == [7, 12, 12]
+
+    monthly = crud.get_stock_series(db, product_id, "month", date(2025, 2, 1), date(2025, 2, 28))
+    assert monthly.opening_stock == 12
+    assert [(point.entries, point.exits, point.closing_stock) for point in monthly.points] == [(0, 4, 8)]
+
+    assert crud.get_stock_series(db, 999, "day", date(2025, 1, 1), date(2025, 1, 2)) is None
+
+
+def test_backdated_movement_corrects_snapshots(db, product_id):
+    crud.create_stock_snapshots(db, datetime(2025, 1, 10))
+    crud.create_stock_snapshots(db, datetime(2025, 2, 1))
+
+    add_movement(db, "entrada", product_id, 20, datetime(2025, 1, 8))
+
+    snapshots = {
+        snapshot.snapshot_at: snapshot.quantity
+        for snapshot in db.query(StockSnapshotModel).filter(StockSnapshotModel.product_id == product_id)
+    }
+    assert snapshots == {datetime(2025, 1, 10): 27, datetime(2025, 2, 1): 32}
+    assert crud.calculate_stock(db, product_id, at=datetime(2025, 1, 7, 23)).current_stock == 7
+    assert crud.calculate_stock(db, product_id, at=datetime(2025, 1, 20)).current_stock == 32
+    assert crud.verify_stock_balances(db) == []
@@ -0,0 +1,58 @@
+"""
+Cabeçalho Idempotency-Key na inclusão de movimentações: a repetição recebe a resposta gravada, a
+mesma chave com outro corpo é recusada, e uma inclusão recusada libera a chave.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def product_id(db):
+    return client.post("/products/", json={"name": "Caneta", "price": 2.5}).json()["id"]
+
+
+def movement(product_id, movement_type="entrada", quantity=5):
+    return {"type": movement_type, "movement_date": "2025-01-10T00:00:00", "items": [{"product_id": product_id, "quantity": quantity}]}
+
+
+def post_movement(body, key):
+    return client.post("/stock-movements/", json=body, headers={"Idempotency-Key": key})
+
+
+def stock(product_id):
+    return client.get(f"/products/{product_id}/stock").json()["current_stock"]
+
+
+def test_same_key_replays_response(product_id):
+    first = post_movement(movement(product_id), "key-1")
+    second = post_movement(movement(product_id), "key-1")
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert stock(product_id) == 5
+    assert len(client.get("/stock-movements/").json()) == 1
+
+
+def test_same_key_with_other_body(product_id):
+    assert post_movement(movement(product_id), "key-1").status_code == 200
+
+    response = post_movement(movement(product_id, quantity=6), "key-1")
+
+    assert response.status_code == 422
+    assert stock(product_id) == 5
+
+
+def test_rejected_movement_releases_key(product_id):
+    body = movement(product_id, "saída", 3)
+    rejected = post_movement(body, "key-1")
+    assert rejected.status_code == 400
+
+    assert post_movement(movement(product_id), "key-2").status_code == 200
+    retry = post_movement(body, "key-1")
+
+    assert retry.status_code == 200
+    assert stock(product_id) == 2
@@ -0,0 +1,33 @@
+"""
+Planos de execução (EXPLAIN) das consultas que dependem dos índices criados pelas migrações:
+listagem de movimentações por data e busca de itens por produto.
+"""
+from datetime import datetime
+
+import crud
+import migrations
+
+MOVEMENT_DATE_INDEX = "ix_stock_movements_movement_date"
+ITEM_PRODUCT_INDEX = "ix_stock_movement_items_product_id_movement_id"
+
+
+def uses_index(plan, index):
+    return any(index in line for line in plan)
+
+
+def test_movement_list_by_date_uses_movement_date_index(db):
+    query = crud.stock_movements_query(
+        db, date_from=datetime(2025, 1, 1), date_to=datetime(2025, 2, 1), order_by="movement_date", limit=50
+    )
+    plan = migrations.explain_query(db, query)
+    assert uses_index(plan, MOVEMENT_DATE_INDEX), plan
+
+
+def test_movement_list_by_product_uses_item_product_index(db):
+    plan = migrations.explain_query(db, crud.stock_movements_query(db, product_id=1, limit=50))
+    assert uses_index(plan, ITEM_PRODUCT_INDEX), plan
+
+
+def test_stock_totals_use_item_product_index(db):
+    plan = migrations.explain_stock_totals(db)
+    assert uses_index(plan, ITEM_PRODUCT_INDEX), plan
@@ -0,0 +1,78 @@
+"""
+Ingestão em lote de movimentações (movement_ingest.ingest): retomada pelo checkpoint, lote com
+outro conteúdo e contagem das linhas recusadas.
+"""
+import json
+
+import pytest
+
+import crud
+import movement_ingest
+from schemas import ProductCreate
+
+
+def line(movement_type, product_id, quantity, day):
+    return json.dumps({
+        "type": movement_type,
+        "movement_date": f"2025-01-{day:02d}T00:00:00",
+        "items": [{"product_id": product_id, "quantity": quantity}],
+    })
+
+
+@pytest.fixture
+def product_id(db):
+    return crud.create_product(db, ProductCreate(name="Caneta", price=1)).id
+
+
+def test_resume_from_checkpoint(db, product_id, monkeypatch):
+    lines = [line("entrada", product_id, 1, day) for day in range(1, 11)]
+
+    # A primeira execução é interrompida depois do primeiro trecho
+    calls = []
+    ingest_chunk = crud.ingest_stock_movements
+
+    def interrupted(*args):
+        if calls:
+            raise RuntimeError("interrupted")
+        calls.append(args)
+        return ingest_chunk(*args)
+
+    monkeypatch.setattr(movement_ingest, "ingest_stock_movements", interrupted)
+    with pytest.raises(RuntimeError):
+        movement_ingest.ingest(lines, batch_id="lote", chunk_size=4)
+    assert crud.calculate_stock(db, product_id).current_stock == 4
+
+    monkeypatch.setattr(movement_ingest, "ingest_stock_movements", ingest_chunk)
+    report = movement_ingest.ingest(lines, batch_id="lote", chunk_size=4)
+
+    assert (report.skipped, report.applied, report.rejected) == (4, 6, 0)
+    assert crud.calculate_stock(db, product_id).current_stock == 10
+    # Uma nova execução do lote concluído não aplica nada
+    assert movement_ingest.ingest(lines, batch_id="lote").applied == 0
+    assert crud.calculate_stock(db, product_id).current_stock == 10
+
+
+def test_batch_with_different_file(db, product_id):
+    movement_ingest.ingest([line("entrada", product_id, 1, 1)], batch_id="lote")
+
+    with pytest.raises(ValueError, match="different file"):
+        movement_ingest.ingest([line("entrada", product_id, 2, 1)], batch_id="lote")
+    assert crud.calculate_stock(db, product_id).current_stock == 1
+
+
+def test_rejected_rows(db, product_id):
+    lines = [
+        line("entrada", product_id, 5, 1),
+        line("saída", product_id, 9, 2),
+        "{not json",
+        line("saída", 999, 1, 3),
+        line("saída", product_id, 5, 4),
+    ]
+
+    report = movement_ingest.ingest(lines)
+
+    assert (report.rows_received, report.invalid, report.applied, report.rejected) == (5, 1, 2, 2)
+    assert [error.row for error in report.errors] == [2, 3, 4]
+    assert report.errors[0].error == f"Not enough stock for product ID {product_id}. Available: 5, Requested: 9"
+    assert report.errors[2].error == "Product ID 999 not found"
+    assert crud.calculate_stock(db, product_id).current_stock == 0
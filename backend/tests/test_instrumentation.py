@@ -0,0 +1,21 @@
+"""
+Medição das consultas (database.instrument_engine): o início de cada comando é guardado na conexão
+até o seu fim, inclusive quando o comando falha.
+"""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import database
+
+
+def test_failed_statement_releases_start_time(db):
+    with database.engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing_table"))
+            conn.rollback()
+        conn.execute(text("SELECT 1"))
+
+        assert conn.info["query_start"] == []
@@ -0,0 +1,146 @@
+"""
+Exclusões e alterações de movimentações, nos dois modos do livro (STOCK_LEDGER_MODE): mutável e
+append-only, com estornos e lançamentos de correção.
+"""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import crud
+from main import app
+from models import StockMovementModel
+from schemas import ProductCreate, StockMovementWithItemsCreate
+
+client = TestClient(app)
+
+
+@pytest.fixture(params=["mutable", "append_only"])
+def ledger_mode(request, monkeypatch):
+    monkeypatch.setattr(crud, "STOCK_LEDGER_MODE", request.param)
+    return request.param
+
+
+@pytest.fixture
+def append_only(monkeypatch):
+    monkeypatch.setattr(crud, "STOCK_LEDGER_MODE", "append_only")
+
+
+def movement(movement_type, product_id, quantity, movement_date=datetime(2025, 1, 10)):
+    return StockMovementWithItemsCreate(
+        type=movement_type, movement_date=movement_date, items=[{"product_id": product_id, "quantity": quantity}],
+    )
+
+
+def current_stock(db, product_id):
+    return crud.calculate_stock(db, product_id).current_stock
+
+
+def test_update_to_exit_cannot_oversell(db, ledger_mode):
+    product_id = crud.create_product(db, ProductCreate(name="Caneta", price=1)).id
+    entry_id = crud.create_stock_movement(db, movement("entrada", product_id, 10)).id
+
+    with pytest.raises(HTTPException) as error:
+        crud.update_stock_movement(db, entry_id, movement("saída", product_id, 10))
+
+    assert error.value.status_code == 400
+    assert error.value.detail["details"] == [f"Not enough stock for product ID {product_id}. Available: 10, Requested: 20"]
+    assert current_stock(db, product_id) == 10
+    assert crud.verify_stock_balances(db) == []
+
+
+def test_delete_consumed_entry_cannot_oversell(db, ledger_mode):
+    product_id = crud.create_product(db, ProductCreate(name="Caneta", price=1)).id
+    entry_id = crud.create_stock_movement(db, movement("entrada", product_id, 10)).id
+    crud.create_stock_movement(db, movement("saída", product_id, 4))
+
+    with pytest.raises(HTTPException) as error:
+        crud.delete_stock_movement(db, entry_id)
+
+    assert error.value.status_code == 400
+    assert current_stock(db, product_id) == 6
+    # Depois de uma nova entrada, a exclusão é permitida
+    crud.create_stock_movement(db, movement("entrada", product_id, 4))
+    crud.delete_stock_movement(db, entry_id)
+    assert current_stock(db, product_id) == 0
+
+
+def test_reversal_of_reversed_movement(db, append_only):
+    product_id = crud.create_product(db, ProductCreate(name="Caneta", price=1)).id
+    entry_id = crud.create_stock_movement(db, movement("entrada", product_id, 10)).id
+
+    assert client.delete(f"/stock-movements/{entry_id}").status_code == 200
+    response = client.delete(f"/stock-movements/{entry_id}")
+
+    assert response.status_code == 409
+    assert response.json()["detail"] == f"Stock movement {entry_id} was already reversed"
+    reversal = db.query(StockMovementModel).filter(StockMovementModel.reverses_movement_id == entry_id).one()
+    assert client.delete(f"/stock-movements/{reversal.id}").status_code == 409
+    assert current_stock(db, product_id) == 0
+
+
+def test_update_writes_reversal_and_replacement(db, append_only):
+    product_id = crud.create_product(db, ProductCreate(name="Caneta", price=1)).id
+    entry_id = crud.create_stock_movement(db, movement("entrada", product_id, 10)).id
+
+    response = client.put(f"/stock-movements/{entry_id}", json={
+        "type": "entrada", "movement_date": "2025-02-01T00:00:00", "items": [],
+    })
+
+    assert response.status_code == 200
+    replacement = response.json()
+    assert replacement["id"] != entry_id
+    assert replacement["movement_date"] == "2025-02-01T00:00:00"
+    assert replacement["items"] == [{"product_id": product_id, "quantity": 10}]
+    rows = {row.id: row for row in db.query(StockMovementModel)}
+    assert len(rows) == 3
+    assert rows[replacement["id"]].replaces_movement_id == entry_id
+    assert rows[entry_id].type == "entrada" and rows[entry_id].movement_date == datetime(2025, 1, 10)
+    assert current_stock(db, product_id) == 10
+    assert crud.get_stocks_at(db, [product_id], datetime(2025, 1, 20)) == {product_id: 0}
+
+
+def test_corrections_chain(db, append_only):
+    product_id = crud.create_product(db, ProductCreate(name="Caneta", price=1)).id
+    entry_id = crud.create_stock_movement(db, movement("entrada", product_id, 10)).id
+    first = client.put(f"/stock-movements/{entry_id}", json={"type": "entrada", "movement_date": "2025-01-11T00:00:00", "items": []}).json()
+    second = client.put(f"/stock-movements/{first['id']}", json={"type": "entrada", "movement_date": "2025-01-12T00:00:00", "items": []}).json()
+
+    chain = client.get(f"/stock-movements/{entry_id}/corrections").json()
+
+    assert [(entry["type"], entry["reverses_movement_id"], entry["replaces_movement_id"]) for entry in chain] == [
+        ("entrada", None, None),
+        ("saída", entry_id, None),
+        ("entrada", None, entry_id),
+        ("saída", first["id"], None),
+        ("entrada", None, first["id"]),
+    ]
+    assert chain[-1]["id"] == second["id"]
+    assert client.get("/stock-movements/999/corrections").status_code == 404
+
+
+def test_compact_stock_ledger(db, append_only):
+    product_ids = [crud.create_product(db, ProductCreate(name=f"Produto {index}", price=1)).id for index in range(2)]
+    for day in range(1, 11):
+        crud.create_stock_movement(db, movement("entrada", product_ids[day % 2], day, datetime(2025, 1, day)))
+    for movement_id in (1, 2, 3):
+        crud.delete_stock_movement(db, movement_id)
+    crud.update_stock_movement(db, 4, movement("entrada", product_ids[0], 4, datetime(2025, 2, 1)))
+    crud.create_stock_movement(db, movement("saída", product_ids[1], 5, datetime(2025, 1, 20)))
+    points = [datetime(2025, 1, day) for day in (1, 3, 5, 8, 15, 31)] + [datetime(2025, 2, 1), datetime(2025, 3, 1)]
+    # Produtos sem movimentações até `at` não aparecem em get_stocks_at: saldo zero
+    def stocks_at(at):
+        stocks = crud.get_stocks_at(db, product_ids, at)
+        return [stocks.get(product_id, 0) for product_id in product_ids]
+
+    before = [stocks_at(at) for at in points]
+    movements = db.query(StockMovementModel).count()
+
+    snapshots, removed = crud.compact_stock_ledger(db, datetime(2025, 1, 15))
+
+    assert (snapshots, removed) == (2, 8)
+    assert db.query(StockMovementModel).count() == movements - removed
+    assert crud.verify_stock_balances(db) == []
+    assert [stocks_at(at) for at in points] == before
+    assert [current_stock(db, product_id) for product_id in product_ids] == before[-1]
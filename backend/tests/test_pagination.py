@@ -0,0 +1,98 @@
+"""
+Paginação por chave (keyset) das listagens: o cabeçalho X-Next-Cursor leva à próxima página, com os
+filtros aplicados, e um cursor malformado gera 400. Os dois caminhos de resposta (ORM e
+FAST_JSON_RESPONSES) devem listar as mesmas páginas.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import crud
+import router
+from main import app
+from schemas import ProductCreate, StockMovementWithItemsCreate
+
+client = TestClient(app)
+
+
+@pytest.fixture(params=[False, True], ids=["orm", "fast_json"])
+def fast_json(request, monkeypatch):
+    if request.param:
+        monkeypatch.setattr(router, "orjson", pytest.importorskip("orjson"), raising=False)
+    monkeypatch.setattr(router, "FAST_JSON_RESPONSES", request.param)
+
+
+@pytest.fixture
+def product_ids(db):
+    product_ids = [crud.create_product(db, ProductCreate(name=f"Produto {index}", price=1)).id for index in range(3)]
+    # Datas fora da ordem de inclusão, para que as ordenações por id e por data difiram
+    for index in range(30):
+        crud.create_stock_movement(db, StockMovementWithItemsCreate(
+            type="saída" if index % 5 == 4 else "entrada",
+            movement_date=datetime(2025, 1, 1) + timedelta(days=(index * 7) % 30),
+            items=[{"product_id": product_ids[index % 3], "quantity": 1}],
+        ))
+    return product_ids
+
+
+def all_pages(path, **params):
+    # Segue X-Next-Cursor até a última página; retorna as páginas
+    pages = []
+    cursor = None
+    while True:
+        response = client.get(path, params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+
+
+def test_movement_pages(product_ids, fast_json):
+    pages = all_pages("/stock-movements/", limit=7)
+    movements = [movement for page in pages for movement in page]
+
+    assert [len(page) for page in pages] == [7, 7, 7, 7, 2]
+    assert [movement["id"] for movement in movements] == list(range(1, 31))
+
+
+def test_movement_pages_by_date(product_ids, fast_json):
+    movements = [movement for page in all_pages("/stock-movements/", order_by="movement_date", limit=4) for movement in page]
+
+    assert len(movements) == 30
+    assert [(movement["movement_date"], movement["id"]) for movement in movements] == \
+        sorted((movement["movement_date"], movement["id"]) for movement in movements)
+
+
+@pytest.mark.parametrize("order_by", ["id", "movement_date"])
+def test_movement_filters(product_ids, fast_json, order_by):
+    params = {
+        "type": "entrada", "product_id": product_ids[1],
+        "date_from": "2025-01-05T00:00:00", "date_to": "2025-01-25T00:00:00",
+    }
+    movements = [movement for page in all_pages("/stock-movements/", order_by=order_by, limit=2, **params) for movement in page]
+    expected = client.get("/stock-movements/", params={"limit": 1000}).json()
+    expected = [
+        movement for movement in expected
+        if movement["type"] == "entrada" and movement["items"][0]["product_id"] == product_ids[1]
+        and "2025-01-05" <= movement["movement_date"] <= "2025-01-25T00:00:00"
+    ]
+
+    assert expected
+    assert sorted(movement["id"] for movement in movements) == [movement["id"] for movement in expected]
+
+
+@pytest.mark.parametrize("order_by, cursor", [("id", "abc"), ("movement_date", "12"), ("movement_date", "not-a-date|3")])
+def test_malformed_cursor(product_ids, order_by, cursor):
+    response = client.get("/stock-movements/", params={"order_by": order_by, "cursor": cursor})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_product_pages(product_ids, fast_json):
+    pages = all_pages("/products/", limit=2)
+
+    assert [[product["id"] for product in page] for page in pages] == [product_ids[:2], product_ids[2:]]
+    assert client.get("/products/", params={"cursor": "abc"}).status_code == 422
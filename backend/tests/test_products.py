@@ -0,0 +1,29 @@
+"""
+SKU duplicado na inclusão e na alteração de produtos: 409, sem deixar a sessão inutilizada.
+"""
+import pytest
+from fastapi import HTTPException
+
+import crud
+from schemas import ProductCreate, ProductUpdate
+
+
+def test_create_product_with_existing_sku(db):
+    crud.create_product(db, ProductCreate(sku="A1", name="A", price=1))
+
+    with pytest.raises(HTTPException) as error:
+        crud.create_product(db, ProductCreate(sku="A1", name="B", price=2))
+
+    assert error.value.status_code == 409
+    assert [product.name for product in crud.get_products(db)] == ["A"]
+
+
+def test_update_product_to_existing_sku(db):
+    crud.create_product(db, ProductCreate(sku="A1", name="A", price=1))
+    other = crud.create_product(db, ProductCreate(sku="B1", name="B", price=2))
+
+    with pytest.raises(HTTPException) as error:
+        crud.update_product(db, other.id, ProductUpdate(sku="A1"))
+
+    assert error.value.status_code == 409
+    assert crud.update_product(db, other.id, ProductUpdate(name="B2")).sku == "B1"
@@ -0,0 +1,63 @@
+"""
+Número de consultas das listagens de movimentações: os itens vêm em uma única consulta extra
+(selectinload), qualquer que seja a quantidade de movimentações e de itens. Um N+1 faz estes testes falharem.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import crud
+from conftest import counting_queries
+from schemas import ProductCreate, StockMovementWithItemsCreate
+
+
+def seed_movements(db, movements, items_per_movement):
+    product_ids = [
+        crud.create_product(db, ProductCreate(name=f"Product {index}", price=1)).id
+        for index in range(items_per_movement)
+    ]
+    for index in range(movements):
+        crud.create_stock_movement(db, StockMovementWithItemsCreate(
+            type="entrada",
+            movement_date=datetime(2025, 1, 1) + timedelta(hours=index),
+            items=[{"product_id": product_id, "quantity": 1} for product_id in product_ids],
+        ))
+    # Sem objetos carregados na sessão, como em uma requisição nova
+    db.expunge_all()
+
+
+@pytest.mark.parametrize("movements, items_per_movement", [(1, 1), (20, 1), (20, 10)])
+def test_stock_movements_page_queries(db, movements, items_per_movement):
+    seed_movements(db, movements, items_per_movement)
+
+    with counting_queries() as queries:
+        page = crud.get_stock_movements(db, limit=50)
+        items = [(item.product_id, item.quantity) for movement in page for item in movement.items]
+
+    assert len(page) == movements
+    assert len(items) == movements * items_per_movement
+    assert queries.count == 2, queries.statements
+
+
+@pytest.mark.parametrize("order_by", ["id", "movement_date"])
+def test_stock_movements_filtered_page_queries(db, order_by):
+    seed_movements(db, 20, 5)
+
+    with counting_queries() as queries:
+        page = crud.get_stock_movements(db, movement_type="entrada", date_from=datetime(2025, 1, 1), order_by=order_by, limit=10)
+        [item.quantity for movement in page for item in movement.items]
+
+    assert len(page) == 10
+    assert queries.count == 2, queries.statements
+
+
+@pytest.mark.parametrize("items_per_movement", [1, 10])
+def test_stock_movement_queries(db, items_per_movement):
+    seed_movements(db, 3, items_per_movement)
+
+    with counting_queries() as queries:
+        movement = crud.get_stock_movement(db, 2)
+        items = [(item.product_id, item.quantity) for item in movement.items]
+
+    assert len(items) == items_per_movement
+    assert queries.count == 2, queries.statements
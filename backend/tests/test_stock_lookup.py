@@ -0,0 +1,49 @@
+"""
+Consulta de estoque de vários produtos: GET /stock/ e POST /products/stock:batch são a mesma
+consulta (mesmos estoques, cabeçalhos de cache e limites de IDs), com os IDs na URL ou no corpo.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from schemas import STOCK_BATCH_MAX_IDS
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def product_ids(db):
+    product_ids = [client.post("/products/", json={"name": f"Produto {index}", "price": 1}).json()["id"] for index in range(2)]
+    client.post("/stock-movements/", json={
+        "type": "entrada", "movement_date": "2025-01-01T00:00:00",
+        "items": [{"product_id": product_id, "quantity": 3} for product_id in product_ids],
+    })
+    return product_ids
+
+
+def test_same_stocks_and_headers(product_ids):
+    ids = [product_ids[1], 999, product_ids[0]]
+    listed = client.get("/stock/", params={"product_ids": ids})
+    batch = client.post("/products/stock:batch", json={"product_ids": ids})
+
+    assert listed.status_code == batch.status_code == 200
+    assert batch.json() == {"stocks": listed.json(), "missing": [999]}
+    assert [stock["current_stock"] for stock in listed.json()] == [3, 3]
+    for header in ("etag", "last-modified", "cache-control"):
+        assert batch.headers[header] == listed.headers[header]
+
+
+def test_same_as_of_stocks(product_ids):
+    params = {"product_ids": product_ids, "at": "2024-12-31T00:00:00"}
+    listed = client.get("/stock/", params=params).json()
+
+    assert client.post("/products/stock:batch", json=params).json()["stocks"] == listed
+    assert [stock["current_stock"] for stock in listed] == [0, 0]
+
+
+def test_same_id_limits(db):
+    assert client.post("/products/stock:batch", json={"product_ids": []}).status_code == 422
+    assert client.get("/stock/").status_code == 422
+    # Na URL, o limite de IDs costuma ser alcançado antes pelo tamanho da query string
+    too_many = list(range(1, STOCK_BATCH_MAX_IDS + 2))
+    assert client.post("/products/stock:batch", json={"product_ids": too_many}).status_code == 422
@@ -1,6 +1,10 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime  # Adicionando a importação do datetime
 
 # Configuração da página
@@ -10,6 +14,92 @@ st.title("Gerenciamento de Produtos e Estoque")
 # URL do backend (ajuste conforme necessário)
 BASE_URL = "http://backend:8000"
 
+# Validade, em segundos, das consultas guardadas em cache entre as reexecuções do script; as
+# alterações feitas por esta interface descartam o cache na hora
+CACHE_TTL = 30
+REQUEST_TIMEOUT = 30
+PAGE_SIZES = [25, 50, 100, 500]  # opções de linhas por página das listagens (limit das rotas paginadas)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Sessão HTTP única para o processo do Streamlit: reaproveita as conexões com o backend (keep-alive)
+# em vez de abrir uma conexão por requisição
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Consultas ao backend com cache por CACHE_TTL. Respostas com erro levantam requests.HTTPError e não
+# entram no cache; quem chama mostra o erro com show_response_message(error.response)
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def fetch_json(path, params=None):
+    response = get_session().get(f"{BASE_URL}{path}", params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def fetch_stocks(product_ids):
+    # Estoque de vários produtos em uma única requisição (POST /products/stock:batch)
+    response = get_session().post(
+        f"{BASE_URL}/products/stock:batch", json={"product_ids": list(product_ids)}, timeout=REQUEST_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()["stocks"]
+
+def _get_page(session, path, params):
+    response = session.get(f"{BASE_URL}{path}", params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json(), response.headers.get(NEXT_CURSOR_HEADER)
+
+class PageCache:
+    """
+    Páginas das listagens paginadas por cursor, guardadas por CACHE_TTL e compartilhadas pelo processo
+    do Streamlit. Cada página é pedida em uma thread do executor, o que permite pedir a próxima página
+    em segundo plano (prefetch) enquanto a atual é exibida; get espera a página se ela ainda estiver
+    sendo carregada. Páginas com erro não ficam guardadas.
+    """
+    def __init__(self):
+        self._pages = {}  # (path, parâmetros) -> (expira em, Future com (linhas, próximo cursor))
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4)
+
+    def _load(self, path, params):
+        key = (path, tuple(sorted(params.items())))
+        now = time.monotonic()
+        with self._lock:
+            expires_at, future = self._pages.get(key, (0, None))
+            if future is None or expires_at <= now or (future.done() and future.exception() is not None):
+                # Descarta as páginas vencidas antes de guardar a nova
+                self._pages = {page_key: page for page_key, page in self._pages.items() if page[0] > now}
+                future = self._executor.submit(_get_page, get_session(), path, params)
+                self._pages[key] = (now + CACHE_TTL, future)
+        return future
+
+    def get(self, path, params):
+        return self._load(path, params).result()
+
+    def prefetch(self, path, params):
+        self._load(path, params)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+@st.cache_resource
+def get_page_cache():
+    return PageCache()
+
+# Alterações (POST, PUT, DELETE): quando bem-sucedidas, descartam as consultas em cache
+def send(method, path, **kwargs):
+    response = get_session().request(method, f"{BASE_URL}{path}", timeout=REQUEST_TIMEOUT, **kwargs)
+    if response.ok:
+        fetch_json.clear()
+        fetch_stocks.clear()
+        get_page_cache().clear()
+    return response
+
 # Função para exibir mensagens de resposta
 def show_response_message(response):
     if response.status_code == 200:
@@ -26,6 +116,74 @@ def show_response_message(response):
         except ValueError:
             st.error("Erro desconhecido. Não foi possível decodificar a resposta.")
 
+def paged_grid(key, path, filters, page_size, to_frame, empty_message):
+    """
+    Exibe uma página da listagem `path` em um st.dataframe, com botões de página anterior e próxima.
+    Só a página atual é pedida ao backend (parâmetros `filters`, `limit` e `cursor`); a próxima é
+    carregada em segundo plano. Os cursores das páginas visitadas ficam em st.session_state, e a
+    navegação volta à primeira página quando os filtros ou o tamanho da página mudam.
+    """
+    params = {name: value for name, value in filters.items() if value is not None and value != ""}
+    params["limit"] = page_size
+    state = st.session_state.setdefault(f"{key}_pages", {"params": None, "cursors": [None]})
+    if state["params"] != params:
+        state["params"] = params
+        state["cursors"] = [None]
+
+    cursor = state["cursors"][-1]
+    page_cache = get_page_cache()
+    try:
+        rows, next_cursor = page_cache.get(path, {**params, "cursor": cursor} if cursor else params)
+    except requests.HTTPError as error:
+        show_response_message(error.response)
+        return
+    if next_cursor:
+        page_cache.prefetch(path, {**params, "cursor": next_cursor})
+
+    try:
+        df = to_frame(rows)
+    except requests.HTTPError as error:
+        show_response_message(error.response)
+        return
+    if df.empty:
+        st.write(empty_message)
+    else:
+        st.dataframe(df, use_container_width=True, hide_index=True)
+
+    previous_column, page_column, next_column = st.columns([1, 4, 1])
+    if previous_column.button("Anterior", key=f"{key}_previous", disabled=len(state["cursors"]) == 1):
+        state["cursors"].pop()
+        st.rerun()
+    page_column.write(f"Página {len(state['cursors'])}")
+    if next_column.button("Próxima", key=f"{key}_next", disabled=not next_cursor):
+        state["cursors"].append(next_cursor)
+        st.rerun()
+
+def products_frame(products, with_stock):
+    df = pd.DataFrame(products, columns=["id", "sku", "name", "description", "price", "created_at"])
+    if with_stock and products:
+        # Estoque da página inteira em uma única consulta em lote
+        stocks = fetch_stocks(tuple(df["id"]))
+        df["current_stock"] = df["id"].map({stock["product_id"]: stock["current_stock"] for stock in stocks})
+    return df
+
+def movement_items_frame(movements):
+    # Uma linha por item, com os dados da movimentação repetidos; movimentações sem itens ocupam uma linha vazia
+    return pd.DataFrame(
+        [
+            {
+                "movement_id": movement["id"],
+                "type": movement["type"],
+                "movement_date": movement["movement_date"],
+                "product_id": item.get("product_id"),
+                "quantity": item.get("quantity"),
+            }
+            for movement in movements
+            for item in movement["items"] or [{}]
+        ],
+        columns=["movement_id", "type", "movement_date", "product_id", "quantity"],
+    )
+
 # Adicionar Produto
 with st.expander("Adicionar um Novo Produto"):
     with st.form("new_product"):
@@ -35,8 +193,9 @@ with st.expander("Adicionar um Novo Produto"):
         submit_button = st.form_submit_button("Adicionar Produto")
 
         if submit_button:
-            response = requests.post(
-                f"{BASE_URL}/products/",
+            response = send(
+                "post",
+                "/products/",
                 json={
                     "name": name,
                     "description": description,
@@ -51,47 +210,40 @@ with st.expander("Adicionar um Novo Produto"):
                 st.session_state.description = ''
                 st.session_state.price = 0.01
 
-# Visualizar Produtos
+# Visualizar Produtos: uma página por vez, filtrada pelo nome no backend; com "Incluir estoque", o
+# estoque da página vem de uma única consulta em lote, em vez de uma consulta por produto
 with st.expander("Visualizar Produtos"):
-    if st.button("Exibir Todos os Produtos"):
-        response = requests.get(f"{BASE_URL}/products/")
-        if response.status_code == 200:
-            products = response.json()
-            df = pd.DataFrame(products)
-
-            # Verifique se o DataFrame não está vazio
-            if not df.empty:
-                # Exibindo produtos
-                df = df[[
-                    "id", "name", "description", "price", "created_at"
-                ]]
-                st.write(df.to_html(index=False), unsafe_allow_html=True)
-            else:
-                st.write("Nenhum produto encontrado.")
-        else:
-            show_response_message(response)
+    if st.toggle("Exibir Produtos", key="show_products"):
+        name_column, size_column, stock_column = st.columns([3, 1, 1])
+        name_filter = name_column.text_input("Filtrar por nome", key="products_name")
+        page_size = size_column.selectbox("Linhas por página", PAGE_SIZES, index=2, key="products_page_size")
+        with_stock = stock_column.checkbox("Incluir estoque", value=True, key="products_with_stock")
+        paged_grid(
+            "products", "/products/", {"name": name_filter.strip()}, page_size,
+            lambda products: products_frame(products, with_stock), "Nenhum produto encontrado.",
+        )
 
 # Obter Detalhes de um Produto
 with st.expander("Obter Detalhes de um Produto"):
     get_id = st.number_input("ID do Produto", min_value=1, format="%d")
     if st.button("Buscar Produto"):
-        response = requests.get(f"{BASE_URL}/products/{get_id}")
-        if response.status_code == 200:
-            product = response.json()
+        try:
+            product = fetch_json(f"/products/{get_id}")
+        except requests.HTTPError as error:
+            show_response_message(error.response)
+        else:
             df = pd.DataFrame([product])
 
             df = df[[
                 "id", "name", "description", "price", "created_at"
             ]]
-            st.write(df.to_html(index=False), unsafe_allow_html=True)
-        else:
-            show_response_message(response)
+            st.dataframe(df, use_container_width=True, hide_index=True)
 
 # Deletar Produto
 with st.expander("Deletar Produto"):
     delete_id = st.number_input("ID do Produto para Deletar", min_value=1, format="%d")
     if st.button("Deletar Produto"):
-        response = requests.delete(f"{BASE_URL}/products/{delete_id}")
+        response = send("delete", f"/products/{delete_id}")
         show_response_message(response)
 
 # Atualizar Produto
@@ -118,9 +270,7 @@ with st.expander("Atualizar Produto"):
                 update_data["price"] = new_price
 
             if update_data:
-                response = requests.put(
-                    f"{BASE_URL}/products/{update_id}", json=update_data
-                )
+                response = send("put", f"/products/{update_id}", json=update_data)
                 show_response_message(response)
 
                 # Limpar os campos após atualização bem-sucedida
@@ -171,10 +321,7 @@ with st.expander("Adicionar Movimentação de Estoque"):
             }
 
             # Enviar os dados para a API
-            response = requests.post(
-                f"{BASE_URL}/stock-movements/",
-                json=movement_data
-            )
+            response = send("post", "/stock-movements/", json=movement_data)
             show_response_message(response)
 
             # Limpar a lista de itens após o envio bem-sucedido
@@ -183,29 +330,38 @@ with st.expander("Adicionar Movimentação de Estoque"):
         else:
             st.error("Por favor, adicione pelo menos um item à movimentação.")
 
-# Visualizar Movimentações de Estoque
+# Visualizar Movimentações de Estoque: uma página de movimentações por vez, filtrada no backend,
+# com uma linha por item
 with st.expander("Visualizar Movimentações de Estoque"):
-    if st.button("Exibir Movimentações de Estoque"):
-        response = requests.get(f"{BASE_URL}/stock-movements/")
-        if response.status_code == 200:
-            movements = response.json()
-            df = pd.DataFrame(movements)
-
-            # Verifique se o DataFrame não está vazio
-            if not df.empty:
-                st.write(df.to_html(index=False), unsafe_allow_html=True)
-            else:
-                st.write("Nenhuma movimentação de estoque encontrada.")
-        else:
-            show_response_message(response)
+    if st.toggle("Exibir Movimentações de Estoque", key="show_movements"):
+        type_column, from_column, to_column, product_column, size_column = st.columns(5)
+        type_filter = type_column.selectbox("Tipo", ["todos", "entrada", "saída"], key="movements_type")
+        date_from = from_column.date_input("De", value=None, key="movements_date_from")
+        date_to = to_column.date_input("Até", value=None, key="movements_date_to")
+        product_filter = product_column.number_input("ID do Produto", min_value=1, value=None, step=1, key="movements_product")
+        page_size = size_column.selectbox("Linhas por página", PAGE_SIZES, index=2, key="movements_page_size")
+        paged_grid(
+            "movements",
+            "/stock-movements/",
+            {
+                "type": None if type_filter == "todos" else type_filter,
+                "date_from": date_from.isoformat() if date_from else None,
+                # Até o fim do dia escolhido
+                "date_to": datetime.combine(date_to, datetime.max.time()).isoformat() if date_to else None,
+                "product_id": product_filter,
+            },
+            page_size,
+            movement_items_frame,
+            "Nenhuma movimentação de estoque encontrada.",
+        )
 
 # Consultar o Estoque de um Produto
 with st.expander("Consultar Estoque de um Produto"):
     product_id = st.number_input("ID do Produto para Ver Estoque", min_value=1)
     if st.button("Ver Estoque"):
-        response = requests.get(f"{BASE_URL}/products/{product_id}/stock")
-        if response.status_code == 200:
-            stock = response.json()
-            st.write(stock)
+        try:
+            stock = fetch_json(f"/products/{product_id}/stock")
+        except requests.HTTPError as error:
+            show_response_message(error.response)
         else:
-            show_response_message(response)
+            st.write(stock)